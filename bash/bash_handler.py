@@ -1,7 +1,6 @@
 
 import logging
 
-import bash.repository.commands as commands_rep
 from dependencies.cli.cli import Cli, CmdLineError
 from dependencies.cli.aux_classes import Command, Flag
 from dependencies.utils.decorators import timer
@@ -9,11 +8,31 @@ from dependencies.utils.decorators import timer
 # --------------------------- BASH HANDLER ---------------------------
 # --------------------------------------------------------------------
 # Define todos los comandos que va a tener el programa y ejecuta las
-# ordenes que introduzca el usuario por terminal
+# ordenes que introduzca el usuario por terminal. Las funciones de los
+# comandos (bash/repository/commands.py) y todo lo que necesitan solo
+# se importan al ejecutar la orden, no para procesar la linea de
+# comandos o mostrar la ayuda
 # --------------------------------------------------------------------
 
-# En este diccionario se asocia a cada comando una funcion a ejecutar
-_commands = {}
+# En este diccionario se asocia a cada comando el nombre de la funcion
+# de bash/repository/commands.py que se ejecuta
+_commands = {
+    "crear": "crear", "arrancar": "arrancar", "parar": "parar",
+    "destruir": "destruir", "pausar": "pausar", "añadir": "añadir",
+    "eliminar": "eliminar", "show": "show", "term": "term",
+    "migrar": "migrar"
+}
+# Numero maximo de hilos que se pueden pedir con la opcion -j
+MAX_WORKERS = 32
+# Flag que muestra el tiempo de importacion de los modulos
+PROFILE_FLAG = "--startup-profile"
+# Flag que arranca el demonio (ver bash/daemon.py)
+DAEMON_FLAG = "--daemon"
+# Flag que ejecuta las ordenes de un fichero (o de la entrada estandar)
+BATCH_FLAG = "--batch"
+# Comandos que reciben una lista de contenedores. Si en un fichero de
+# ordenes hay varios seguidos se ejecutan en una sola operacion
+_fleet_commands = ("arrancar", "parar", "pausar", "eliminar")
 # --------------------------------------------------------------------
 @timer
 def execute(args:dict):
@@ -24,13 +43,67 @@ def execute(args:dict):
         args (dict): Linea de comandos introducida por el usuario 
             ya validada, es decir, debe ser correcta
     """
-    for cmd_name, cmd in _commands.items():
+    import bash.repository.commands as commands_rep
+    for cmd_name, func_name in _commands.items():
         if cmd_name in args["cmd"]:
             principal = args.pop("cmd").pop(cmd_name)
             secundary = args
+            cmd = getattr(commands_rep, func_name)
             cmd(*principal, **secundary)
             break
-        
+
+def parse_batch(cli:Cli, lines:list, flags:list=[]) -> list:
+    """Procesa las ordenes de un fichero (una por linea, igual que se
+    introducirian por terminal pero sin el nombre del programa). Se
+    ignoran las lineas vacias y lo que vaya detras de '#'. Las ordenes
+    seguidas de un mismo comando de _fleet_commands (con las mismas
+    opciones y flags) se juntan en una sola
+
+    Args:
+        cli (Cli): Cli con la que se valida cada orden
+        lines (list): Lineas del fichero
+        flags (list, optional): Flags que se añaden a todas las ordenes
+
+    Raises:
+        CmdLineError: Si alguna orden o sus parametros (p.ej el numero
+            de servidores) no son correctos (no se ejecuta ninguna)
+
+    Returns:
+        list: Ordenes ya validadas (como las devuelve la cli)
+    """
+    import shlex
+    batch = []
+    for number, line in enumerate(lines, start=1):
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as err:
+            raise CmdLineError(f"Linea {number}: {err}")
+        if len(args) == 0:
+            continue
+        if "-h" in args or BATCH_FLAG in args:
+            err_msg = (f"Linea {number}: '-h' y '{BATCH_FLAG}' no se " +
+                                            "admiten dentro de un fichero")
+            raise CmdLineError(err_msg)
+        for flag in flags:
+            if flag not in args:
+                args.append(flag)
+        try:
+            processed = cli.process_cmdline([BATCH_FLAG] + args)
+        except CmdLineError as err:
+            # El mensaje ya incluye como acceder a la ayuda
+            raise CmdLineError(f"Linea {number}: {err}", _help=False)
+        if len(batch) > 0 and _mergeable(batch[-1], processed):
+            last_names = list(batch[-1]["cmd"].values())[0]
+            names = list(processed["cmd"].values())[0]
+            # Sin nombres el comando se aplica a todos los contenedores
+            if len(last_names) == 0 or len(names) == 0:
+                last_names.clear()
+            else:
+                last_names.extend(names)
+            continue
+        batch.append(processed)
+    return batch
+
 # --------------------------------------------------------------------
 def config_cli() -> Cli:
     """Se definen todos los argumentos que podra recibir el programa 
@@ -40,20 +113,20 @@ def config_cli() -> Cli:
     Returns:
        Cli: Devuelve la cli configurada con los comandos del programa
     """
-    global _commands
     cli = Cli()
     # Arguments
     cmd_name = "crear"
     msg = (
-        "<void or integer between(1-5)> --> " + 
+        "<void or positive integer> --> " + 
         "deploys a server platform\n           with the number " +
         "of servers especified (if void, 2 servers are created). It\n " + 
         "          also initializes a load balancer that acts as a bridge " +
         "between the servers\n           and the clients. Everything is " +
-        "connected by 2 virtual bridges"
+        "connected by virtual bridges (the\n           servers are " +
+        "spread across as many bridges as needed)"
     )
-    crear = Command(cmd_name, description=msg, extra_arg=True, 
-                                choices=[1,2,3,4,5], default=2)
+    crear = Command(cmd_name, description=msg, extra_arg=True, default=2,
+                                                    check=_positive)
     msg = ("<server_names> allows to specify the name of the servers, " + 
            "\n                      by default 's_' is given to each server")
     crear.add_option("--name", description=msg, extra_arg=True, 
@@ -67,57 +140,58 @@ def config_cli() -> Cli:
     crear.add_option("--climage", description=msg, extra_arg=True, mandatory=True)
     msg = "<alias or fingerprint> allows to specify the image of the client"
     crear.add_option("--lbimage", description=msg, extra_arg=True, mandatory=True)
+    _add_workers_option(crear)
     cli.add_command(crear)
-    _commands[cmd_name] = commands_rep.crear
     
     cmd_name = "arrancar"
     msg = ("<void or container_names> runs the containers specified, " +
            "if void\n           all containers are runned")
     arrancar = Command(cmd_name, description=msg, extra_arg=True, multi=True)
+    _add_workers_option(arrancar)
     cli.add_command(arrancar)
-    _commands[cmd_name] = commands_rep.arrancar
     
     cmd_name = "parar"
     msg = ("<void or container_names> stops the containers currently " +
           "running,\n           if void all containers are stopped")
     parar = Command(cmd_name, description=msg, extra_arg=True, multi=True)
+    _add_workers_option(parar)
     cli.add_command(parar)
-    _commands[cmd_name] = commands_rep.parar
     
     cmd_name = "destruir"
     msg = ("deletes every component of the platform created")
     destruir = Command(cmd_name, description=msg)
+    _add_workers_option(destruir)
     cli.add_command(destruir)
-    _commands[cmd_name] = commands_rep.destruir
     
     # Other functionalities
     cmd_name = "pausar"
     msg = ("<void or container_names> pauses the containers currently " +
           "running,\n           if void all containers are stopped")
     pausar = Command(cmd_name, description=msg, extra_arg=True, multi=True)
+    _add_workers_option(pausar)
     cli.add_command(pausar)
-    _commands[cmd_name] = commands_rep.pausar
 
     cmd_name = "añadir"
-    msg = ("<integer between(1-5)> adds the number of servers specified " +
-           " (the\n           program can't surpass 5 servers)")
+    msg = ("<positive integer> adds the number of servers specified " +
+           " (the\n           maximum number of servers is set in " +
+           "program/machines.py)")
     añadir = Command(cmd_name, description=msg, extra_arg=True, 
-                                choices=[1,2,3,4,5], mandatory=True)
+                                    mandatory=True, check=_positive)
     msg = ("<server_names> allows to specify the name of the servers, " + 
            "\n                      by default 's_' is given to each server")
     añadir.add_option("--name", description=msg, extra_arg=True, 
                                         multi=True, mandatory=True)
     msg ="<alias or fingerprint> allows to specify the image of the servers"
     añadir.add_option("--simage", description=msg, extra_arg=True, mandatory=True)
+    _add_workers_option(añadir)
     cli.add_command(añadir)
-    _commands[cmd_name] = commands_rep.añadir
     
     cmd_name = "eliminar"
     msg = ("<void or server_names> deletes the servers specified, if void " +
           "\n           all servers are deleted")
     eliminar = Command(cmd_name, description=msg, extra_arg=True,  multi=True)
+    _add_workers_option(eliminar)
     cli.add_command(eliminar)
-    _commands[cmd_name] = commands_rep.eliminar
     
     cmd_name = "show"
     msg = ("<diagram, state or files> shows information about the program. " + 
@@ -129,14 +203,20 @@ def config_cli() -> Cli:
     show = Command(cmd_name, description=msg, extra_arg=True, 
                             mandatory=True, choices=["diagram", "state", "files"])
     cli.add_command(show)
-    _commands[cmd_name] = commands_rep.show
     
     cmd_name = "term"
     msg = ("<void or container_names> opens the terminal of the containers " + 
            "\n           specified or all of them if no name is given")
     term = Command(cmd_name, description=msg, extra_arg=True, multi=True)
     cli.add_command(term)
-    _commands[cmd_name] = commands_rep.term
+    
+    cmd_name = "migrar"
+    msg = ("<pickle or sqlite> moves the register of the program to the " +
+           "backend\n           specified ('pickle' files or a 'sqlite' " +
+           "database)")
+    migrar = Command(cmd_name, description=msg, extra_arg=True,
+                            mandatory=True, choices=["pickle", "sqlite"])
+    cli.add_command(migrar)
     
     #Flags/Options
     msg = "shows information about every process that is being executed"
@@ -158,5 +238,58 @@ def config_cli() -> Cli:
     msg = "launches the container"
     launch = Flag("-l", description=msg)
     cli.add_flag(launch)
+    msg = ("talks to LXD through its REST API (unix socket) instead of " +
+           "running\n           the lxc command for every operation")
+    rest = Flag("-r", description=msg)
+    cli.add_flag(rest)
+    msg = ("creates the servers as copies of a template container that " +
+           "is\n           built only once per image (golden image) " +
+           "instead of initializing\n           each one from the image")
+    template = Flag("-g", description=msg)
+    cli.add_flag(template)
+    msg = ("checks again the external dependencies of the program " +
+           "instead of\n           using the result saved from a " +
+           "previous execution")
+    refresh = Flag("-e", description=msg)
+    cli.add_flag(refresh)
+    msg = ("runs the command and shows how long it took to import " +
+           "each module\n           of the program (python -X importtime)")
+    profile = Flag(PROFILE_FLAG, description=msg)
+    cli.add_flag(profile)
+    msg = ("keeps the program running and executes the commands sent " +
+           "from other\n           terminals (in the same folder), " +
+           "which then start in a few\n           milliseconds. Stop " +
+           "it with Ctrl+C")
+    serve = Flag(DAEMON_FLAG, description=msg)
+    cli.add_flag(serve)
+    msg = ("<file> (flag followed by a file) executes the commands of " +
+           "the file,\n           one per line, in a single run (from " +
+           "the standard input if no\n           file is given). " +
+           "Consecutive arrancar, parar, pausar or eliminar\n           " +
+           "commands are executed together")
+    batch = Flag(BATCH_FLAG, description=msg)
+    cli.add_flag(batch)
     return cli
+
+def _add_workers_option(cmd:Command):
+    """Añade a un comando la opcion -j, que permite operar sobre
+    varios contenedores a la vez"""
+    msg = (f"<integer between(1-{MAX_WORKERS})> number of containers " +
+           "that are\n                      processed at the same time " +
+           "(1 by default)")
+    cmd.add_option("-j", description=msg, extra_arg=True, mandatory=True,
+                                choices=list(range(1, MAX_WORKERS + 1)))
+
+def _positive(param:any) -> bool:
+    """Indica si el parametro de un comando es un entero positivo (el
+    numero de servidores)"""
+    return type(param) == int and param > 0
+
+def _mergeable(previous:dict, current:dict) -> bool:
+    """Indica si dos ordenes de un fichero se pueden ejecutar juntas"""
+    cmd_name = list(current["cmd"])[0]
+    return (cmd_name in _fleet_commands and
+            list(previous["cmd"]) == [cmd_name] and
+            previous["options"] == current["options"] and
+            sorted(previous["flags"]) == sorted(current["flags"]))
 # --------------------------------------------------------------------
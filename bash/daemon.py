@@ -0,0 +1,192 @@
+
+import os
+import sys
+import json
+import logging
+import threading
+from contextlib import suppress
+
+# ------------------------------ DEMONIO -----------------------------
+# --------------------------------------------------------------------
+# Permite dejar el programa arrancado (serve) atendiendo las ordenes
+# que le llegan por un socket unix, de forma que no hay que volver a
+# importar los modulos, configurar la cli o cargar el registro en
+# cada orden. pfinal1.py actua entonces como un cliente (forward) que
+# solo envia la linea de comandos y muestra lo que devuelve el
+# demonio. Las ordenes se ejecutan de una en una y mientras tanto la
+# entrada y salidas estandar del demonio (tambien las de los procesos
+# que lanza, p.ej 'lxc list') son las de la conexion con el cliente,
+# asi que las confirmaciones (input) siguen funcionando igual. La
+# salida de errores llega al cliente junto con la salida estandar
+# --------------------------------------------------------------------
+
+# Ruta del socket (relativa, ya que el registro tambien lo es y el
+# cliente debe ejecutarse en la misma carpeta que el demonio)
+SOCKET_PATH = ".daemon.sock"
+daemon_logger = logging.getLogger(__name__)
+# --------------------------------------------------------------------
+def serve(run):
+    """Atiende las ordenes de los clientes hasta que se interrumpa
+    el programa (Ctrl+C)
+
+    Args:
+        run (function): Funcion que ejecuta una orden a partir de la
+            linea de comandos (lista con el nombre del programa y sus
+            argumentos)
+
+    Raises:
+        DaemonError: Si ya hay un demonio atendiendo en SOCKET_PATH
+    """
+    import socket
+    if running():
+        raise DaemonError(" Ya hay un demonio atendiendo ordenes en " +
+                                                    f"'{SOCKET_PATH}'")
+    # Si queda el socket de un demonio que no termino bien se elimina
+    with suppress(FileNotFoundError):
+        os.remove(SOCKET_PATH)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    server.listen()
+    daemon_logger.info(f" Demonio atendiendo ordenes en '{SOCKET_PATH}'")
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                _handle(conn, run)
+                _finish(conn)
+    except KeyboardInterrupt:
+        daemon_logger.info(" Demonio detenido")
+    finally:
+        server.close()
+        with suppress(FileNotFoundError):
+            os.remove(SOCKET_PATH)
+
+def running() -> bool:
+    """Indica si hay un demonio atendiendo ordenes en SOCKET_PATH"""
+    conn = _connect()
+    if conn == None:
+        return False
+    conn.close()
+    return True
+
+def forward(argv:list) -> bool:
+    """Envia la linea de comandos al demonio (si hay alguno) y
+    muestra lo que devuelve hasta que termina la orden
+
+    Args:
+        argv (list): Linea de comandos introducida por el usuario
+
+    Returns:
+        bool: Si la orden la ha ejecutado el demonio
+    """
+    conn = _connect()
+    if conn == None:
+        return False
+    with conn:
+        request = json.dumps({"argv": argv}) + "\n"
+        conn.sendall(request.encode())
+        # Lo que introduzca el usuario se le pasa al demonio
+        stdin = threading.Thread(target=_send_stdin, args=(conn,),
+                                                        daemon=True)
+        stdin.start()
+        with suppress(ConnectionResetError):
+            while True:
+                data = conn.recv(65536)
+                if len(data) == 0:
+                    break
+                os.write(sys.stdout.fileno(), data)
+    return True
+
+# --------------------------------------------------------------------
+def _handle(conn, run):
+    """Ejecuta la orden que envia un cliente con su entrada y salidas
+    estandar"""
+    line = _read_line(conn)
+    if line == "":
+        return # Solo se ha comprobado si el demonio esta atendiendo
+    try:
+        request = json.loads(line)
+        argv = list(request["argv"])
+    except (ValueError, KeyError, TypeError, OSError) as err:
+        daemon_logger.error(f" Peticion no valida: {err}")
+        return
+    daemon_logger.debug(f" Orden recibida {argv}")
+    sys.stdout.flush(); sys.stderr.flush()
+    saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+    saved_stdin = sys.stdin
+    for fd in (0, 1, 2):
+        os.dup2(conn.fileno(), fd)
+    # Se abre de nuevo para no leer lo que quede en el buffer de la
+    # orden anterior
+    sys.stdin = open(0, "r", closefd=False)
+    try:
+        run(argv)
+    except Exception as err:
+        # p.ej si el cliente se ha cerrado antes de terminar la orden
+        failure = err
+    else:
+        failure = None
+    finally:
+        with suppress(OSError):
+            sys.stdout.flush()
+        with suppress(OSError):
+            sys.stderr.flush()
+        sys.stdin = saved_stdin
+        for fd, saved in zip((0, 1, 2), saved_fds):
+            os.dup2(saved, fd)
+            os.close(saved)
+    if failure != None:
+        daemon_logger.error(f" La orden {argv} ha fallado: {failure}")
+
+def _finish(conn):
+    """Indica al cliente que ha terminado la orden y espera a que
+    cierre la conexion (si se cerrase sin leer lo que ha enviado el
+    cliente, este recibiria un error en vez del final de la salida)"""
+    import socket
+    with suppress(OSError):
+        conn.shutdown(socket.SHUT_WR)
+        conn.settimeout(1)
+        while len(conn.recv(4096)) > 0:
+            pass
+
+def _read_line(conn) -> str:
+    """Lee la primera linea de la conexion (sin leer nada mas, lo que
+    viene despues es la entrada estandar del cliente)"""
+    line = b""
+    while not line.endswith(b"\n"):
+        char = conn.recv(1)
+        if len(char) == 0:
+            break
+        line += char
+    return line.decode()
+
+def _send_stdin(conn):
+    """Reenvia la entrada estandar del cliente al demonio"""
+    import socket
+    with suppress(OSError):
+        while True:
+            data = os.read(sys.stdin.fileno(), 4096)
+            if len(data) == 0:
+                conn.shutdown(socket.SHUT_WR)
+                break
+            conn.sendall(data)
+
+def _connect():
+    """Devuelve una conexion con el demonio o None si no hay ninguno
+    atendiendo"""
+    if not os.path.exists(SOCKET_PATH):
+        return None
+    import socket
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(SOCKET_PATH)
+    except OSError:
+        conn.close()
+        return None
+    return conn
+
+# --------------------------------------------------------------------
+class DaemonError(Exception):
+    """Excepcion personalizada para los errores del demonio"""
+    pass
+# --------------------------------------------------------------------
@@ -5,17 +5,24 @@ from contextlib import suppress
 from .reused_code import target_containers
 import program.controllers.bridges as bridges
 import program.controllers.containers as containers
+import program.controllers.addresses as addresses
 import program.machines as machines
 import program.functions as program
 import dependencies.register.register as register
 from dependencies.utils.tools import objectlist_as_dict
 from dependencies.utils.tools import concat_array
+from dependencies.utils.tools import ask
 
 # --------------------- REPOSITORIO DE COMANDOS ----------------------
 # --------------------------------------------------------------------
 # Aqui se definen todas las funciones asociadas a los comandos que 
 # tiene el programa. Estas funciones se pueden comunicar entre si 
 # mediante variables opcionales adicionales para reutilizar el codigo
+# Arrancar, parar y pausar manejan todos los contenedores desde un
+# mismo bucle de eventos (asyncio), el resto usa hilos (-j). Los
+# controladores que solo necesitan algunos comandos (imagenes,
+# perfiles y plantillas) se importan dentro de ellos, para que el
+# resto (p.ej show) no los carguen
 # --------------------------------------------------------------------
 
 cmd_logger = logging.getLogger(__name__)
@@ -31,7 +38,8 @@ def arrancar(*target_cs, options={}, flags=[]):
     # Arrancamos los contenedores validos
     msg = f" Arrancando contenedores '{concat_array(target_cs)}'..."
     cmd_logger.info(msg)
-    succesful_cs = containers.start(*target_cs)
+    import asyncio
+    succesful_cs = asyncio.run(containers.start_async(*target_cs))
     if not "-q" in flags:
         program.lxc_list()
     cs_s = concat_array(succesful_cs)
@@ -55,7 +63,8 @@ def parar(*target_cs, options={}, flags=[]):
     # Paramos los contenedores validos
     msg = f" Deteniendo contenedores '{concat_array(target_cs)}'..."
     cmd_logger.info(msg)
-    succesful_cs = containers.stop(*target_cs)
+    import asyncio
+    succesful_cs = asyncio.run(containers.stop_async(*target_cs))
     if not "-q" in flags:
         program.lxc_list()
     cs_s = concat_array(succesful_cs)
@@ -74,7 +83,8 @@ def pausar(*target_cs, options={}, flags=[]):
     # Pausamos los contenedores validos
     msg = f" Pausando contenedores '{concat_array(target_cs)}'..."
     cmd_logger.info(msg)
-    succesful_cs = containers.pause(*target_cs)
+    import asyncio
+    succesful_cs = asyncio.run(containers.pause_async(*target_cs))
     if not "-q" in flags:
         program.lxc_list()
     cs_s = concat_array(succesful_cs)
@@ -106,14 +116,16 @@ def eliminar(*target_cs, options={}, flags=[],
     if not "-f" in flags:
         print("Se eliminaran los servidores:" +
                     f" '{concat_array(target_cs)}'")
-        answer = str(input("¿Estas seguro?(y/n): "))
+        answer = ask("¿Estas seguro?(y/n): ")
         if answer.lower() != "y":
             return
     # Eliminamos los existentes que nos hayan indicado
     msg = f" Eliminando contenedores '{concat_array(target_cs)}'..."
     cmd_logger.info(msg)
     succesful_cs = containers.delete(*target_cs)
-    # Actualizamos los contenedores que estan asociados a cada bridge
+    # Liberamos sus ips y actualizamos los contenedores que estan
+    # asociados a cada bridge
+    addresses.release(*succesful_cs)
     program.update_conexions()
     if not "-q" in flags:
         program.lxc_list()
@@ -141,19 +153,14 @@ def term(*target_cs, options={}, flags=[]):
     cmd_logger.info(msg)
     
     # --------------------------------------------------------------------
-def añadir(numServs:int, options={}, flags=[], extra_cs=[]):
-    """Añade el numero de contenedores especificados a la plataforma
-    de servidores. Por defecto solo añade contenedores que sean del
-    tipo servidor, pero en extra_cs se pueden especificar contenedores 
-    de cualquier tipo que tambien se quiran añadir
+def añadir(numServs:int, options={}, flags=[]):
+    """Añade el numero de servidores especificados a la plataforma
+    de servidores
 
     Args:
         numServs (int): Numero de servidores a añadir
         options (dict, optional): Opciones del comando añadir
         flags (list, optional): Flags introducidos en el programa
-        extra_cs (list, optional): Variable utilizada para que 'crear' se
-            pueda comunicar con esta funcion y tambien cree los 
-            clientes y el balanceador, ademas de los servidores
     """
     if register.load(bridges.ID) == None:
         msg = (" La plataforma de servidores no ha sido " +
@@ -162,60 +169,23 @@ def añadir(numServs:int, options={}, flags=[], extra_cs=[]):
         cmd_logger.error(msg)
         return
     existent_cs = register.load(containers.ID)
+    num = 0
     if existent_cs != None:
         ex_s = filter(lambda cs: cs.tag == machines.SERVER, existent_cs)
         num = len(list(ex_s))
-        if num + numServs > 5: 
-            msg = (f" La plataforma no admite mas de 5 servidores. " +
-                    f"Actualmente existen {num}, no se " +
-                            f"puede añadir {numServs} mas")
-            cmd_logger.error(msg)
-            return
+    if not _check_num_servers(numServs, existing=num):
+        return
+    import program.controllers.images as images
     # Creando contenedores 
-        # Elegimos la imagen con la que se van a crear
-    simage = machines.default_image
-    if "--image" in options:
-        simage = options["--image"][0]
-    if "--simage" in options:
-        simage = options["--simage"][0]
-    cmd_logger.debug(f" Creando servidores con imagen '{simage}'")
-    if "--name" in options:   
-        names = options["--name"]
-        cs = extra_cs + machines.get_servers(
-            numServs, 
-            *names, 
-            image=simage
-        )
-    else:
-        cs = extra_cs + machines.get_servers(
-            numServs,
-            image=simage
-        )
-    cs_s = concat_array(cs)
-    msg = f" Nombre de contenedores serializados --> '{cs_s}'"
-    cmd_logger.debug(msg)
-    launch = True if "-l" in flags else False
-    show = True if not launch and "-q" not in flags else False
-    cmd_logger.debug(f" Launch --> {launch} | show --> {show}")
-    cmd_logger.info(f" Inicializando contenedores '{cs_s}'...")
-    successful_cs = containers.init(*cs)
-    if not "-q" in flags:
-        program.lxc_list() 
-    cs_s = concat_array(successful_cs)
-    msg = (f" Contenedores '{cs_s}' inicializados\n")
-    cmd_logger.info(msg)
-    if len(successful_cs) != 0:     
-        # Estableciendo conexiones
-        cmd_logger.info(" Estableciendo conexiones " +
-                                "entre contenedores y bridges...")
-        program.connect_machines()
-        cmd_logger.info(" Conexiones establecidas\n")
-        # Arrancamos los contenedores creados con exito 
-        # (si nos lo han pedido) 
-        if successful_cs != None and launch:
-            c_names = list(map(lambda c: c.name, successful_cs))
-            arrancar(*c_names, flags=flags) 
-                 
+        # Elegimos la imagen con la que se van a crear. Los
+        # servidores se crean a partir de la imagen local
+    simage = _server_image(options)
+    fingerprints = images.prepare(simage)
+    if fingerprints == None:
+        cmd_logger.error(f" La imagen '{simage}' no es valida")
+        return
+    _add_servers(numServs, num, options, flags, [], fingerprints[simage])
+
 # --------------------------------------------------------------------
 def crear(numServs:int, options={}, flags=[]):
     """Crea la plataforma del sistema-servidor, desplegando los 
@@ -232,19 +202,13 @@ def crear(numServs:int, options={}, flags=[]):
               + "se debe destruir la anterior para crear otra nueva")
         cmd_logger.error(msg)
         return   
+    if not _check_num_servers(numServs):
+        return
     cmd_logger.info(" Desplegando la plataforma de servidores...\n")
-    # Creando bridges
-    bgs = machines.get_bridges(numBridges=2)
-    bgs_s = concat_array(bgs)
-    cmd_logger.debug(f" Nombre de bridges serializado --> '{bgs_s}'")
-    cmd_logger.info(" Creando bridges...")
-    succesful_bgs = bridges.init(*bgs)
-    if not "-q" in flags:
-        program.lxc_network_list()
-    bgs_s = concat_array(succesful_bgs)
-    cmd_logger.info(f" Bridges '{bgs_s}' creados\n")
-    # Creando contenedores
-        # Elegimos la imagen con la que se van a crear
+    import program.controllers.images as images
+    # Elegimos las imagenes con las que se van a crear los contenedores
+    # y las preparamos antes de crear nada (si alguna no es valida no
+    # se despliega la plataforma)
     lbimage = machines.default_image
     climage = machines.default_image
     if "--image" in options:
@@ -254,11 +218,24 @@ def crear(numServs:int, options={}, flags=[]):
         climage = options["--climage"][0]
     if "--lbimage" in options:
         lbimage = options["--lbimage"][0]
+    simage = _server_image(options)
+    cmd_logger.info(" Preparando imagenes...")
+    fingerprints = images.prepare(lbimage, climage, simage)
+    if fingerprints == None:
+        cmd_logger.error(" Alguna de las imagenes no es valida, no se " +
+                                        "puede desplegar la plataforma")
+        return
+    cmd_logger.info(" Imagenes preparadas\n")
+    # Creando contenedores (los bridges se crean cuando ya estan
+    # listos los perfiles y la plantilla)
     cmd_logger.debug(f" Creando cliente con imagen '{climage}'")
     cmd_logger.debug(f" Creando lb con imagen '{lbimage}'")
-    lb = machines.get_loadbalancer(image=lbimage)
-    cl = machines.get_clients(image=climage)
-    añadir(numServs, options=options, flags=flags, extra_cs=[lb,cl]) 
+    lb = machines.get_loadbalancer(image=fingerprints[lbimage])
+    cl = machines.get_clients(image=fingerprints[climage])
+    _add_servers(numServs, 0, options, flags, [lb, cl],
+                                                fingerprints[simage])
+    if not "-q" in flags:
+        program.lxc_network_list()
     cmd_logger.info(" Plataforma de servidores desplegada")
 
 # --------------------------------------------------------------------
@@ -272,12 +249,15 @@ def destruir(options={}, flags=[]):
         options (dict, optional): Opciones del comando destruir
         flags (list, optional): Flags introducidos en el programa
     """
+    import program.controllers.profiles as profiles
+    import program.controllers.templates as templates
+    import program.controllers.images as images
     if not "-f" in flags:
         msg = ("Se borrara por completo la infraestructura " + 
                 "creada, contenedores, bridges y sus conexiones " + 
                     "aun podiendo estar arrancadas")
         print(msg)
-        answer = str(input("¿Estas seguro?(y/n): "))
+        answer = ask("¿Estas seguro?(y/n): ")
         if answer.lower() != "y":
             return
     if register.load(bridges.ID) == None:
@@ -307,11 +287,28 @@ def destruir(options={}, flags=[]):
         bgs_s = concat_array(successful_bgs)
         msg = (f" Bridges '{bgs_s}' eliminados\n")
         cmd_logger.info(msg)  
+    # Eliminamos las plantillas y los perfiles (si no queda ningun
+    # contenedor)
+    tps = register.load(templates.ID)
+    if tps != None and register.load(containers.ID) == None:
+        msg = f" Eliminando plantillas '{concat_array(tps)}'..."
+        cmd_logger.info(msg)
+        templates.delete(*tps)
+    pfs = register.load(profiles.ID)
+    if pfs != None and register.load(containers.ID) == None:
+        profiles.delete(*pfs)
     # Si se ha elimando todo eliminamos el registro   
     cs = register.load(containers.ID)
     bgs = register.load(bridges.ID) 
-    if cs == None and bgs == None:
-        register.remove()
+    pfs = register.load(profiles.ID)
+    tps = register.load(templates.ID)
+    if cs == None and bgs == None and pfs == None and tps == None:
+        addresses.delete()
+        if register.load(program.STATE_ID) != None:
+            register.remove(program.STATE_ID)
+        # La cache de imagenes se conserva para el siguiente despliegue
+        if register.load(images.ID) == None:
+            register.remove()
         cmd_logger.info(" Plataforma destruida")
     else:
         msg = (" Plataforma destruida parcialmente " +
@@ -334,4 +331,142 @@ def show(choice:str, options={}, flags={}):
     elif choice == "files":
         program.show_files_structure()
         
-# --------------------------------------------------------------------
\ No newline at end of file
+# --------------------------------------------------------------------
+def migrar(backend:str, options={}, flags=[]):
+    """Mueve el registro del programa al backend indicado
+
+    Args:
+        backend (str): Backend al que se quiere mover el registro
+            ('pickle' o 'sqlite')
+        options (dict, optional): Opciones del comando migrar
+        flags (list, optional): Flags introducidos en el programa
+    """
+    current = register.current_backend()
+    if current == backend:
+        cmd_logger.warning(f" El registro ya se guarda con '{backend}'")
+        return
+    # Se copian todas las paginas, tambien las de las plantillas, que
+    # necesitan su codificador
+    import program.controllers.templates
+    cmd_logger.info(f" Migrando el registro de '{current}' a '{backend}'...")
+    register.migrate(backend)
+    cmd_logger.info(f" Registro migrado a '{backend}'")
+
+# --------------------------------------------------------------------
+def _server_image(options:dict) -> str:
+    """Devuelve la imagen con la que se crean los servidores"""
+    simage = machines.default_image
+    if "--image" in options:
+        simage = options["--image"][0]
+    if "--simage" in options:
+        simage = options["--simage"][0]
+    return simage
+
+def _add_servers(numServs:int, existing:int, options:dict, flags:list,
+                                            extra_cs:list, simage:str):
+    """Crea los servidores (y los contenedores de extra_cs) una vez
+    comprobados y con la imagen ya preparada. Usada por 'añadir' y
+    'crear'. Los bridges que falten se crean despues de los perfiles y
+    la plantilla, para no dejar bridges sin contenedores si algo de
+    eso falla
+
+    Args:
+        numServs (int): Numero de servidores a crear
+        existing (int): Numero de servidores que ya existen
+        options (dict): Opciones del comando
+        flags (list): Flags introducidos en el programa
+        extra_cs (list): Otros contenedores a crear con los servidores
+        simage (str): Fingerprint de la imagen de los servidores
+    """
+    import program.controllers.profiles as profiles
+    import program.controllers.templates as templates
+    cmd_logger.debug(f" Creando servidores con imagen '{simage}'")
+    if "--name" in options:   
+        names = options["--name"]
+        servs = machines.get_servers(
+            numServs, 
+            *names, 
+            image=simage
+        )
+    else:
+        servs = machines.get_servers(
+            numServs,
+            image=simage
+        )
+    cs = extra_cs + servs
+    cs_s = concat_array(cs)
+    msg = f" Nombre de contenedores serializados --> '{cs_s}'"
+    cmd_logger.debug(msg)
+    launch = True if "-l" in flags else False
+    show = True if not launch and "-q" not in flags else False
+    cmd_logger.debug(f" Launch --> {launch} | show --> {show}")
+    # Los limites de recursos se aplican con perfiles de lxc que se
+    # crean una sola vez
+    failed = profiles.ensure(*machines.get_profiles())
+    if len(failed) > 0:
+        msg = (" No se han podido crear los perfiles " +
+               f"'{concat_array(failed)}', no se pueden crear contenedores")
+        cmd_logger.error(msg)
+        return
+    if "-g" in flags:
+        # Los servidores se copian de una plantilla que solo se crea
+        # la primera vez (el resto se crean a partir de su imagen)
+        source = templates.ensure(machines.get_template(simage))
+        if source == None:
+            cmd_logger.error(" No se ha podido crear la plantilla de " +
+                                                    "los servidores")
+            return
+    # Si los servidores no caben en los bridges que hay se crean
+    # los que falten (cada uno en una nueva subred)
+    existent_bgs = objectlist_as_dict(
+        register.load(bridges.ID), key_attribute="name"
+    )
+    existent_bgs = existent_bgs if existent_bgs != None else {}
+    bgs = machines.get_bridges(machines.count_bridges(existing + numServs))
+    new_bgs = list(filter(lambda b: b.name not in existent_bgs, bgs))
+    if len(new_bgs) > 0:
+        cmd_logger.info(f" Creando bridges '{concat_array(new_bgs)}'...")
+        succesful_bgs = bridges.init(*new_bgs)
+        if len(succesful_bgs) != len(new_bgs):
+            cmd_logger.warning(" No se han podido crear todos los " +
+                    "bridges, algunos servidores no se conectaran")
+    cmd_logger.info(f" Inicializando contenedores '{cs_s}'...")
+    if "-g" in flags:
+        successful_cs = containers.init(*extra_cs)
+        successful_cs += containers.init(*servs, source=source)
+    else:
+        successful_cs = containers.init(*cs)
+    if not "-q" in flags:
+        program.lxc_list() 
+    cs_s = concat_array(successful_cs)
+    msg = (f" Contenedores '{cs_s}' inicializados\n")
+    cmd_logger.info(msg)
+    if len(successful_cs) != 0:     
+        # Estableciendo conexiones
+        cmd_logger.info(" Estableciendo conexiones " +
+                                "entre contenedores y bridges...")
+        program.connect_machines()
+        cmd_logger.info(" Conexiones establecidas\n")
+        # Arrancamos los contenedores creados con exito 
+        # (si nos lo han pedido) 
+        if successful_cs != None and launch:
+            c_names = list(map(lambda c: c.name, successful_cs))
+            arrancar(*c_names, flags=flags)
+
+def _check_num_servers(numServs:int, existing:int=0) -> bool:
+    """Comprueba que se pueden crear numServs servidores mas sin
+    superar el maximo de la plataforma (machines.capacity)"""
+    max_servers = machines.capacity["max_servers"]
+    if type(numServs) != int or numServs < 1:
+        cmd_logger.error(f" El numero de servidores '{numServs}' no " +
+                                    "es valido (debe ser un entero positivo)")
+        return False
+    if existing + numServs > max_servers:
+        msg = (f" La plataforma no admite mas de {max_servers} " +
+                f"servidores. Actualmente existen {existing}, no se " +
+                            f"puede añadir {numServs} mas")
+        cmd_logger.error(msg)
+        return False
+    return True
+
+# --------------------------------------------------------------------
@@ -4,7 +4,6 @@ from logging import Logger
 
 import program.controllers.containers as containers
 import dependencies.register.register as register
-from dependencies.utils.tools import objectlist_as_dict, remove_many
 
 
 def target_containers(logger:Logger=None):
@@ -34,20 +33,18 @@ def target_containers(logger:Logger=None):
                 logger.error(msg)
                 return
             # Comprobamos si hay que operar sobre todos los existentes 
-            # o solo algunos en concreto
-            names_given = list(args)
-            c_dict = objectlist_as_dict(cs, "name")
+            # o solo algunos en concreto (se buscan por nombre en el
+            # registro y se notifican los incorrectos)
             target_cs = cs
             if len(args) != 0: 
-                valid_names = filter(lambda name: name in c_dict, names_given)
-                target_cs = list(map(lambda valid: c_dict[valid], valid_names))
-            # Notificamos los incorrectos. Eliminamos los nombres validos 
-            # de los que nos han pasado y si siguen quedando nombres 
-            # significa que no son validos. 
-            remove_many(names_given, *c_dict.keys())
-            for wrong in names_given:
-                err_msg = f" No existe el contenedor '{wrong}' en este programa"
-                logger.error(err_msg)
+                target_cs = []
+                for name in dict.fromkeys(args):
+                    c = register.load_item(containers.ID, name)
+                    if c == None:
+                        err_msg = f" No existe el contenedor '{name}' en este programa"
+                        logger.error(err_msg)
+                    else:
+                        target_cs.append(c)
             # En caso de que haya algun contenedor valido
             if len(target_cs) != 0:
                 cmd(*target_cs, **opt_args)
@@ -0,0 +1,262 @@
+
+import sys
+import json
+import platform
+import argparse
+from datetime import datetime
+
+from benchmarks.register_bench import measure
+from dependencies.lxc_classes import state
+
+# ------------------- BENCHMARK DE 'LXC LIST' ------------------------
+# --------------------------------------------------------------------
+# Compara el tiempo que se tarda en convertir la salida de 'lxc list'
+# en datos con el parser de la tabla de texto que se usaba antes
+# (lxclist_as_dict, que la recorre caracter a caracter) y con el de
+# la salida en JSON (state.parse_instances). Para cada tamaño se
+# genera una tabla y un JSON sinteticos con los mismos contenedores
+# (un tercio con dos ethernets, como el balanceador), se comprueba que
+# los dos parsers obtienen lo mismo y se miden los percentiles
+# p50/p95/p99 y la memoria maxima de cada uno. Los resultados se
+# guardan en JSON para poder compararlos entre versiones
+# Uso (desde la carpeta principal del proyecto):
+#   python -m benchmarks.lxclist_bench [-s 100 1000 5000] [-o f]
+# --------------------------------------------------------------------
+
+# Tamaños por defecto (numero de contenedores de la lista)
+SIZES = (10, 1000, 5000)
+# Columnas de la tabla de 'lxc list'
+HEADERS = ("NAME", "STATE", "IPV4", "IPV6", "TYPE", "SNAPSHOTS")
+# --------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.lxclist_bench",
+        description="Benchmark de los parsers de 'lxc list'"
+    )
+    parser.add_argument(
+        "-s", "--sizes", type=int, nargs="+", default=list(SIZES),
+        help="numero de contenedores de la lista"
+    )
+    parser.add_argument(
+        "-n", "--samples", type=int, default=20,
+        help="muestras de cada parser por tamaño"
+    )
+    parser.add_argument(
+        "-o", "--output", default="lxclist_bench.json",
+        help="fichero JSON donde se guardan los resultados"
+    )
+    args = parser.parse_args()
+    results = []
+    for size in args.sizes:
+        result = run(size, args.samples)
+        results.append(result)
+        print_result(result)
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "samples": args.samples
+        },
+        "results": results
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f" Resultados guardados en '{args.output}'")
+
+# --------------------------------------------------------------------
+def run(size:int, samples:int) -> dict:
+    """Mide los dos parsers con una lista de 'size' contenedores
+
+    Args:
+        size (int): Numero de contenedores de la lista
+        samples (int): Muestras de cada parser
+
+    Returns:
+        dict: Resultados {"size", "table_bytes", "json_bytes", "ops"}
+    """
+    fleet = synthetic_list(size)
+    table, text = as_table(fleet), as_json(fleet)
+    check(lxclist_as_dict(table), state.parse_instances(text), fleet)
+    ops = {
+        "table": measure([lambda: lxclist_as_dict(table)] * (samples + 1)),
+        "json": measure(
+            [lambda: state.parse_instances(text)] * (samples + 1)
+        )
+    }
+    return {
+        "size": size, "table_bytes": len(table.encode()),
+        "json_bytes": len(text.encode()), "ops": ops
+    }
+
+def check(table_info:dict, states:dict, fleet:list):
+    """Comprueba que los dos parsers han obtenido la misma
+    informacion (nombre, estado e ips de cada contenedor)
+
+    Raises:
+        AssertionError: Si no coinciden
+    """
+    names = table_info["NAME"]
+    assert names == [name for name, _, _ in fleet] == list(states)
+    for i, (name, status, ips) in enumerate(fleet):
+        assert table_info["STATE"][i] == states[name].status == status
+        cell = table_info["IPV4"][i]
+        if type(cell) != list:
+            cell = [] if cell == "" else [cell]
+        assert cell == [f"{ip} ({eth})" for eth, ip in ips.items()]
+        assert states[name].ipv4 == {eth: [ip] for eth, ip in ips.items()}
+
+# --------------------------------------------------------------------
+def synthetic_list(size:int) -> list:
+    """Genera los contenedores de una lista sintetica
+
+    Returns:
+        list: [(nombre, estado, {eth: ip})]
+    """
+    fleet = []
+    for i in range(size):
+        status = "RUNNING" if i % 2 == 0 else "STOPPED"
+        ips = {}
+        if status == "RUNNING":
+            ips["eth0"] = f"10.0.{i // 256 % 256}.{i % 256}"
+            if i % 3 == 0:
+                ips["eth1"] = f"10.1.{i // 256 % 256}.{i % 256}"
+        fleet.append((f"s{i}", status, ips))
+    return fleet
+
+def as_table(fleet:list) -> str:
+    """Devuelve la lista como la tabla que muestra 'lxc list'"""
+    rows = []
+    for name, status, ips in fleet:
+        cells = [f"{ip} ({eth})" for eth, ip in ips.items()] or [""]
+        for j, ipv4 in enumerate(cells):
+            first = j == 0
+            rows.append((
+                name if first else "", status if first else "", ipv4,
+                "", "CONTAINER" if first else "", "0" if first else ""
+            ))
+        rows.append(None)
+    widths = [len(h) for h in HEADERS]
+    for row in rows:
+        if row != None:
+            widths = [max(w, len(cell)) for w, cell in zip(widths, row)]
+    separator = "+" + "+".join("-" * (w + 2) for w in widths) + "+"
+    def line(cells):
+        return "|" + "|".join(
+            f" {cell:<{w}} " for cell, w in zip(cells, widths)
+        ) + "|"
+    lines = [separator, line(HEADERS), separator]
+    for row in rows:
+        lines.append(separator if row == None else line(row))
+    return "\n".join(lines) + "\n"
+
+def as_json(fleet:list) -> str:
+    """Devuelve la lista como la salida de 'lxc list --format json'"""
+    instances = []
+    for name, status, ips in fleet:
+        network = {"lo": {"addresses": [
+            {"family": "inet", "address": "127.0.0.1", "scope": "local"}
+        ]}}
+        for eth, ip in ips.items():
+            network[eth] = {"addresses": [
+                {"family": "inet", "address": ip, "scope": "global"},
+                {"family": "inet6", "address": "fe80::1", "scope": "link"}
+            ]}
+        instances.append({
+            "name": name, "status": status.capitalize(), "type": "container",
+            "state": {"status": status.capitalize(), "network": network}
+        })
+    return json.dumps(instances)
+
+def print_result(result:dict):
+    print(f" -> {result['size']} contenedores ({result['table_bytes']} " +
+          f"bytes de tabla, {result['json_bytes']} bytes de JSON)")
+    for op, stats in result["ops"].items():
+        print(f"    {op:<6} p50={stats['p50_ms']:.3f}ms "
+              + f"p95={stats['p95_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms "
+              + f"mem={stats['peak_mem']}B")
+
+# --------------------------------------------------------------------
+# Parser de la tabla de texto de 'lxc list' que usaba el programa antes
+# de leer la salida en JSON (se conserva para poder compararlos)
+def lxclist_as_dict(string:str) -> dict:
+    """Analiza una lista de lxc y proporciona toda su informacion 
+    en forma de diccionario para que sea facilmente accesible.
+    CUIDADO: Los headers de la lista dependen del idioma en el que
+    este el ordenador anfitrion o del idioma usado de lxc (No 
+    siempre son los mismos)
+
+    Args:
+        string (str): string que contiene la lista de lxc
+
+    Returns:
+        dict: diccionario con la informacion de la lista (los 
+        headers son las claves del diccionario)
+    """
+    info = {}
+    chars = list(string)
+    colums = -1
+    line_length = 0
+    cells_length = []
+    cell_start = 1
+    # Calculamos la longitud de cada linea, la longitud de cada celda
+    # y el numero de filas y columnas
+    for i, c in enumerate(chars):
+        if c == "|":
+            break
+        line_length = i + 1
+        if c == "+":
+            colums += 1 
+            if colums > 0:
+                cells_length.append(line_length-1-cell_start)
+            cell_start = 1 + i
+            continue
+    rows = -1
+    lines = int(len(chars)/line_length)
+    for i in range(lines):
+        if chars[i*line_length] == "+":
+            rows += 1
+    # Vamos mirando cada linea de cada columna y vemos si es 
+    # una fila de guiones o es una fila con espacio en 
+    # blanco => informacion
+    _start = line_length + 1
+    for i in range(colums):
+        if i != 0:
+            _start += cells_length[i-1] + 1
+        _end = _start + cells_length[i] - 1
+        key = string[_start:_end].strip()
+        info[key] = []
+        k = 0
+        for j in range(rows):
+            start = _start + line_length*(k+j+1) 
+            while start < len(chars) and chars[start] == "-":
+                start += line_length
+            end = start + cells_length[i] - 1   
+            values = []
+            if start >= len(chars): continue
+            # Miramos si hay mas de una linea seguida con 
+            # informacion y con k recalibramos los siguientes
+            # start de las siguientes lineas
+            while chars[start] == " ":
+                value = string[start:end].strip()
+                values.append(value)
+                if len(values) >= 1:
+                    k += 1
+                start += line_length
+                end += line_length
+            # Establecemos un criterio de devolucion de la
+            # informacion para que luego sea mas facil de acceder
+            # a esta en otras funciones
+            if len(values) > 1:
+                while "" in values:
+                    values.remove("")
+            if len(values) == 1:
+                values = values[0]
+            if len(values) == 0:
+                values = ""
+            info[key].append(values)
+    return info
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
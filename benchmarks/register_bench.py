@@ -0,0 +1,249 @@
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import dependencies.register.register as register
+from dependencies.lxc_classes import records
+from dependencies.lxc_classes.container import Container
+from dependencies.lxc_classes.bridge import Bridge
+
+# --------------------- BENCHMARK DEL REGISTRO -----------------------
+# --------------------------------------------------------------------
+# Mide como se comporta el registro a medida que crece el numero de
+# contenedores guardados. Para cada backend (register.BACKENDS) y
+# cada tamaño se crea un registro nuevo en una carpeta temporal con
+# una pagina de 'size' objetos sinteticos (Container y Bridge) y se
+# mide la latencia de:
+# - add: añadir una pagina completa de 'size' objetos
+# - update: añadir un objeto al final (update(override=False))
+# - replace: reemplazar un objeto que ya existe (save_item, como hacen
+#   los controladores al actualizar un contenedor)
+# - load: leer la pagina sin cache (como un proceso nuevo)
+# - load_replaced: igual que load pero justo despues de los replace
+#   (con lo que hayan dejado en el diario)
+# - load_cached: leer la pagina con la cache del proceso
+# - remove: eliminar una pagina completa
+# De cada operacion se dan los percentiles p50/p95/p99 y la memoria
+# maxima usada (tracemalloc, medida en una ejecucion aparte para no
+# alterar las latencias). Tambien se da el tamaño en disco del
+# registro. Los resultados se guardan en JSON para poder compararlos
+# entre versiones. Un backend nuevo solo tiene que añadirse a
+# register.BACKENDS para que se mida aqui
+# Uso (desde la carpeta principal del proyecto):
+#   python -m benchmarks.register_bench [-s 10 1000] [-b sqlite] [-o f]
+# --------------------------------------------------------------------
+
+# Tamaños por defecto (numero de objetos de la pagina)
+SIZES = (10, 1000, 100000)
+# Pagina con la que se hacen las pruebas
+BENCH_ID = "containers"
+# Cada cuantos contenedores se genera un bridge
+BRIDGE_EVERY = 64
+# --------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.register_bench",
+        description="Benchmark de las operaciones del registro"
+    )
+    parser.add_argument(
+        "-s", "--sizes", type=int, nargs="+", default=list(SIZES),
+        help="numero de objetos de la pagina medida"
+    )
+    parser.add_argument(
+        "-b", "--backends", nargs="+", choices=register.BACKENDS,
+        default=list(register.BACKENDS), help="backends a medir"
+    )
+    parser.add_argument(
+        "-n", "--samples", type=int, default=20,
+        help="muestras de add, load y remove por tamaño"
+    )
+    parser.add_argument(
+        "-u", "--updates", type=int, default=200,
+        help="muestras de update y replace por tamaño"
+    )
+    parser.add_argument(
+        "--no-codec", action="store_true",
+        help="guardar la pagina con pickle en vez de con records"
+    )
+    parser.add_argument(
+        "-o", "--output", default="register_bench.json",
+        help="fichero JSON donde se guardan los resultados"
+    )
+    args = parser.parse_args()
+    if not args.no_codec:
+        register.config_codec(BENCH_ID, records.encode, records.decode)
+    results = []
+    for backend in args.backends:
+        for size in args.sizes:
+            result = run(backend, size, args.samples, args.updates)
+            results.append(result)
+            print_result(result)
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "codec": None if args.no_codec else "records",
+            "samples": args.samples,
+            "updates": args.updates
+        },
+        "results": results
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f" Resultados guardados en '{args.output}'")
+
+# --------------------------------------------------------------------
+def run(backend:str, size:int, samples:int, updates:int) -> dict:
+    """Mide las operaciones del registro con un backend y un tamaño
+    de pagina. El registro se crea en una carpeta temporal que se
+    elimina al terminar
+
+    Args:
+        backend (str): Backend a medir (uno de register.BACKENDS)
+        size (int): Numero de objetos de la pagina
+        samples (int): Muestras de add, load y remove
+        updates (int): Muestras de update y replace
+
+    Returns:
+        dict: Resultados {"backend", "size", "file_size", "ops"}
+    """
+    old_path = register.REL_PATH
+    tmp_dir = tempfile.mkdtemp(prefix="register_bench_")
+    register.config_location(tmp_dir + os.sep)
+    register.config_backend(backend)
+    try:
+        fleet = synthetic_fleet(size)
+        ops = {}
+        ids = [f"bench-{i}" for i in range(samples + 1)]
+        ops["add"] = measure(
+            [lambda i=i: register.add(i, fleet) for i in ids]
+        )
+        ops["remove"] = measure(
+            [lambda i=i: register.remove(i) for i in ids]
+        )
+        register.add(BENCH_ID, fleet)
+        new = synthetic_fleet(updates + 1, start=size)
+        ops["update"] = measure(
+            [lambda c=c: register.update(BENCH_ID, c, override=False)
+                                                            for c in new]
+        )
+        def load_cold():
+            register.clear_cache()
+            register.load(BENCH_ID)
+        ops["load"] = measure([load_cold] * (samples + 1))
+        # Se reemplazan objetos que ya estan en la pagina (siempre
+        # copias nuevas, como si vinieran de otro proceso)
+        replaced = synthetic_fleet(min(size, updates + 1))
+        for c in replaced:
+            c.state = "FROZEN"
+        ops["replace"] = measure(
+            [lambda c=replaced[i % len(replaced)]:
+                register.save_item(BENCH_ID, c) for i in range(updates + 1)]
+        )
+        ops["load_replaced"] = measure([load_cold] * (samples + 1))
+        ops["load_cached"] = measure(
+            [lambda: register.load(BENCH_ID)] * (samples + 1)
+        )
+        return {
+            "backend": backend, "size": size,
+            "file_size": disk_usage(tmp_dir), "ops": ops
+        }
+    finally:
+        register.config_backend(None)
+        register.config_location("", old_path)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def measure(calls:list) -> dict:
+    """Ejecuta las llamadas midiendo su latencia. La ultima se ejecuta
+    con tracemalloc activo para obtener la memoria maxima que usa la
+    operacion (y no se cuenta en las latencias)
+
+    Args:
+        calls (list): Funciones sin argumentos a ejecutar (al menos 2)
+
+    Returns:
+        dict: Estadisticas de la operacion (tiempos en ms y memoria en
+            bytes)
+    """
+    latencies = []
+    for call in calls[:-1]:
+        start = time.perf_counter_ns()
+        call()
+        latencies.append((time.perf_counter_ns() - start) / 1e6)
+    tracemalloc.start()
+    try:
+        calls[-1]()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    return {
+        "samples": len(latencies),
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "peak_mem": peak
+    }
+
+def percentile(values:list, p:float) -> float:
+    """Percentil por el metodo del rango mas cercano de una lista
+    ordenada"""
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+# --------------------------------------------------------------------
+def synthetic_fleet(size:int, start:int=0) -> list:
+    """Genera una lista de objetos parecidos a los que guarda el
+    programa (contenedores con sus redes y algun bridge)
+
+    Args:
+        size (int): Numero de objetos
+        start (int, optional): Indice del primer objeto (los nombres
+            no se repiten entre llamadas con rangos distintos)
+    """
+    fleet = []
+    for i in range(start, start + size):
+        if i % BRIDGE_EVERY == BRIDGE_EVERY - 1:
+            b = Bridge(
+                f"lxdbr{i}", f"eth{i % 2}", ipv4_nat=True,
+                ipv4_addr=f"10.{i // 256 % 256}.{i % 256}.1/24"
+            )
+            b.used_by = [f"s{j}" for j in range(i - 3, i)]
+            fleet.append(b)
+            continue
+        tag = ("server", "client", "load balancer")[i % 3]
+        c = Container(f"s{i}", "ubuntu:18.04", tag=tag)
+        c.state = "RUNNING" if i % 2 == 0 else "STOPPED"
+        c.networks = {"eth0": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"}
+        fleet.append(c)
+    return fleet
+
+def disk_usage(path:str) -> int:
+    """Devuelve lo que ocupan en disco los ficheros de una carpeta"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+def print_result(result:dict):
+    print(f" -> backend '{result['backend']}', {result['size']} objetos, "
+          + f"{result['file_size']} bytes en disco")
+    for op, stats in result["ops"].items():
+        print(f"    {op:<14} p50={stats['p50_ms']:.3f}ms "
+              + f"p95={stats['p95_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms "
+              + f"mem={stats['peak_mem']}B")
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
@@ -26,15 +26,19 @@ class Command:
             default (any, optional): Indica el valor por defecto de un
                 parametro extra en caso de que no se proporcione ninguno
                 (extra_arg debe estar a True)
+            check (function, optional): Funcion que recibe cada
+                parametro extra y devuelve si es valido (extra_arg debe
+                estar a True)
             description (str, optional): Da informacion de que hace el
                 comando
         """
     def __init__(self, name:str, extra_arg:any=False, mandatory=False,
                  multi=False, choices:list=None, default:any=None,
-                 description:str=None):
+                 check=None, description:str=None):
         self.name = name
         self.extra_arg = extra_arg
         self.choices = choices
+        self.check = check
         self.default = default
         self.description = description 
         self.mandatory = mandatory
@@ -43,7 +47,7 @@ class Command:
    
     def add_option(self, name:str, extra_arg:any=False, mandatory=False, 
                    multi=False, choices:list=None, default:any=None,
-                   description:str=None):
+                   check=None, description:str=None):
         """Añade una opcion al comando. Una opcion es basicamente un 
         comando anidado dentro de otro, que necesita la existencia
         del comando principal para que este sea valido. Por eso los 
@@ -56,6 +60,7 @@ class Command:
             multi=multi,
             choices=choices, 
             default=default, 
+            check=check,
             description=description
         )
      
@@ -81,8 +81,7 @@ class Cli:
                         command = cmd
                         key = "cmd"
                     checked_cmd = self._check_command(command, params)
-                    dict_page = {command.name: checked_cmd}
-                    processed_line[key] = dict_page
+                    processed_line[key][command.name] = checked_cmd
                 processed_line["flags"] = inFlags
                 return processed_line
         raise CmdLineError(f"El comando '{args[0]}' no se reconoce")
@@ -120,6 +119,12 @@ class Cli:
                         extra_args.append(int(extra))
                     except:
                         extra_args.append(extra)
+                if cmd.check != None:
+                    for extra in extra_args:
+                        if not cmd.check(extra):
+                            err_msg = (f"El parametro extra '{extra}' no " +
+                                      f"es valido para '{cmd.name}'")
+                            raise CmdLineError(err_msg)
                 if cmd.choices == None:
                     return extra_args
                 # Todos los extra args deben estar en choices
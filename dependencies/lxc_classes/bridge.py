@@ -1,6 +1,13 @@
 import subprocess
 from contextlib import suppress
 
+# --------------------------------------------------------------------
+# Igual que en Container, cada operacion se define una sola vez como
+# un generador de comandos de lxc (_create, _delete...) que se puede
+# ejecutar de forma bloqueante (create, delete...) o con asyncio
+# (create_async, delete_async...). El yield devuelve al generador lo
+# que ha mostrado el comando por pantalla
+# --------------------------------------------------------------------
 class Bridge:
     """Clase envoltorio que permite controlar un bridge de lxc
 
@@ -34,14 +41,24 @@ class Bridge:
     def _run(self, cmd:list):
         """Ejecuta un comando mediante subprocess y controla los 
         errores que puedan surgir. Espera a que termine el proceso
-        (Llamada bloqueante)
+        (Llamada bloqueante). Si esta activada la API de LXD el
+        comando se hace con una peticion a la API (ver lxd_api)
 
         Args:
             cmd (list): Comando a ejecutar
 
         Raises:
-            LxcError: Si surge algun error ejecutando el comando
+            LxcNetworkError: Si surge algun error ejecutando el comando
+
+        Returns:
+            str: Salida del comando
         """
+        # Se importa aqui para no cargarlo al leer el registro
+        from . import lxd_api
+        if lxd_api.enabled():
+            output = self._run_api(cmd)
+            if output != None:
+                return output
         process = subprocess.run(
             cmd, 
             stderr=subprocess.PIPE,
@@ -49,10 +66,79 @@ class Bridge:
         )
         outcome = process.returncode
         if outcome != 0:
-            err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
-                            "Mensaje de error de lxc: ->")
-            err_msg += process.stderr.decode().strip()[6:]
-            raise LxcNetworkError(err_msg)
+            raise _error(cmd, process.stderr.decode().strip()[6:])
+        return process.stdout.decode()
+
+    async def _run_async(self, cmd:list):
+        """Igual que _run pero sin bloquear el bucle de eventos
+
+        Args:
+            cmd (list): Comando a ejecutar
+
+        Raises:
+            LxcNetworkError: Si surge algun error ejecutando el comando
+        """
+        # Se importan aqui para no cargarlos si no se usan
+        import asyncio
+        from . import lxd_api
+        if lxd_api.enabled():
+            loop = asyncio.get_running_loop()
+            output = await loop.run_in_executor(None, self._run_api, cmd)
+            if output != None:
+                return output
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stderr=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise _error(cmd, stderr.decode().strip()[6:])
+        return stdout.decode()
+
+    def _run_api(self, cmd:list) -> str:
+        """Ejecuta un comando con la API de LXD
+
+        Raises:
+            LxcNetworkError: Si LXD devuelve un error
+
+        Returns:
+            str: Salida del comando o None si no se puede hacer con la
+                API
+        """
+        from . import lxd_api
+        try:
+            return lxd_api.execute(cmd)
+        except lxd_api.LxdApiError as err:
+            raise _error(cmd, " " + str(err))
+
+    def _execute(self, steps):
+        """Ejecuta los comandos de una operacion (ver _create...)"""
+        try:
+            cmd = next(steps)
+            while True:
+                try:
+                    output = self._run(cmd)
+                except LxcNetworkError as err:
+                    cmd = steps.throw(err)
+                else:
+                    cmd = steps.send(output)
+        except StopIteration:
+            pass
+
+    async def _execute_async(self, steps):
+        """Ejecuta los comandos de una operacion con asyncio"""
+        try:
+            cmd = next(steps)
+            while True:
+                try:
+                    output = await self._run_async(cmd)
+                except LxcNetworkError as err:
+                    cmd = steps.throw(err)
+                else:
+                    cmd = steps.send(output)
+        except StopIteration:
+            pass
   
     def add_container(self, cs_name:str):
         """Añade un contenedor a la red del bridge
@@ -60,32 +146,61 @@ class Bridge:
         Args:
             cs_name (str): Nombre del contenedor a añadir
         """
-        cmd = [
+        self._execute(self._add_container(cs_name))
+
+    async def add_container_async(self, cs_name:str):
+        """Igual que add_container pero con asyncio"""
+        await self._execute_async(self._add_container(cs_name))
+
+    def _add_container(self, cs_name:str):
+        yield [
             "lxc", "network", "attach" ,
             self.name, cs_name, self.ethernet
         ]
-        self._run(cmd)
         self.used_by.append(cs_name)
     
     def create(self):
-        """Crea el bridge y si ya esta creado o se ha creado
-        con exito tambien lo configura"""
+        """Crea el bridge con su configuracion en una sola llamada. Si
+        ya estaba creado actualiza su configuracion (solo las claves
+        que hayan cambiado) y lanza el error de que ya existe
+
+        Raises:
+            LxcNetworkError: Si no se puede crear o ya existia
+        """
+        self._execute(self._create())
+
+    async def create_async(self):
+        """Igual que create pero con asyncio"""
+        await self._execute_async(self._create())
+
+    def _create(self):
+        config = [f"{key}={value}" for key, value in self._config().items()]
         try:
-            self._run(["lxc", "network", "create", self.name])
+            yield ["lxc", "network", "create", self.name] + config
         except LxcNetworkError as err:
             err_msg = str(err)
             if "already exists" in err_msg:
-                self._configure_ips()
+                yield from self._configure_ips()
             raise LxcNetworkError(err)
-        else:
-            self._configure_ips()
-                
+
     def _configure_ips (self):
-        set_ = ["lxc", "network", "set", self.name] 
-        self._run(set_ + ["ipv4.nat", self.ipv4_nat])
-        self._run(set_ + ["ipv4.address", self.ipv4_addr])
-        self._run(set_ + ["ipv6.nat", self.ipv6_nat])
-        self._run(set_ + ["ipv6.address", self.ipv6_addr])
+        """Lee la configuracion actual del bridge y modifica en una
+        sola llamada las claves que no coinciden con las del objeto"""
+        output = yield ["lxc", "network", "show", self.name]
+        current = _parse_config(output)
+        changed = [
+            f"{key}={value}" for key, value in self._config().items()
+            if current.get(key) != value
+        ]
+        if len(changed) > 0:
+            yield ["lxc", "network", "set", self.name] + changed
+
+    def _config(self) -> dict:
+        """Devuelve la configuracion de lxc del bridge"""
+        return {
+            "ipv4.nat": self.ipv4_nat, "ipv4.address": self.ipv4_addr,
+            "ipv6.nat": self.ipv6_nat, "ipv6.address": self.ipv6_addr
+        }
     
     def delete(self):
         """Elimina el bridge
@@ -94,9 +209,15 @@ class Bridge:
             LxcNetworkError: Si el bridge esta siendo usado por
                 algun contenedor
         """
+        self._execute(self._delete())
+
+    async def delete_async(self):
+        """Igual que delete pero con asyncio"""
+        await self._execute_async(self._delete())
+
+    def _delete(self):
         if len(self.used_by) == 0:
-            cmd = ["lxc", "network", "delete", self.name]
-            self._run(cmd)
+            yield ["lxc", "network", "delete", self.name]
         else:
             err = (f" El bridge '{self.name}' esta siendo usado " +
                   f"por: {self.used_by} y no se puede eliminar")
@@ -105,6 +226,28 @@ class Bridge:
     def __str__(self):
         return self.name
 
+# --------------------------------------------------------------------
+def _parse_config(show_output:str) -> dict:
+    """Obtiene la seccion 'config' de la salida de 'lxc network show'
+    (yaml). Los valores se devuelven como strings sin comillas"""
+    config = {}
+    in_config = False
+    for line in show_output.splitlines():
+        if not line.startswith(" "):
+            in_config = line.strip() == "config:"
+            continue
+        if in_config and ":" in line:
+            key, _, value = line.strip().partition(":")
+            config[key] = value.strip().strip("\"'")
+    return config
+
+def _error(cmd:list, reason:str) -> "LxcNetworkError":
+    """Devuelve el error de un comando de lxc que ha fallado"""
+    err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
+                    "Mensaje de error de lxc: ->")
+    err_msg += reason
+    return LxcNetworkError(err_msg)
+
 # --------------------------------------------------------------------
 class LxcNetworkError(Exception):
     """Excepcion personalizada para los errores al manipular 
@@ -1,6 +1,8 @@
 
+import os
+import shlex
+import tempfile
 import subprocess
-from contextlib import suppress
 
 
 # Posibles estados de los contenedores
@@ -10,6 +12,17 @@ FROZEN = "FROZEN"
 RUNNING = "RUNNING"
 DELETED = "DELETED"
 
+# --------------------------------------------------------------------
+# Cada operacion sobre el contenedor se define una sola vez como un
+# generador (_init, _start...) que comprueba el estado, va devolviendo
+# los comandos de lxc a ejecutar y actualiza el contenedor cuando
+# estos terminan. Si un comando falla se lanza el error dentro del
+# generador (en el yield), por lo que se comporta igual que si lo
+# hubiera ejecutado el mismo. Asi se puede ejecutar cada operacion de
+# forma bloqueante (init, start...) o con asyncio (init_async,
+# start_async...) para manejar varios contenedores a la vez desde un
+# mismo bucle de eventos
+# --------------------------------------------------------------------
 class Container:
     """Clase envoltorio que permite controlar un contenedor de lxc
 
@@ -19,19 +32,24 @@ class Container:
                 el contenedor
             tag (str, optional): Tag para diferenciar la funcionalidad
                 de cada contenedor
+            profiles (list, optional): Perfiles de lxc que se le 
+                aplican al crearlo (ademas del perfil 'default')
         """
-    def __init__(self, name:str, container_image:str, tag:str=""):
+    def __init__(self, name:str, container_image:str, tag:str="",
+                 profiles:list=None):
         
         self.name = str(name)
         self.container_image = container_image
         self.state = NOT_INIT
         self.tag = tag
         self.networks = {}
+        self.profiles = list(profiles) if profiles != None else []
         
     def _run(self, cmd:list):
         """Ejecuta un comando mediante subprocess y controla los 
         errores que puedan surgir. Espera a que termine el proceso
-        (Llamada bloqueante)
+        (Llamada bloqueante). Si esta activada la API de LXD el
+        comando se hace con una peticion a la API (ver lxd_api)
 
         Args:
             cmd (list): Comando a ejecutar
@@ -39,6 +57,10 @@ class Container:
         Raises:
             LxcError: Si surge algun error ejecutando el comando
         """
+        # Se importa aqui para no cargarlo al leer el registro
+        from . import lxd_api
+        if lxd_api.enabled() and self._run_api(cmd) != None:
+            return
         process = subprocess.run(
             cmd, 
             stderr=subprocess.PIPE,
@@ -46,11 +68,77 @@ class Container:
         )
         outcome = process.returncode
         if outcome != 0:
-            err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
-                            "Mensaje de error de lxc: ->")
-            err_msg += process.stderr.decode().strip()[6:]
-            raise LxcError(err_msg)    
+            raise _error(cmd, process.stderr.decode().strip()[6:])
         
+    async def _run_async(self, cmd:list):
+        """Igual que _run pero sin bloquear el bucle de eventos
+
+        Args:
+            cmd (list): Comando a ejecutar
+
+        Raises:
+            LxcError: Si surge algun error ejecutando el comando
+        """
+        # Se importan aqui para no cargarlos si no se usan
+        import asyncio
+        from . import lxd_api
+        if lxd_api.enabled():
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, self._run_api, cmd) != None:
+                return
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stderr=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise _error(cmd, stderr.decode().strip()[6:])
+
+    def _run_api(self, cmd:list) -> str:
+        """Ejecuta un comando con la API de LXD
+
+        Raises:
+            LxcError: Si LXD devuelve un error
+
+        Returns:
+            str: Salida del comando o None si no se puede hacer con la
+                API
+        """
+        from . import lxd_api
+        try:
+            return lxd_api.execute(cmd)
+        except lxd_api.LxdApiError as err:
+            raise _error(cmd, " " + str(err))
+
+    def _execute(self, steps):
+        """Ejecuta los comandos de una operacion (ver _start...)"""
+        try:
+            cmd = next(steps)
+            while True:
+                try:
+                    self._run(cmd)
+                except LxcError as err:
+                    cmd = steps.throw(err)
+                else:
+                    cmd = next(steps)
+        except StopIteration:
+            pass
+
+    async def _execute_async(self, steps):
+        """Ejecuta los comandos de una operacion con asyncio"""
+        try:
+            cmd = next(steps)
+            while True:
+                try:
+                    await self._run_async(cmd)
+                except LxcError as err:
+                    cmd = steps.throw(err)
+                else:
+                    cmd = next(steps)
+        except StopIteration:
+            pass
+
     def add_to_network(self, eth:str, with_ip:str):
         """Añade el contenedor a una subred con la ip especificada
 
@@ -58,11 +146,87 @@ class Container:
             eth (str): Subred a la que se quiere conectar
             with_ip (str): Ip que se quiere utilizar
         """
-        cmd = ["lxc","config","device","set", self.name,
+        self._execute(self._add_to_network(eth, with_ip))
+
+    async def add_to_network_async(self, eth:str, with_ip:str):
+        """Igual que add_to_network pero con asyncio"""
+        await self._execute_async(self._add_to_network(eth, with_ip))
+
+    def _add_to_network(self, eth:str, with_ip:str):
+        yield ["lxc","config","device","set", self.name,
                                         eth, "ipv4.address", with_ip]
-        self._run(cmd)
         self.networks[eth] = with_ip
 
+    def configure_network(self, network_config:str):
+        """Le pasa al contenedor la configuracion de red (netplan) que
+        tiene que aplicar cloud-init en el primer arranque. No hace
+        falta arrancarlo
+
+        Args:
+            network_config (str): Configuracion de red (yaml version 2)
+        """
+        self._execute(self._configure_network(network_config))
+
+    async def configure_network_async(self, network_config:str):
+        """Igual que configure_network pero con asyncio"""
+        await self._execute_async(self._configure_network(network_config))
+
+    def _configure_network(self, network_config:str):
+        yield ["lxc", "config", "set", self.name,
+                                    "user.network-config", network_config]
+
+    def run_command(self, *args:str):
+        """Ejecuta un comando dentro del contenedor (lxc exec)
+
+        Args:
+            args (str): Comando y sus argumentos
+
+        Raises:
+            LxcError: Si no esta arrancado o el comando falla
+        """
+        self._execute(self._run_command(args))
+
+    def _run_command(self, args:tuple):
+        if self.state != RUNNING:
+            err = (f" {self.tag} '{self.name}' esta " +
+                        f"'{self.state}' y no puede ejecutar comandos")
+            raise LxcError(err)
+        yield ["lxc", "exec", self.name, "--", *args]
+
+    def write_file(self, path:str, content:str):
+        """Escribe un fichero dentro del contenedor arrancado (sin
+        pasar por un fichero temporal en el host)
+
+        Args:
+            path (str): Ruta del fichero en el contenedor
+            content (str): Contenido del fichero
+
+        Raises:
+            LxcError: Si no esta arrancado o no se puede escribir
+        """
+        script = f"printf '%s' {shlex.quote(content)} > {shlex.quote(path)}"
+        self.run_command("sh", "-c", script)
+
+    def push_file(self, path:str, content:str):
+        """Copia un fichero dentro del contenedor (lxc file push). A
+        diferencia de write_file no hace falta que este arrancado. El
+        fichero temporal se crea en la carpeta temporal del sistema
+
+        Args:
+            path (str): Ruta del fichero en el contenedor
+            content (str): Contenido del fichero
+
+        Raises:
+            LxcError: Si no se puede copiar
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix="arso-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(content)
+            self._run(["lxc", "file", "push", tmp_path, self.name + path])
+        finally:
+            os.remove(tmp_path)
+
     def open_terminal(self):
         """Abre la terminal del contenedor (utiliza 
         xterm -> instalar)
@@ -80,26 +244,73 @@ class Container:
         ])
    
     def init(self):
-        """Crea el contenedor
+        """Crea el contenedor con sus perfiles (los limites de 
+        recursos se definen en los perfiles)
+
+        Raises:
+            LxcError: Si el contenedor ya se ha iniciado
+        """
+        self._execute(self._init())
+
+    async def init_async(self):
+        """Igual que init pero con asyncio"""
+        await self._execute_async(self._init())
+
+    def _init(self):
+        if self.state != NOT_INIT:
+            err = (f" {self.tag} '{self.name}' esta '{self.state}' " +
+                                "y no puede ser inicializado de nuevo")
+            raise LxcError(err)
+        cmd = ["lxc", "init", self.container_image, self.name]
+        if len(self.profiles) > 0:
+            for profile in ["default"] + self.profiles:
+                cmd += ["-p", profile]
+        yield cmd
+        self.state = STOPPED
+
+    def copy(self, source:str):
+        """Crea el contenedor como una copia de otro contenedor o de
+        una snapshot suya ('contenedor/snapshot'). Se copian tambien
+        sus perfiles y dispositivos. En pools de btrfs/zfs la copia
+        se hace con copy-on-write, por lo que es casi instantanea
+
+        Args:
+            source (str): Contenedor o snapshot a copiar
 
         Raises:
             LxcError: Si el contenedor ya se ha iniciado
         """
+        self._execute(self._copy(source))
+
+    async def copy_async(self, source:str):
+        """Igual que copy pero con asyncio"""
+        await self._execute_async(self._copy(source))
+
+    def _copy(self, source:str):
         if self.state != NOT_INIT:
             err = (f" {self.tag} '{self.name}' esta '{self.state}' " +
                                 "y no puede ser inicializado de nuevo")
             raise LxcError(err)
-        self._run(["lxc", "init", self.container_image, self.name])  
+        yield ["lxc", "copy", source, self.name]
         self.state = STOPPED
-        # Se limitan los recursos del contenedor 
-        limits = {
-            "cpu": ["limits.cpu.allowance", "40ms/200ms"], 
-            "memory": ["limits.memory", "1024MB"],
-            "cores": ["limits.cpu", "2"]
-        }
-        for l in limits: 
-            with suppress(LxcError):
-                self._run(["lxc", "config", "set", self.name] + limits[l])
+
+    def snapshot(self, snapshot_name:str):
+        """Guarda una snapshot del contenedor
+
+        Args:
+            snapshot_name (str): Nombre de la snapshot
+
+        Raises:
+            LxcError: Si el contenedor no esta creado
+        """
+        self._execute(self._snapshot(snapshot_name))
+
+    def _snapshot(self, snapshot_name:str):
+        if self.state in [NOT_INIT, DELETED]:
+            err = (f" {self.tag} '{self.name}' esta " +
+                        f"'{self.state}' y no se puede guardar una snapshot")
+            raise LxcError(err)
+        yield ["lxc", "snapshot", self.name, snapshot_name]
         
     def start(self):
         """Arranca el contenedor
@@ -108,6 +319,13 @@ class Container:
             LxcError: Si ya esta arrancado
             LxcError: Si no se puede arrancar
         """
+        self._execute(self._start())
+
+    async def start_async(self):
+        """Igual que start pero con asyncio"""
+        await self._execute_async(self._start())
+
+    def _start(self):
         if self.state == RUNNING:
             err = f" {self.tag} '{self.name}' ya esta arrancado"
             raise LxcError(err)
@@ -115,7 +333,7 @@ class Container:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser arrancado")
             raise LxcError(err)
-        self._run(["lxc", "start", self.name])  
+        yield ["lxc", "start", self.name]
         self.state = RUNNING
         
     def stop(self):
@@ -125,6 +343,13 @@ class Container:
             LxcError: Si ya esta parado
             LxcError: Si no puede pararse
         """
+        self._execute(self._stop())
+
+    async def stop_async(self):
+        """Igual que stop pero con asyncio"""
+        await self._execute_async(self._stop())
+
+    def _stop(self):
         if self.state == STOPPED:
             err = (f" {self.tag} '{self.name}' ya esta detenido")
             raise LxcError(err)
@@ -132,7 +357,7 @@ class Container:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser detenido")
             raise LxcError()
-        self._run(["lxc", "stop", self.name, "--force"])  
+        yield ["lxc", "stop", self.name, "--force"]
         self.state = STOPPED
         
     def delete(self):
@@ -141,11 +366,18 @@ class Container:
         Raises:
             LxcError: Si no esta parado 
         """
+        self._execute(self._delete())
+
+    async def delete_async(self):
+        """Igual que delete pero con asyncio"""
+        await self._execute_async(self._delete())
+
+    def _delete(self):
         if self.state != STOPPED:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser eliminado")
             raise LxcError(err)
-        self._run(["lxc", "delete", self.name])  
+        yield ["lxc", "delete", self.name]
         self.state = DELETED
     
     def pause(self):
@@ -155,6 +387,13 @@ class Container:
             LxcError: Si ya esta pausado
             LxcError: Si no se puede pausar
         """
+        self._execute(self._pause())
+
+    async def pause_async(self):
+        """Igual que pause pero con asyncio"""
+        await self._execute_async(self._pause())
+
+    def _pause(self):
         if self.state == FROZEN:
             err = (f" {self.tag} '{self.name}' ya esta pausado")
             raise LxcError(err)
@@ -162,7 +401,7 @@ class Container:
             err = (f" {self.tag} '{self.name}' esta " +
                         f"'{self.state}' y no puede ser pausado")
             raise LxcError(err)
-        self._run(["lxc", "pause", self.name])  
+        yield ["lxc", "pause", self.name]
         self.state = FROZEN
     
     def __str__(self):
@@ -174,6 +413,14 @@ class Container:
         """
         return self.name
     
+# --------------------------------------------------------------------
+def _error(cmd:list, reason:str) -> "LxcError":
+    """Devuelve el error de un comando de lxc que ha fallado"""
+    err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
+                    "Mensaje de error de lxc: ->")
+    err_msg += reason
+    return LxcError(err_msg)
+
 # --------------------------------------------------------------------        
 class LxcError(Exception):
     """Excepcion personalizada para los errores al manipular 
@@ -0,0 +1,103 @@
+
+import subprocess
+
+
+class Image:
+    """Clase envoltorio que permite controlar una imagen de lxc
+
+        Args:
+            alias (str): Alias o fingerprint de la imagen. Si la
+                imagen no esta en el almacen local se indica tambien
+                el remoto (p.ej ubuntu:18.04)
+        """
+    def __init__(self, alias:str):
+        self.alias = str(alias)
+        if ":" in self.alias:
+            self.remote, self.name = self.alias.split(":", 1)
+        else:
+            self.remote, self.name = None, self.alias
+        self.fingerprint = None
+
+    def _run(self, cmd:list) -> str:
+        """Ejecuta un comando mediante subprocess y controla los
+        errores que puedan surgir. Espera a que termine el proceso
+        (Llamada bloqueante)
+
+        Args:
+            cmd (list): Comando a ejecutar
+
+        Raises:
+            LxcImageError: Si surge algun error ejecutando el comando
+
+        Returns:
+            str: Salida del comando
+        """
+        process = subprocess.run(
+            cmd,
+            stderr=subprocess.PIPE,
+            stdout=subprocess.PIPE # Para que no salga en consola
+        )
+        if process.returncode != 0:
+            raise _error(cmd, process.stderr.decode().strip()[6:])
+        return process.stdout.decode()
+
+    def resolve(self) -> str:
+        """Obtiene el fingerprint al que apunta el alias de la imagen
+        (se consulta el remoto si lo tiene)
+
+        Raises:
+            LxcImageError: Si la imagen no existe
+
+        Returns:
+            str: Fingerprint de la imagen
+        """
+        output = self._run(["lxc", "image", "info", self.alias])
+        for line in output.splitlines():
+            key, _, value = line.partition(":")
+            if key.strip() == "Fingerprint":
+                self.fingerprint = value.strip()
+                return self.fingerprint
+        raise LxcImageError(f" No se ha podido obtener el fingerprint " +
+                                            f"de la imagen '{self.alias}'")
+
+    def is_local(self) -> bool:
+        """Indica si la imagen ya esta en el almacen local (hay que
+        haberla resuelto antes)"""
+        try:
+            self._run(["lxc", "image", "info", self.fingerprint])
+        except LxcImageError:
+            return False
+        return True
+
+    def copy_to_local(self):
+        """Copia la imagen de su remoto al almacen local para que los
+        contenedores se puedan crear sin volver a descargarla
+
+        Raises:
+            LxcImageError: Si la imagen no tiene remoto o no se puede
+                copiar
+        """
+        if self.remote == None:
+            err = (f" La imagen '{self.alias}' no esta en el almacen " +
+                                    "local y no tiene remoto del que copiarla")
+            raise LxcImageError(err)
+        source = f"{self.remote}:{self.fingerprint}"
+        self._run(["lxc", "image", "copy", source, "local:"])
+
+    def __str__(self):
+        return self.alias
+
+# --------------------------------------------------------------------
+def _error(cmd:list, reason:str) -> "LxcImageError":
+    """Devuelve el error de un comando de lxc que ha fallado"""
+    err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
+                    "Mensaje de error de lxc: ->")
+    err_msg += reason
+    return LxcImageError(err_msg)
+
+# --------------------------------------------------------------------
+class LxcImageError(Exception):
+    """Excepcion personalizada para los errores al manipular
+    imagenes de lxc"""
+    pass
+# --------------------------------------------------------------------
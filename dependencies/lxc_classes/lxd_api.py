@@ -0,0 +1,373 @@
+
+import os
+import json
+import threading
+from urllib.parse import quote
+
+# ----------------------- CLIENTE API REST LXD -----------------------
+# --------------------------------------------------------------------
+# Permite manejar contenedores y bridges hablando directamente con el
+# demonio de LXD a traves de su API REST (por el socket unix local) en
+# vez de lanzar un proceso 'lxc' para cada operacion. Las conexiones
+# HTTP se mantienen abiertas y se reutilizan entre peticiones (pool
+# de conexiones, una por hilo como maximo a la vez) y las operaciones
+# asincronas de LXD (start, stop, delete...) se esperan con el
+# endpoint /wait de la operacion.
+# Container y Bridge siguen generando los mismos comandos de lxc, este
+# modulo los traduce a peticiones de la API (execute). Los comandos que
+# no sabe traducir se siguen ejecutando con 'lxc'. El cliente HTTP
+# solo se carga la primera vez que se usa la API
+# --------------------------------------------------------------------
+
+# Rutas en las que se busca el socket de LXD (snap y paquete deb)
+SOCKET_PATHS = (
+    "/var/snap/lxd/common/lxd/unix.socket",
+    "/var/lib/lxd/unix.socket"
+)
+# Tiempo maximo (s) de espera de una peticion o de una operacion
+TIMEOUT = 120
+# Servidores de imagenes de los remotos por defecto de lxc
+REMOTES = {
+    "ubuntu": "https://cloud-images.ubuntu.com/releases",
+    "ubuntu-daily": "https://cloud-images.ubuntu.com/daily",
+    "images": "https://images.linuxcontainers.org"
+}
+# Configuracion del cliente {"enabled", "socket", "instances"}
+_config = {"enabled": False, "socket": None, "instances": None}
+# Conexiones libres del pool y bloqueo para manejarlas
+_pool = []
+_pool_lock = threading.Lock()
+# Clase de las conexiones (se crea al abrir la primera)
+_UnixConnection = None
+# --------------------------------------------------------------------
+def config_api(enabled:bool, socket_path:str=None):
+    """Activa o desactiva el uso de la API de LXD en vez del comando
+    lxc
+
+    Args:
+        enabled (bool): Si se usa la API
+        socket_path (str, optional): Ruta del socket de LXD. Si no se
+            indica se busca en SOCKET_PATHS (o se usa $LXD_DIR)
+    """
+    # Si no cambia nada se conservan las conexiones abiertas (p.ej
+    # entre las ordenes que ejecuta el demonio)
+    if _config["enabled"] == enabled and _config["socket"] == socket_path:
+        return
+    _config.update(enabled=enabled, socket=socket_path, instances=None)
+    close()
+
+def enabled() -> bool:
+    """Indica si esta activado el uso de la API"""
+    return _config["enabled"]
+
+def socket_path() -> str:
+    """Devuelve la ruta del socket de LXD que se va a usar"""
+    if _config["socket"] != None:
+        return _config["socket"]
+    if "LXD_DIR" in os.environ:
+        return os.path.join(os.environ["LXD_DIR"], "unix.socket")
+    for path in SOCKET_PATHS:
+        if os.path.exists(path):
+            return path
+    return SOCKET_PATHS[-1]
+
+def close():
+    """Cierra todas las conexiones del pool"""
+    with _pool_lock:
+        while len(_pool) > 0:
+            _pool.pop().close()
+
+# --------------------------------------------------------------------
+def execute(cmd:list) -> str:
+    """Ejecuta un comando de lxc mediante la API
+
+    Args:
+        cmd (list): Comando de lxc (p.ej ["lxc", "start", "s1"])
+
+    Raises:
+        LxdApiError: Si LXD devuelve un error
+
+    Returns:
+        str: Lo que mostraria el comando por pantalla (vacio en la
+            mayoria) o None si el comando no se puede traducir a la
+            API (no se ha ejecutado)
+    """
+    args = cmd[1:]
+    if cmd[:1] != ["lxc"] or len(args) == 0:
+        return None
+    if args[0] in _SUBCOMMANDS and len(args) > 1:
+        handler = _SUBCOMMANDS[args[0]].get(args[1])
+        args = args[2:]
+    else:
+        handler = _COMMANDS.get(args[0])
+        args = args[1:]
+    if handler == None:
+        return None
+    output = handler(*args)
+    return None if output == False else (output or "")
+
+def request(method:str, path:str, body:dict=None, headers:dict={}) -> tuple:
+    """Hace una peticion a la API de LXD. Si la respuesta es una
+    operacion asincrona espera a que termine
+
+    Args:
+        method (str): Metodo HTTP
+        path (str): Ruta (p.ej /1.0/instances)
+        body (dict, optional): Cuerpo de la peticion (se envia en JSON)
+        headers (dict, optional): Cabeceras adicionales
+
+    Raises:
+        LxdApiError: Si LXD devuelve un error
+
+    Returns:
+        tuple: (metadata de la respuesta, cabeceras de la respuesta)
+    """
+    status, response, resp_headers = _send(method, path, body, headers)
+    if response.get("type") == "error" or status >= 400:
+        raise LxdApiError(response.get("error", f"HTTP {status}"))
+    if response.get("type") == "async":
+        op = response["operation"]
+        _, waited, _ = _send("GET", f"{op}/wait?timeout={TIMEOUT}")
+        metadata = waited.get("metadata") or {}
+        if waited.get("type") == "error":
+            raise LxdApiError(waited.get("error"))
+        if metadata.get("status_code") != 200:
+            raise LxdApiError(metadata.get("err") or metadata.get("status"))
+        return metadata, resp_headers
+    return response.get("metadata"), resp_headers
+
+# --------------------------------------------------------------------
+def _init(image:str, name:str, *flags):
+    remote, alias = image.split(":", 1) if ":" in image else (None, image)
+    source = {"type": "image"}
+    body = {"name": name, "source": source}
+    profiles = [flags[i + 1] for i, flag in enumerate(flags[:-1]) if flag == "-p"]
+    if len(profiles) > 0:
+        body["profiles"] = profiles
+    if remote != None:
+        if remote not in REMOTES:
+            return False
+        source.update(
+            server=REMOTES[remote], protocol="simplestreams", mode="pull"
+        )
+    if _is_fingerprint(alias):
+        source["fingerprint"] = alias
+    else:
+        source["alias"] = alias
+    request("POST", _instances(), body)
+
+def _copy(source:str, name:str, *_):
+    if ":" in source:
+        return False
+    body = {"name": name, "source": {"type": "copy", "source": source}}
+    request("POST", _instances(), body)
+
+def _snapshot(name:str, snapshot_name:str, *_):
+    body = {"name": snapshot_name}
+    request("POST", _instances(name) + "/snapshots", body)
+
+def _state(action:str):
+    def change(name:str, *flags):
+        body = {"action": action, "timeout": 30, "force": "--force" in flags}
+        request("PUT", _instances(name) + "/state", body)
+    return change
+
+def _delete(name:str, *_):
+    request("DELETE", _instances(name))
+
+def _config_cmd(action:str, *args):
+    if action == "set" and len(args) == 3:
+        name, key, value = args
+        request("PATCH", _instances(name), {"config": {key: value}})
+    elif action == "device" and len(args) == 5 and args[0] == "set":
+        _, name, device, key, value = args
+        def change(instance:dict):
+            devices = instance["devices"]
+            if device not in devices:
+                expanded = instance.get("expanded_devices", {})
+                if device not in expanded:
+                    raise LxdApiError(f"Device doesn't exist: {device}")
+                devices[device] = dict(expanded[device])
+            devices[device][key] = value
+        _edit_instance(name, change)
+    else:
+        return False
+
+def _profile_create(name:str, *config):
+    body = {"name": name, "config": _key_values(config)}
+    request("POST", "/1.0/profiles", body)
+
+def _profile_set(name:str, *config):
+    body = {"config": _key_values(config)}
+    request("PATCH", f"/1.0/profiles/{quote(name)}", body)
+
+def _profile_delete(name:str):
+    request("DELETE", f"/1.0/profiles/{quote(name)}")
+
+def _network_create(name:str, *config):
+    body = {"name": name, "config": _key_values(config)}
+    request("POST", "/1.0/networks", body)
+
+def _network_set(name:str, *config):
+    body = {"config": _key_values(config)}
+    request("PATCH", f"/1.0/networks/{quote(name)}", body)
+
+def _network_show(name:str) -> str:
+    network, _ = request("GET", f"/1.0/networks/{quote(name)}")
+    lines = ["config:"]
+    for key, value in sorted(network.get("config", {}).items()):
+        lines.append(f"  {key}: {value}")
+    lines.append(f"name: {network.get('name', name)}")
+    return "\n".join(lines) + "\n"
+
+def _network_attach(network:str, name:str, device:str=None, *_):
+    device = network if device == None else device
+    def change(instance:dict):
+        instance["devices"][device] = {
+            "type": "nic", "nictype": "bridged",
+            "parent": network, "name": device
+        }
+    _edit_instance(name, change)
+
+def _network_delete(name:str):
+    request("DELETE", f"/1.0/networks/{quote(name)}")
+
+# Traduccion de los comandos de lxc soportados
+_COMMANDS = {
+    "init": _init,
+    "copy": _copy,
+    "snapshot": _snapshot,
+    "start": _state("start"),
+    "stop": _state("stop"),
+    "pause": _state("freeze"),
+    "delete": _delete,
+    "config": _config_cmd
+}
+_SUBCOMMANDS = {
+    "network": {
+        "create": _network_create,
+        "set": _network_set,
+        "show": _network_show,
+        "attach": _network_attach,
+        "delete": _network_delete
+    },
+    "profile": {
+        "create": _profile_create,
+        "set": _profile_set,
+        "delete": _profile_delete
+    }
+}
+
+# --------------------------------------------------------------------
+def _instances(name:str=None) -> str:
+    """Devuelve la ruta de los contenedores en la API (las versiones
+    antiguas de LXD usan /1.0/containers en vez de /1.0/instances)"""
+    if _config.get("instances") == None:
+        server, _ = request("GET", "/1.0")
+        extensions = server.get("api_extensions", [])
+        _config["instances"] = "instances" if "instances" in extensions else "containers"
+    path = "/1.0/" + _config["instances"]
+    return path if name == None else f"{path}/{quote(name)}"
+
+def _edit_instance(name:str, change):
+    """Lee la configuracion de un contenedor, la modifica con la
+    funcion change y la vuelve a escribir (con su ETag para no pisar
+    cambios que se hayan hecho entre medias)"""
+    path = _instances(name)
+    instance, headers = request("GET", path)
+    change(instance)
+    writable = {
+        key: instance[key] for key in
+        ("architecture", "config", "devices", "ephemeral",
+         "profiles", "description")
+        if key in instance
+    }
+    etag = headers.get("ETag")
+    request("PUT", path, writable, {"If-Match": etag} if etag else {})
+
+def _key_values(args:tuple) -> dict:
+    """Pasa los argumentos de 'lxc ... set/create' a un diccionario.
+    Admite la forma 'clave=valor ...' y la antigua 'clave valor'"""
+    if len(args) == 2 and "=" not in args[0]:
+        return {args[0]: args[1]}
+    config = {}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        config[key] = value
+    return config
+
+def _is_fingerprint(image:str) -> bool:
+    return len(image) >= 12 and all(ch in "0123456789abcdef" for ch in image)
+
+# --------------------------------------------------------------------
+def _send(method:str, path:str, body:dict=None, headers:dict={}) -> tuple:
+    """Envia una peticion por una conexion del pool. Si la conexion
+    se habia cerrado (p.ej el demonio la ha cerrado por inactividad)
+    se reintenta una vez con una nueva
+
+    Returns:
+        tuple: (codigo HTTP, respuesta decodificada, cabeceras)
+    """
+    import http.client
+    data = None if body == None else json.dumps(body).encode()
+    headers = dict(headers)
+    if data != None:
+        headers["Content-Type"] = "application/json"
+    for attempt in range(2):
+        conn = _acquire()
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (ConnectionError, http.client.HTTPException) as err:
+            conn.close()
+            if attempt == 1:
+                raise LxdApiError(f"Connection with LXD failed: {err}")
+            continue
+        except OSError as err:
+            conn.close()
+            raise LxdApiError(f"Can't connect to LXD ({socket_path()}): {err}")
+        _release(conn)
+        try:
+            decoded = json.loads(payload) if len(payload) > 0 else {}
+        except ValueError:
+            decoded = {"type": "error", "error": payload.decode(errors="replace")}
+        return response.status, decoded, dict(response.getheaders())
+
+def _acquire() -> "_UnixConnection":
+    with _pool_lock:
+        if len(_pool) > 0:
+            return _pool.pop()
+    return _connection_class()(socket_path())
+
+def _release(conn:"_UnixConnection"):
+    with _pool_lock:
+        _pool.append(conn)
+
+def _connection_class() -> type:
+    """Devuelve la clase de las conexiones HTTP sobre un socket unix
+    (se define la primera vez para no importar http.client antes)"""
+    global _UnixConnection
+    if _UnixConnection == None:
+        import socket
+        import http.client
+
+        class UnixConnection(http.client.HTTPConnection):
+            """Conexion HTTP sobre un socket unix"""
+            def __init__(self, path:str):
+                super().__init__("lxd", timeout=TIMEOUT + 10)
+                self.path = path
+
+            def connect(self):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                self.sock = sock
+        _UnixConnection = UnixConnection
+    return _UnixConnection
+
+# --------------------------------------------------------------------
+class LxdApiError(Exception):
+    """Excepcion personalizada para los errores de la API de LXD"""
+    pass
+# --------------------------------------------------------------------
@@ -0,0 +1,152 @@
+
+import json
+import threading
+import subprocess
+from time import monotonic
+
+from . import state
+from .state import LxcStateError
+
+# ------------------------ MONITOR DE EVENTOS ------------------------
+# --------------------------------------------------------------------
+# Permite esperar a que los contenedores tengan ip sin tener que
+# consultar lxc cada poco tiempo. Se escucha el flujo de eventos de
+# LXD (lxc monitor) en un hilo y cuando llegan eventos se comprueba si
+# ya se cumple la condicion. Los eventos suelen llegar en rafagas (al
+# arrancar varios contenedores a la vez), por lo que se espera a que
+# pase DEBOUNCE sin eventos nuevos antes de volver a consultar lxc.
+# Como LXD no genera eventos cuando un contenedor obtiene su ip por
+# DHCP, ademas se vuelve a comprobar cada cierto tiempo (cada vez mas
+# espaciado, hasta MAX_INTERVAL). Si no se puede escuchar el flujo de
+# eventos solo se hacen estas comprobaciones
+# No hace falta esperar a que el sistema de ficheros del contenedor
+# este listo: la red se configura con cloud-init antes del primer
+# arranque (ver containers.configure_netfile) y la ip de una ethernet
+# solo aparece cuando el contenedor ya ha arrancado y aplicado netplan
+# --------------------------------------------------------------------
+
+# Tiempo (s) entre comprobaciones al empezar a esperar y maximo
+MIN_INTERVAL = 0.1
+MAX_INTERVAL = 1
+# Tiempo (s) sin eventos nuevos que se espera antes de comprobar la
+# condicion despues de un evento
+DEBOUNCE = 0.05
+# --------------------------------------------------------------------
+class Monitor:
+    """Escucha los eventos de LXD y permite esperar a que se cumplan
+    condiciones sobre los contenedores con un tiempo limite. Se usa
+    como context manager (with Monitor() as monitor: ...)
+    """
+    def __init__(self):
+        self._process = None
+        self._thread = None
+        self._events = 0
+        self._cond = threading.Condition()
+
+    def start(self):
+        """Empieza a escuchar los eventos de ciclo de vida de LXD"""
+        try:
+            self._process = subprocess.Popen(
+                ["lxc", "monitor", "--type=lifecycle", "--format=json"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError:
+            return
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Deja de escuchar los eventos (se cierra la tuberia de lxc
+        monitor, si no se quedaria abierta en el demonio)"""
+        if self._process != None:
+            self._process.terminate()
+            self._process.wait()
+            self._thread.join()
+            self._process.stdout.close()
+            self._process, self._thread = None, None
+
+    def _listen(self):
+        """Lee los eventos de lxc monitor (uno por linea) y despierta
+        a los que estan esperando"""
+        for line in self._process.stdout:
+            try:
+                json.loads(line)
+            except ValueError:
+                continue
+            with self._cond:
+                self._events += 1
+                self._cond.notify_all()
+
+    def wait(self, condition, timeout:float) -> bool:
+        """Espera a que se cumpla una condicion
+
+        Args:
+            condition (function): Funcion sin argumentos que devuelve
+                si se cumple la condicion
+            timeout (float): Tiempo maximo de espera (s)
+
+        Returns:
+            bool: Si se ha cumplido antes del tiempo limite
+        """
+        deadline = monotonic() + timeout
+        interval = MIN_INTERVAL
+        while True:
+            # Los eventos que lleguen mientras se comprueba la
+            # condicion tambien despiertan la siguiente espera
+            with self._cond:
+                events = self._events
+            if condition():
+                return True
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._events != events,
+                    timeout=min(interval, remaining)
+                )
+                # Se espera a que termine la rafaga de eventos
+                while self._events != events and monotonic() < deadline:
+                    events = self._events
+                    self._cond.wait_for(
+                        lambda: self._events != events,
+                        timeout=min(DEBOUNCE, deadline - monotonic())
+                    )
+            interval = min(interval*2, MAX_INTERVAL)
+
+    def wait_ipv4(self, networks:dict, timeout:float) -> bool:
+        """Espera a que los contenedores tengan ip en sus ethernets
+
+        Args:
+            networks (dict): {nombre del contenedor: [ethernets]}
+                (p.ej {"lb": ["eth0", "eth1"]})
+            timeout (float): Tiempo maximo de espera (s)
+
+        Returns:
+            bool: Si todas las ips han aparecido a tiempo
+        """
+        def condition():
+            current = _instances()
+            return all(
+                name in current and eth in current[name].ipv4
+                for name, eths in networks.items() for eth in eths
+            )
+        return self.wait(condition, timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+# --------------------------------------------------------------------
+def _instances() -> dict:
+    """Devuelve el estado actual de los contenedores (vacio si no se
+    ha podido consultar, para volver a intentarlo mas tarde)"""
+    try:
+        return state.instances()
+    except LxcStateError:
+        return {}
+# --------------------------------------------------------------------
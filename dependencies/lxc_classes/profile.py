@@ -0,0 +1,102 @@
+import subprocess
+
+class Profile:
+    """Clase envoltorio que permite controlar un perfil de lxc. Un
+    perfil agrupa configuracion (p.ej limites de recursos) que se
+    aplica a todos los contenedores que lo usan
+
+        Args:
+            name (str): Nombre del perfil
+            config (dict, optional): Configuracion del perfil
+                {clave: valor} (p.ej {"limits.memory": "1024MB"})
+        """
+    def __init__(self, name:str, config:dict=None):
+        self.name = str(name)
+        self.config = dict(config) if config != None else {}
+
+    def _run(self, cmd:list):
+        """Ejecuta un comando mediante subprocess y controla los
+        errores que puedan surgir. Espera a que termine el proceso
+        (Llamada bloqueante). Si esta activada la API de LXD el
+        comando se hace con una peticion a la API (ver lxd_api)
+
+        Args:
+            cmd (list): Comando a ejecutar
+
+        Raises:
+            LxcProfileError: Si surge algun error ejecutando el comando
+        """
+        # Se importa aqui para no cargarlo al leer el registro
+        from . import lxd_api
+        if lxd_api.enabled():
+            try:
+                if lxd_api.execute(cmd) != None:
+                    return
+            except lxd_api.LxdApiError as err:
+                raise _error(cmd, " " + str(err))
+        process = subprocess.run(
+            cmd,
+            stderr=subprocess.PIPE,
+            stdout=subprocess.PIPE # Para que no salga en consola
+        )
+        if process.returncode != 0:
+            raise _error(cmd, process.stderr.decode().strip()[6:])
+
+    def create(self):
+        """Crea el perfil y le aplica su configuracion. Si ya existia
+        solo se actualiza la configuracion"""
+        try:
+            self._run(["lxc", "profile", "create", self.name])
+        except LxcProfileError as err:
+            if "already exists" not in str(err):
+                raise
+        self.set(self.config)
+
+    def set(self, config:dict):
+        """Modifica la configuracion del perfil con una sola llamada
+        (se aplica a la vez a todos los contenedores que lo usan)
+
+        Args:
+            config (dict): Claves a modificar {clave: valor}
+        """
+        if len(config) == 0:
+            return
+        cmd = ["lxc", "profile", "set", self.name]
+        self._run(cmd + [f"{key}={value}" for key, value in config.items()])
+        self.config.update(config)
+
+    def unset(self, keys:list):
+        """Elimina claves de la configuracion del perfil
+
+        Args:
+            keys (list): Claves a eliminar
+        """
+        for key in keys:
+            self._run(["lxc", "profile", "unset", self.name, key])
+            self.config.pop(key, None)
+
+    def delete(self):
+        """Elimina el perfil
+
+        Raises:
+            LxcProfileError: Si lo esta usando algun contenedor
+        """
+        self._run(["lxc", "profile", "delete", self.name])
+
+    def __str__(self):
+        return self.name
+
+# --------------------------------------------------------------------
+def _error(cmd:list, reason:str) -> "LxcProfileError":
+    """Devuelve el error de un comando de lxc que ha fallado"""
+    err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
+                    "Mensaje de error de lxc: ->")
+    err_msg += reason
+    return LxcProfileError(err_msg)
+
+# --------------------------------------------------------------------
+class LxcProfileError(Exception):
+    """Excepcion personalizada para los errores al manipular
+    perfiles de lxc"""
+    pass
+# --------------------------------------------------------------------
@@ -0,0 +1,246 @@
+
+from .container import Container
+from .bridge import Bridge
+
+# ----------------------- REGISTROS DE ESTADO ------------------------
+# --------------------------------------------------------------------
+# Proporciona una forma compacta de guardar el estado de los
+# contenedores y bridges. Cada objeto se pasa a un registro con
+# __slots__ (solo los datos, sin metodos ni __dict__) y una lista de
+# registros se codifica en binario con el siguiente formato:
+#   MAGIC | VERSION | tabla de strings | registros
+# Los strings (nombres, imagenes, tags, ips...) se guardan una sola
+# vez en la tabla y los registros los referencian por su indice. Los
+# enteros se codifican con longitud variable (varint). La version
+# permite leer registros guardados con formatos anteriores
+# --------------------------------------------------------------------
+
+# Cabecera de los datos codificados (no puede empezar por 0x80 para
+# no confundirse con un pickle)
+MAGIC = b"LXR"
+# Version actual del formato (2: los contenedores guardan sus perfiles)
+VERSION = 2
+# Tipos de registro
+CONTAINER = 1; BRIDGE = 2
+# Flags de los bridges
+_IPV4_NAT = 1; _IPV6_NAT = 2; _IPV4_ADDR = 4; _IPV6_ADDR = 8
+# --------------------------------------------------------------------
+class ContainerRecord:
+    """Estado de un contenedor (ver Container)"""
+    __slots__ = ("name", "container_image", "state", "tag", "networks",
+                 "profiles")
+    # Atributos de Container que se guardan en el registro
+    FIELDS = {"name", "container_image", "state", "tag", "networks",
+              "profiles"}
+
+    def __init__(self, name:str, container_image:str, state:str,
+                 tag:str, networks:dict, profiles:list):
+        self.name = name
+        self.container_image = container_image
+        self.state = state
+        self.tag = tag
+        self.networks = networks
+        self.profiles = profiles
+
+    @classmethod
+    def from_container(cls, c:Container) -> "ContainerRecord":
+        _check_fields(c, cls.FIELDS)
+        return cls(c.name, c.container_image, c.state, c.tag,
+                   dict(c.networks), list(getattr(c, "profiles", [])))
+
+    def to_container(self) -> Container:
+        c = Container(self.name, self.container_image, tag=self.tag,
+                      profiles=self.profiles)
+        c.state = self.state
+        c.networks = dict(self.networks)
+        return c
+
+class BridgeRecord:
+    """Estado de un bridge (ver Bridge). Las opciones ipv4_nat e
+    ipv6_nat se guardan como booleanos y las direcciones que no
+    existen ("none") como None"""
+    __slots__ = ("name", "ethernet", "ipv4_nat", "ipv4_addr",
+                 "ipv6_nat", "ipv6_addr", "used_by")
+    # Atributos de Bridge que se guardan en el registro
+    FIELDS = {"name", "ethernet", "ipv4_nat", "ipv4_addr",
+              "ipv6_nat", "ipv6_addr", "used_by"}
+
+    def __init__(self, name:str, ethernet:str, ipv4_nat:bool,
+                 ipv4_addr:str, ipv6_nat:bool, ipv6_addr:str,
+                 used_by:list):
+        self.name = name
+        self.ethernet = ethernet
+        self.ipv4_nat = ipv4_nat
+        self.ipv4_addr = ipv4_addr
+        self.ipv6_nat = ipv6_nat
+        self.ipv6_addr = ipv6_addr
+        self.used_by = used_by
+
+    @classmethod
+    def from_bridge(cls, b:Bridge) -> "BridgeRecord":
+        _check_fields(b, cls.FIELDS)
+        return cls(
+            b.name, b.ethernet,
+            b.ipv4_nat == "true", None if b.ipv4_addr == "none" else b.ipv4_addr,
+            b.ipv6_nat == "true", None if b.ipv6_addr == "none" else b.ipv6_addr,
+            list(b.used_by)
+        )
+
+    def to_bridge(self) -> Bridge:
+        b = Bridge(
+            self.name, self.ethernet,
+            ipv4_nat=self.ipv4_nat, ipv4_addr=self.ipv4_addr,
+            ipv6_nat=self.ipv6_nat, ipv6_addr=self.ipv6_addr
+        )
+        b.used_by = list(self.used_by)
+        return b
+
+# --------------------------------------------------------------------
+def encode(objs:list) -> bytes:
+    """Codifica una lista de contenedores y/o bridges
+
+    Args:
+        objs (list): Lista de objetos Container o Bridge
+
+    Raises:
+        TypeError: Si algun objeto no es un Container o un Bridge o
+            tiene atributos que el formato no contempla
+
+    Returns:
+        bytes: Datos codificados
+    """
+    records = []
+    for obj in objs:
+        if type(obj) == Container:
+            records.append(ContainerRecord.from_container(obj))
+        elif type(obj) == Bridge:
+            records.append(BridgeRecord.from_bridge(obj))
+        else:
+            raise TypeError(f" '{type(obj).__name__}' can't be encoded")
+    strings = {}
+    def index(s:str) -> int:
+        return strings.setdefault(str(s), len(strings))
+    body = bytearray()
+    _write_varint(body, len(records))
+    for r in records:
+        if type(r) == ContainerRecord:
+            body.append(CONTAINER)
+            for s in (r.name, r.container_image, r.state, r.tag):
+                _write_varint(body, index(s))
+            _write_varint(body, len(r.networks))
+            for eth, ip in r.networks.items():
+                _write_varint(body, index(eth))
+                _write_varint(body, index(ip))
+            _write_varint(body, len(r.profiles))
+            for profile in r.profiles:
+                _write_varint(body, index(profile))
+        else:
+            body.append(BRIDGE)
+            _write_varint(body, index(r.name))
+            _write_varint(body, index(r.ethernet))
+            flags = ((_IPV4_NAT if r.ipv4_nat else 0) |
+                     (_IPV6_NAT if r.ipv6_nat else 0) |
+                     (_IPV4_ADDR if r.ipv4_addr != None else 0) |
+                     (_IPV6_ADDR if r.ipv6_addr != None else 0))
+            body.append(flags)
+            for addr in (r.ipv4_addr, r.ipv6_addr):
+                if addr != None:
+                    _write_varint(body, index(addr))
+            _write_varint(body, len(r.used_by))
+            for c_name in r.used_by:
+                _write_varint(body, index(c_name))
+    data = bytearray(MAGIC)
+    data.append(VERSION)
+    _write_varint(data, len(strings))
+    for s in strings:
+        encoded = s.encode()
+        _write_varint(data, len(encoded))
+        data += encoded
+    return bytes(data + body)
+
+def decode(data:bytes) -> list:
+    """Decodifica una lista de contenedores y/o bridges
+
+    Args:
+        data (bytes): Datos generados por encode (de esta version o
+            de una anterior)
+
+    Raises:
+        ValueError: Si los datos no tienen el formato esperado
+
+    Returns:
+        list: Lista de objetos Container o Bridge
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(" Data was not encoded with 'records.encode'")
+    version = data[len(MAGIC)]
+    if version > VERSION:
+        raise ValueError(f" Records version {version} is not supported")
+    pos = len(MAGIC) + 1
+    n, pos = _read_varint(data, pos)
+    strings = []
+    for _ in range(n):
+        length, pos = _read_varint(data, pos)
+        strings.append(data[pos:pos + length].decode())
+        pos += length
+    def string() -> str:
+        nonlocal pos
+        i, pos = _read_varint(data, pos)
+        return strings[i]
+    objs = []
+    n, pos = _read_varint(data, pos)
+    for _ in range(n):
+        kind = data[pos]; pos += 1
+        if kind == CONTAINER:
+            name, image, state, tag = string(), string(), string(), string()
+            nets, pos = _read_varint(data, pos)
+            networks = {}
+            for _ in range(nets):
+                eth = string()
+                networks[eth] = string()
+            profiles = []
+            if version >= 2:
+                n_profiles, pos = _read_varint(data, pos)
+                profiles = [string() for _ in range(n_profiles)]
+            r = ContainerRecord(name, image, state, tag, networks, profiles)
+            objs.append(r.to_container())
+        elif kind == BRIDGE:
+            name, ethernet = string(), string()
+            flags = data[pos]; pos += 1
+            ipv4_addr = string() if flags & _IPV4_ADDR else None
+            ipv6_addr = string() if flags & _IPV6_ADDR else None
+            used, pos = _read_varint(data, pos)
+            used_by = [string() for _ in range(used)]
+            r = BridgeRecord(
+                name, ethernet, bool(flags & _IPV4_NAT), ipv4_addr,
+                bool(flags & _IPV6_NAT), ipv6_addr, used_by
+            )
+            objs.append(r.to_bridge())
+        else:
+            raise ValueError(f" Unknown record type {kind}")
+    return objs
+
+# --------------------------------------------------------------------
+def _check_fields(obj:object, fields:set):
+    """Comprueba que el objeto no tenga atributos que el formato no
+    guarda (se perderian al codificarlo)"""
+    extra = set(vars(obj)) - fields
+    if len(extra) > 0:
+        raise TypeError(f" Attributes {sorted(extra)} can't be encoded")
+
+def _write_varint(buf:bytearray, n:int):
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _read_varint(data:bytes, pos:int) -> tuple:
+    n, shift = 0, 0
+    while True:
+        byte = data[pos]; pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+# --------------------------------------------------------------------
@@ -0,0 +1,177 @@
+
+import json
+import subprocess
+
+# -------------------------- ESTADO DE LXC ---------------------------
+# --------------------------------------------------------------------
+# Lee el estado actual de los contenedores, networks y perfiles de lxc
+# a partir de 'lxc list --format json', 'lxc network list --format
+# json' y 'lxc profile list --format json' (no
+# depende del idioma ni del ancho de la tabla que muestra lxc) y lo
+# devuelve como registros con los datos ya convertidos, accesibles por
+# el nombre del contenedor o network
+# --------------------------------------------------------------------
+
+class InstanceState:
+    """Estado de un contenedor en lxc
+
+        Args:
+            name (str): Nombre del contenedor
+            status (str): Estado (RUNNING, STOPPED, FROZEN...)
+            ipv4 (dict): Ips globales de cada ethernet {eth: [ips]}
+                (solo aparecen las ethernets que tienen alguna)
+        """
+    __slots__ = ("name", "status", "ipv4")
+
+    def __init__(self, name:str, status:str, ipv4:dict):
+        self.name = name
+        self.status = status
+        self.ipv4 = ipv4
+
+class NetworkState:
+    """Estado de una network en lxc
+
+        Args:
+            name (str): Nombre de la network
+            type (str): Tipo (bridge, physical...)
+            managed (bool): Si la gestiona LXD
+            used_by (list): Nombres de los contenedores que la usan
+        """
+    __slots__ = ("name", "type", "managed", "used_by")
+
+    def __init__(self, name:str, type:str, managed:bool, used_by:list):
+        self.name = name
+        self.type = type
+        self.managed = managed
+        self.used_by = used_by
+
+# --------------------------------------------------------------------
+def instances() -> dict:
+    """Devuelve el estado de los contenedores de lxc
+
+    Raises:
+        LxcStateError: Si no se puede consultar lxc
+
+    Returns:
+        dict: {nombre: InstanceState}
+    """
+    return parse_instances(_run(["lxc", "list", "--format", "json"]))
+
+def networks() -> dict:
+    """Devuelve el estado de las networks de lxc
+
+    Raises:
+        LxcStateError: Si no se puede consultar lxc
+
+    Returns:
+        dict: {nombre: NetworkState}
+    """
+    return parse_networks(
+        _run(["lxc", "network", "list", "--format", "json"])
+    )
+
+def profiles() -> dict:
+    """Devuelve la configuracion de los perfiles de lxc
+
+    Raises:
+        LxcStateError: Si no se puede consultar lxc
+
+    Returns:
+        dict: {nombre: configuracion del perfil {clave: valor}}
+    """
+    return parse_profiles(
+        _run(["lxc", "profile", "list", "--format", "json"])
+    )
+
+# --------------------------------------------------------------------
+def parse_instances(text:str) -> dict:
+    """Convierte la salida de 'lxc list --format json' en registros
+
+    Args:
+        text (str): Salida del comando
+
+    Returns:
+        dict: {nombre: InstanceState}
+    """
+    states = {}
+    for instance in json.loads(text):
+        ipv4 = {}
+        for eth, info in ((instance.get("state") or {}).get("network")
+                                                        or {}).items():
+            ips = [
+                addr["address"] for addr in info.get("addresses", [])
+                if addr["family"] == "inet" and addr["scope"] == "global"
+            ]
+            if len(ips) > 0:
+                ipv4[eth] = ips
+        name = instance["name"]
+        states[name] = InstanceState(name, instance["status"].upper(), ipv4)
+    return states
+
+def parse_networks(text:str) -> dict:
+    """Convierte la salida de 'lxc network list --format json' en
+    registros
+
+    Args:
+        text (str): Salida del comando
+
+    Returns:
+        dict: {nombre: NetworkState}
+    """
+    states = {}
+    for network in json.loads(text):
+        # LXD devuelve las urls de los contenedores que la usan
+        # (p.ej /1.0/instances/s1?project=default)
+        used_by = [
+            url.split("?")[0].rstrip("/").split("/")[-1]
+            for url in network.get("used_by") or []
+        ]
+        name = network["name"]
+        states[name] = NetworkState(
+            name, network.get("type"), network.get("managed", False), used_by
+        )
+    return states
+
+def parse_profiles(text:str) -> dict:
+    """Convierte la salida de 'lxc profile list --format json' en un
+    diccionario
+
+    Args:
+        text (str): Salida del comando
+
+    Returns:
+        dict: {nombre: configuracion del perfil {clave: valor}}
+    """
+    return {
+        profile["name"]: dict(profile.get("config") or {})
+        for profile in json.loads(text)
+    }
+
+# --------------------------------------------------------------------
+def _run(cmd:list) -> str:
+    """Ejecuta un comando de lxc y devuelve su salida
+
+    Raises:
+        LxcStateError: Si el comando falla
+    """
+    try:
+        process = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except OSError as err:
+        raise LxcStateError(f" No se ha podido ejecutar {cmd}: {err}")
+    if process.returncode != 0:
+        err_msg = (f" Fallo al ejecutar el comando {cmd}.\n" +
+                    "Mensaje de error de lxc: ->" +
+                        process.stderr.decode().strip()[6:])
+        raise LxcStateError(err_msg)
+    return process.stdout.decode()
+
+# --------------------------------------------------------------------
+class LxcStateError(Exception):
+    """Excepcion personalizada para los errores al consultar el
+    estado de lxc"""
+    pass
+# --------------------------------------------------------------------
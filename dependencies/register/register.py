@@ -1,25 +1,268 @@
 
 import os
+import re
 import pickle
-from contextlib import suppress
+import shutil
+import threading
+from functools import wraps
+from contextlib import suppress, contextmanager
+try:
+    import fcntl
+except ImportError:
+    # Fuera de Linux no hay bloqueos entre procesos (el programa
+    # tampoco se puede ejecutar, ver check_enviroment)
+    fcntl = None
 
 # --------------------------- REGISTER  ------------------------------
 # --------------------------------------------------------------------
 # Modulo que proporciona funciones para almacenar objetos en forma
-# binaria. Se crea un fichero registro el cual contiene un diccionario
-# con tantas paginas como informacion se quiera guardar. En cada 
-# pagina, identificada con una clave (register_id) se encuentra la
-# informacion relacionada que se quiera guardar junta (una lista con 
-# objetos, otro diccionario u objetos o valores aislados). Es una 
-# forma de centralizar y facilitar la serializacion de objetos 
-# (guardar objetos de forma binaria y ordenada en un mismo fichero)
+# binaria. Se crea un registro con tantas paginas como informacion se
+# quiera guardar. En cada pagina, identificada con una clave
+# (register_id) se encuentra la informacion relacionada que se quiera
+# guardar junta (una lista con objetos, otro diccionario u objetos o
+# valores aislados). Es una forma de centralizar y facilitar la
+# serializacion de objetos (guardar objetos de forma binaria y
+# ordenada en un mismo sitio)
+# --------------------------------------------------------------------
+# El registro es una carpeta en la que cada pagina se guarda en su
+# propio fichero (shard). Un pequeño indice (manifest) relaciona cada
+# register_id con su fichero, de forma que cargar o actualizar una
+# pagina solo lee o escribe el fichero de esa pagina
+# --------------------------------------------------------------------
+# Para no reescribir una pagina entera en cada modificacion, los
+# cambios se añaden al final de un diario (journal) de la pagina como
+# entradas independientes. Al cargar la pagina se parte de la ultima
+# foto completa (snapshot) y se aplican encima las entradas del
+# diario. Reemplazar o eliminar un objeto de una lista (save_item,
+# remove_item) solo añade ese objeto o su nombre, no la lista entera.
+# El diario se compacta en una nueva foto completa cada cierto numero
+# de entradas o cuando ocupa mas que la propia foto
+# --------------------------------------------------------------------
+# Cada fichero ya decodificado se guarda en una cache del proceso
+# junto con su firma (inodo, tamaño y fecha de modificacion). Mientras
+# la firma no cambie, load() no vuelve a leer el fichero. Las
+# escrituras del propio proceso actualizan la cache. load() devuelve
+# una copia superficial de cada pagina (la lista, el diccionario...)
+# para que quien la modifique no cambie la cache sin guardar nada. Los
+# objetos de dentro si son los de la cache, por lo que cualquier cambio
+# sobre ellos se debe persistir con update()
+# --------------------------------------------------------------------
+# Con transaction() se pueden agrupar varias modificaciones. Los
+# cambios se acumulan en memoria y al salir del bloque se escriben
+# todos de una vez: primero las paginas modificadas en ficheros nuevos
+# y despues el indice, que es el que hace visibles los cambios. Si
+# surge una excepcion dentro del bloque no se escribe nada. El
+# registro no se bloquea mientras dura el bloque (que puede incluir
+# operaciones lentas de lxc), solo al escribir. En ese momento se
+# vuelven a leer las paginas modificadas y se repiten sobre ellas las
+# operaciones de la transaccion, asi no se pierde lo que otro proceso
+# haya cambiado mientras tanto en otros objetos de la misma pagina
+# (save_item, remove_item, update con dict_id...)
+# --------------------------------------------------------------------
+# Varios procesos pueden usar el registro a la vez. Las escrituras
+# toman un bloqueo exclusivo sobre un fichero de bloqueo (fcntl). Los
+# ficheros completos se escriben en un temporal que despues se
+# renombra, por lo que un proceso que se interrumpa nunca deja un
+# fichero a medio escribir, y los diarios solo crecen. Por eso las
+# lecturas no esperan a que termine quien esta escribiendo: comprueban
+# que los ficheros no han cambiado mientras los leian y solo si han
+# cambiado repiten la lectura con un bloqueo compartido
+# --------------------------------------------------------------------
+# Todo lo anterior corresponde al backend por defecto ("pickle"). El
+# registro tambien se puede guardar en una base de datos SQLite
+# (backend "sqlite", ver sqlite_backend.py). Las funciones publicas de
+# este modulo llaman a las del backend que este en uso y migrate()
+# permite pasar el registro de un backend a otro
+# --------------------------------------------------------------------
+# Por defecto el valor de cada pagina se serializa con pickle. Con
+# config_codec() se puede asociar a una pagina un codificador propio
+# para las listas que guarde (p.ej un formato binario mas compacto).
+# Los datos guardados con pickle se siguen pudiendo leer siempre, por
+# lo que añadir un codificador no rompe los registros existentes
 # --------------------------------------------------------------------
 
-# Ubicacion relativa del registro        
+# Ubicacion relativa del registro
 REL_PATH = ".register"
-# -------------------------------------------------------------------- 
+# Nombre del indice de paginas dentro de la carpeta del registro
+MANIFEST = "manifest"
+# Version del formato del indice
+MANIFEST_VERSION = 1
+# Extension del diario asociado a cada pagina
+JOURNAL_EXT = ".journal"
+# Numero de entradas del diario a partir del cual se compacta
+COMPACT_LIMIT = 64
+# Cabecera de las fotos de las paginas, va seguida de su generacion (8
+# bytes). Cada compactacion aumenta la generacion y las entradas del
+# diario guardan la de la foto sobre la que se escribieron, asi quien
+# lea una foto nueva con el diario viejo (todavia no se ha borrado)
+# no vuelve a aplicar entradas que la foto ya incluye. Las fotos sin
+# cabecera y las entradas sin generacion son de la generacion 0
+GEN_HEADER = b"LXG"
+# Cache de los ficheros decodificados del registro. Para cada ruta se
+# guarda su firma, el valor decodificado, las entradas del diario, los
+# bytes del diario que son validos (el resto es una entrada que se
+# quedo a medias) y la generacion de la foto
+_cache = {}
+# Contadores de aciertos y fallos de la cache
+_stats = {"hits": 0, "misses": 0}
+# Transaccion en curso (None si no hay ninguna)
+_transaction = None
+# Valor de las paginas que no existen dentro de una transaccion
+_MISSING = object()
+# Extension del fichero de bloqueo (esta fuera de la carpeta del
+# registro para que sobreviva a su eliminacion)
+LOCK_EXT = ".lock"
+# Estado del bloqueo que tiene este proceso sobre el registro
+_lock = {"fd": None, "depth": 0, "exclusive": False}
+# Bloqueo entre los hilos de este proceso (el de fcntl es por proceso
+# y el estado anterior, la cache y la transaccion son compartidos)
+_thread_lock = threading.RLock()
+# Backends disponibles
+BACKENDS = ("pickle", "sqlite")
+# Backend en uso. Si es None se usa el de la ultima migracion, que se
+# guarda en un fichero aparte (ver _saved_backend)
+BACKEND = None
+# Extension de la base de datos del backend sqlite
+SQLITE_EXT = ".db"
+# Extension del fichero donde se guarda el backend de la ultima
+# migracion (esta fuera de la carpeta del registro, como el de
+# bloqueo, para que no cambie aunque se elimine todo el registro)
+BACKEND_EXT = ".backend"
+# Extension con la que se aparta el registro de un unico fichero
+# (formato antiguo) mientras se convierte al formato actual
+LEGACY_EXT = ".legacy"
+# Codificadores de las paginas {register_id: (encode, decode)}
+_codecs = {}
+# --------------------------------------------------------------------
+@contextmanager
+def _file_lock(exclusive:bool=False):
+    """Bloquea el registro frente a otros procesos mientras dure el
+    bloque with. Es reentrante: si el proceso ya tiene el bloqueo no
+    se vuelve a pedir, y si tiene uno compartido y necesita uno
+    exclusivo lo amplia mientras dure el bloque
+
+    Args:
+        exclusive (bool, optional): Si es verdadero se pide un bloqueo
+            exclusivo (escritura), si no uno compartido (lectura)
+    """
+    if fcntl == None:
+        yield
+        return
+    held = _lock["depth"] > 0
+    if held and (_lock["exclusive"] or not exclusive):
+        _lock["depth"] += 1
+        try:
+            yield
+        finally:
+            _lock["depth"] -= 1
+        return
+    if not held:
+        parent = os.path.dirname(os.path.abspath(REL_PATH))
+        os.makedirs(parent, exist_ok=True)
+        _lock["fd"] = os.open(REL_PATH + LOCK_EXT, os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(_lock["fd"], fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    _lock["depth"] += 1
+    _lock["exclusive"] = exclusive
+    try:
+        yield
+    finally:
+        _lock["depth"] -= 1
+        if held:
+            # Se vuelve al bloqueo compartido que se tenia antes
+            fcntl.flock(_lock["fd"], fcntl.LOCK_SH)
+            _lock["exclusive"] = False
+        else:
+            fcntl.flock(_lock["fd"], fcntl.LOCK_UN)
+            os.close(_lock["fd"])
+            _lock["fd"] = None
+            _lock["exclusive"] = False
+
+def _sqlite():
+    """Devuelve el modulo del backend sqlite si es el que esta en uso
+    o None si se usa el backend pickle"""
+    backend = BACKEND if BACKEND != None else _saved_backend()
+    if backend == "pickle":
+        return None
+    import dependencies.register.sqlite_backend as sqlite_backend
+    return sqlite_backend
+
+def _saved_backend() -> str:
+    """Devuelve el backend de la ultima migracion. Si no se ha
+    guardado (registros migrados a sqlite antes de que se guardase) se
+    deduce de si existe la base de datos y se guarda, para que no se
+    vuelva a pickle cuando la base de datos se elimine"""
+    try:
+        with open(REL_PATH + BACKEND_EXT) as file:
+            backend = file.read().strip()
+    except FileNotFoundError:
+        if not os.path.isfile(REL_PATH + SQLITE_EXT):
+            return "pickle"
+        _save_backend("sqlite")
+        return "sqlite"
+    return backend if backend in BACKENDS else "pickle"
+
+def _save_backend(backend:str):
+    """Guarda el backend con el que se usa el registro"""
+    path = REL_PATH + BACKEND_EXT
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(backend)
+    os.replace(tmp_path, path)
+
+def _dispatch(exclusive:bool=False):
+    """Decorador de las funciones publicas del registro. Si hay una
+    transaccion en curso llama al metodo con el mismo nombre de la
+    transaccion, si el backend en uso es sqlite a la funcion con el
+    mismo nombre de ese backend y si no ejecuta la funcion con el
+    registro bloqueado (ver _file_lock) o, si solo lee, sin bloquearlo
+    (ver _read_committed). En todos los casos solo puede haber un hilo
+    del proceso dentro de las funciones del registro
+
+    Args:
+        exclusive (bool, optional): Si la funcion escribe en el
+            registro (necesita el bloqueo exclusivo)
+    """
+    def _decorator(func):
+        @wraps(func)
+        def dispatch(*args, **kwargs):
+            with _thread_lock:
+                if _transaction != None:
+                    method = getattr(_transaction, func.__name__)
+                    return method(*args, **kwargs)
+                backend = _sqlite()
+                if backend != None:
+                    return getattr(backend, func.__name__)(*args, **kwargs)
+                if not exclusive:
+                    return _read_committed(lambda: func(*args, **kwargs))
+                with _file_lock(exclusive=True):
+                    return func(*args, **kwargs)
+        return dispatch
+    return _decorator
+
+def _unlocked() -> bool:
+    """Indica si se esta leyendo el registro sin ningun bloqueo"""
+    return fcntl != None and _lock["depth"] == 0
+
+def _read_committed(reader):
+    """Ejecuta una lectura del registro sin bloquearlo. Si otro
+    proceso ha modificado algun fichero mientras se leia (_Changed) se
+    repite la lectura con el bloqueo compartido
+
+    Args:
+        reader (function): Funcion sin argumentos que lee el registro
+
+    Returns:
+        object: Lo que devuelva reader
+    """
+    if _unlocked():
+        with suppress(_Changed):
+            return reader()
+    with _file_lock():
+        return reader()
+
+# --------------------------------------------------------------------
 def config_location(path, name=".register"):
-    """Permite configurar la ubicacion del registro y su nombre. 
+    """Permite configurar la ubicacion del registro y su nombre.
     Por defecto se crea en la carpeta principal del proyecto
 
     Args:
@@ -28,8 +271,70 @@ def config_location(path, name=".register"):
     """
     global REL_PATH
     REL_PATH = path+name
+    clear_cache()
+
+def config_backend(backend:str=None):
+    """Permite configurar el backend con el que se guarda el registro.
+    No mueve el registro existente (para eso esta migrate)
+
+    Args:
+        backend (str, optional): "pickle", "sqlite" o None para usar
+            el de la ultima migracion
+
+    Raises:
+        RegisterError: Si el backend no existe
+    """
+    global BACKEND
+    if backend != None and backend not in BACKENDS:
+        raise RegisterError(f" backend '{backend}' does not exist")
+    BACKEND = backend
+    clear_cache()
+
+def config_codec(register_id:any, encode, decode):
+    """Asocia un codificador a una pagina del registro. Se usa para
+    guardar la pagina cuando es una lista (si falla al codificarla se
+    guarda con pickle)
+
+    Args:
+        register_id (any): Clave de la pagina
+        encode (function): Recibe una lista y devuelve bytes (que no
+            pueden empezar por 0x80 para no confundirse con pickle)
+        decode (function): Recibe los bytes y devuelve la lista
+    """
+    _codecs[register_id] = (encode, decode)
+    clear_cache()
 
-# --------------------------------------------------------------------    
+def current_backend() -> str:
+    """Devuelve el nombre del backend que esta en uso"""
+    return "pickle" if _sqlite() == None else "sqlite"
+
+def migrate(backend:str):
+    """Copia el registro al backend indicado, elimina el del backend
+    anterior y guarda el nuevo como el backend del registro (aunque
+    despues se quede vacio). Primero se escribe el nuevo, por lo que
+    si algo falla el registro original sigue intacto
+
+    Args:
+        backend (str): Backend al que se quiere migrar el registro
+
+    Raises:
+        RegisterError: Si el backend no existe
+    """
+    if backend not in BACKENDS:
+        raise RegisterError(f" backend '{backend}' does not exist")
+    previous = current_backend()
+    if previous == backend:
+        return
+    data = load()
+    config_backend(backend)
+    override(data if data != None else {})
+    _save_backend(backend)
+    config_backend(previous)
+    remove()
+    config_backend(None)
+
+# --------------------------------------------------------------------
+@_dispatch(exclusive=True)
 def add(register_id:any, obj:object):
     """Crea una nueva pagina del registro. Si el registro no existe
     lo crea
@@ -39,31 +344,31 @@ def add(register_id:any, obj:object):
         obj (object): Variable que se quiere almacenar
 
     Raises:
-        RegisterError: [description]
+        RegisterError: Si ya existe una pagina con ese id
     """
-    if not os.path.exists(REL_PATH):
-        register = {}
-    else:
-        register = load()
-    
-    if register_id in register:
-        raise RegisterError(" id -> '{}' is already used in the register")
-    else:
-        register[register_id] = obj
-        
-    with open(REL_PATH, "wb") as file:
-            pickle.dump(register, file)
+    pages = _read_manifest()
+    if pages == None:
+        pages = {}
+    if register_id in pages:
+        err_msg = f" id -> '{register_id}' is already used in the register"
+        raise RegisterError(err_msg)
+    shard = _new_shard_name(set(pages.values()), register_id)
+    os.makedirs(REL_PATH, exist_ok=True)
+    _compact(shard, obj, register_id)
+    pages[register_id] = shard
+    _write_manifest(pages)
 
-# -------------------------------------------------------------------- 
+# --------------------------------------------------------------------
+@_dispatch(exclusive=True)
 def update(register_id:any, obj:object, override:bool=True, dict_id:any=None):
     """Acualiza una pagina del registro
 
     Args:
         register_id (any): Clave que identifica a la pagina
-        obj (object): Objeto que se quiere almacenar 
+        obj (object): Objeto que se quiere almacenar
         override (bool, optional): Sobreescribe lo que hubiera
             guardado anteriormente
-        dict_id (any, optional): Sirve para indicar, en caso de que 
+        dict_id (any, optional): Sirve para indicar, en caso de que
             override=False y en la pagina del registro hubiera
             almacenado un diccionario, la clave para guardar dentro
             el objeto
@@ -72,41 +377,11 @@ def update(register_id:any, obj:object, override:bool=True, dict_id:any=None):
         RegisterError: Si la pagina no existe en el registro o hay
             algun fallo al añadir el objeto a la pagina
     """
-    register = load()
-    if register == None or register_id not in register:
-        err_msg = f" id -> '{register_id}' was not found in the register"
-        raise RegisterError(err_msg)
-    if override == True:
-        register[register_id] = obj
-    else:
-        value_saved = register[register_id]
-        if type(value_saved) == list:
-            value_saved.append(obj)
-        elif type(value_saved) == set:
-            value_saved.add(obj)
-        elif type(value_saved) == dict:
-            if dict_id != None:
-                value_saved[dict_id] = obj
-            else:
-                err_msg = (
-                    " A key is needed ('dict_id' property) for updating " + 
-                        "(without overriding) the dictionary saved in the " + 
-                            f"register with id '{register_id}'"
-                )
-                raise RegisterError(err_msg)
-        elif type(value_saved) == tuple:
-            err_msg = (
-                    " A tuple object needs to be override it " + 
-                    f"(change 'override' property)"
-                )
-            raise RegisterError(err_msg)
-        else:
-            array = [value_saved, obj]
-            register[register_id] = array
-    with open(REL_PATH, "wb") as file:
-        pickle.dump(register, file)   
+    op = "override" if override == True else "update"
+    _update_entry(register_id, (op, obj, dict_id))
 
-# --------------------------------------------------------------------     
+# --------------------------------------------------------------------
+@_dispatch(exclusive=False)
 def load(register_id:any=None) -> object:
     """Devuelve la informacion guardada en una pagina del registro.
     Si no se especifica ninguna se devuelve todo el registro
@@ -118,30 +393,54 @@ def load(register_id:any=None) -> object:
         object: Devuelve el objeto almacenado en la pagina (pueden
         ser tambien iterables)
     """
-    try:
-        with open(REL_PATH, "rb") as file:
-            register = pickle.load(file)
-        if register_id == None:
-            return register
-        else:
-            if register_id in register:
-                return register[register_id]
-            else:
-                return None
-    except FileNotFoundError:
+    return _load(register_id)
+
+def _load(register_id:any=None) -> object:
+    """Implementacion de load con el backend pickle (sin tener en
+    cuenta la transaccion en curso)"""
+    pages = _read_manifest()
+    if pages == None:
+        return None
+    if register_id == None:
+        register = {}
+        for page_id, shard in pages.items():
+            register[page_id] = _copy(_read_shard(shard, page_id))
+        return register
+    if register_id in pages:
+        return _copy(_read_shard(pages[register_id], register_id))
+    else:
         return None
 
-# -------------------------------------------------------------------- 
+# --------------------------------------------------------------------
+@_dispatch(exclusive=True)
 def override(register:dict):
-    """Sobreescribe el registro con un registro nuevo
+    """Sobreescribe el registro con un registro nuevo. Las paginas
+    nuevas se escriben en ficheros nuevos y los antiguos solo se
+    eliminan despues de escribir el indice, por lo que si se
+    interrumpe se conserva el registro anterior
 
     Args:
         register (dict): Registro nuevo
     """
-    with open(REL_PATH, "wb") as file:
-        pickle.dump(register, file)
+    if len(register) == 0:
+        _delete_files()
+        return
+    current = _read_manifest()
+    current = current if current != None else {}
+    os.makedirs(REL_PATH, exist_ok=True)
+    used = set(current.values())
+    pages = {}
+    for register_id, obj in register.items():
+        shard = _new_shard_name(used, register_id)
+        used.add(shard)
+        _compact(shard, obj, register_id)
+        pages[register_id] = shard
+    _write_manifest(pages)
+    for shard in set(current.values()):
+        _delete_shard(shard)
 
-# --------------------------------------------------------------------    
+# --------------------------------------------------------------------
+@_dispatch(exclusive=True)
 def remove(register_id:any=None):
     """Elimina una pagina del registro. Si no se especifica ninguna
     se elimina todo el registro
@@ -153,23 +452,779 @@ def remove(register_id:any=None):
         RegisterError: Si la pagina especificada no existe
     """
     if register_id != None:
-        register = load()
-        if register_id in register:
-            register.pop(register_id)
-            if len(register) == 0:
-                os.remove(REL_PATH)
-            else:
-                override(register)
-        else:
+        pages = _read_manifest()
+        if pages == None or register_id not in pages:
             raise RegisterError(f" id '{register_id}' was not found")
+        shard = pages.pop(register_id)
+        if len(pages) == 0:
+            _delete_files()
+            return
+        _write_manifest(pages)
+        _delete_shard(shard)
+    else:
+        _delete_files()
+
+# --------------------------------------------------------------------
+@_dispatch(exclusive=False)
+def load_item(register_id:any, name:str) -> object:
+    """Devuelve un objeto de una pagina que sea una lista de objetos,
+    buscandolo por su atributo 'name'
+
+    Args:
+        register_id (any): Clave de la pagina
+        name (str): Nombre del objeto
+
+    Returns:
+        object: El objeto o None si no existe
+    """
+    return _find(load(register_id), name)
+
+@_dispatch(exclusive=False)
+def find_items(register_id:any, tag:str) -> list:
+    """Devuelve los objetos de una pagina que sea una lista de objetos
+    cuyo atributo 'tag' coincida con el indicado
+
+    Args:
+        register_id (any): Clave de la pagina
+        tag (str): Tag de los objetos a buscar
+
+    Returns:
+        list: Objetos encontrados (puede estar vacia)
+    """
+    page = load(register_id)
+    if page == None:
+        return []
+    return [obj for obj in page if getattr(obj, "tag", None) == tag]
+
+@_dispatch(exclusive=True)
+def save_item(register_id:any, obj:object):
+    """Guarda un objeto en una pagina que sea una lista de objetos.
+    Si ya existe uno con el mismo nombre lo reemplaza y si no lo
+    añade al final. Si la pagina no existe la crea
+
+    Args:
+        register_id (any): Clave de la pagina
+        obj (object): Objeto a guardar (debe tener atributo 'name')
+    """
+    page = load(register_id)
+    if page == None:
+        add(register_id, [obj])
+    elif _find(page, obj.name) == None:
+        update(register_id, obj, override=False)
+    else:
+        _update_entry(register_id, ("replace", obj, None))
+
+@_dispatch(exclusive=True)
+def remove_item(register_id:any, name:str):
+    """Elimina un objeto de una pagina que sea una lista de objetos.
+    Si la pagina se queda vacia se elimina
+
+    Args:
+        register_id (any): Clave de la pagina
+        name (str): Nombre del objeto a eliminar
+    """
+    page = load(register_id)
+    if page == None or _find(page, name) == None:
+        return
+    if len(page) == 1:
+        remove(register_id)
+    else:
+        _update_entry(register_id, ("remove", name, None))
+
+# --------------------------------------------------------------------
+@contextmanager
+def transaction():
+    """Agrupa todas las modificaciones del registro que se hagan
+    dentro del bloque with y las escribe de una sola vez al salir. Si
+    se produce una excepcion que salga del bloque se descartan todos
+    los cambios. Las transacciones anidadas forman parte de la
+    transaccion exterior. Los hilos que usen el registro mientras
+    dura el bloque tambien forman parte de ella. El registro solo se
+    bloquea al escribir los cambios, que se aplican sobre lo que haya
+    guardado en ese momento (ver _Transaction.commit)
+    ej:
+        with register.transaction():
+            register.update(id1, obj1)
+            register.update(id2, obj2)
+    """
+    global _transaction
+    with _thread_lock:
+        nested = _transaction != None
+        if not nested:
+            _transaction = _Transaction(_sqlite())
+    if nested:
+        yield
+        return
+    try:
+        yield
+    except BaseException:
+        with _thread_lock:
+            _transaction = None
+        raise
+    with _thread_lock:
+        tx, _transaction = _transaction, None
+        tx.commit()
+
+# --------------------------------------------------------------------
+def cache_stats() -> dict:
+    """Devuelve el numero de aciertos y fallos de la cache del
+    registro en este proceso
+
+    Returns:
+        dict: diccionario con las claves 'hits' y 'misses'
+    """
+    return dict(_stats)
+
+def clear_cache():
+    """Vacia la cache del registro y reinicia sus contadores"""
+    _cache.clear()
+    _stats["hits"] = 0
+    _stats["misses"] = 0
+
+# --------------------------------------------------------------------
+# --------------------------------------------------------------------
+def _path(filename:str) -> str:
+    """Devuelve la ruta de un fichero dentro de la carpeta del
+    registro"""
+    return os.path.join(REL_PATH, filename)
+
+def _new_shard_name(used:set, register_id:any) -> str:
+    """Devuelve un nombre de fichero valido y no utilizado para
+    guardar una pagina nueva (se basa en el register_id)
+
+    Args:
+        used (set): Nombres de fichero que ya estan en uso
+        register_id (any): Clave de la pagina nueva
+
+    Returns:
+        str: Nombre del fichero de la pagina
+    """
+    base = re.sub(r"[^\w\-]", "_", str(register_id))[:64]
+    used = used | {MANIFEST}
+    name, j = base, 1
+    while name in used or name.endswith(JOURNAL_EXT):
+        name = f"{base}_{j}"
+        j += 1
+    return name
+
+def _update_entry(register_id:any, entry:tuple):
+    """Aplica una entrada sobre una pagina y la añade a su diario
+
+    Raises:
+        RegisterError: Si la pagina no existe en el registro o la
+            entrada no se puede aplicar
+    """
+    shard = _find_shard(register_id)
+    value = _copy(_read_shard(shard, register_id))
+    value = _apply(value, entry, register_id)
+    _append(shard, entry, value, register_id)
+
+def _find_shard(register_id:any) -> str:
+    """Devuelve el fichero en el que esta guardada una pagina
+
+    Raises:
+        RegisterError: Si la pagina no existe en el registro
+    """
+    pages = _read_manifest()
+    if pages == None or register_id not in pages:
+        err_msg = f" id -> '{register_id}' was not found in the register"
+        raise RegisterError(err_msg)
+    return pages[register_id]
+
+# --------------------------------------------------------------------
+def _signature(path:str) -> tuple:
+    """Devuelve la firma de un fichero del registro y de su diario
+    (inodo, tamaño y fecha de modificacion de cada uno)
+
+    Returns:
+        tuple: firma de los ficheros. Si un fichero no existe su
+            parte de la firma es None
+    """
+    signature = []
+    for p in (path, path + JOURNAL_EXT):
+        try:
+            st = os.stat(p)
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def _store(path:str, value:object, entries:int=0, generation:int=0):
+    """Guarda en la cache el valor que se acaba de escribir en un
+    fichero junto con su firma actual"""
+    signature = _signature(path)
+    valid = signature[1][1] if signature[1] != None else 0
+    _cache[path] = (signature, _copy(value), entries, valid, generation)
+
+def _read_file(path:str, register_id:any=None) -> tuple:
+    """Lee un fichero del registro (foto completa mas su diario)
+    pasando por la cache. Si la ultima entrada del diario no se puede
+    decodificar (el programa se interrumpio mientras se escribia) se
+    ignora y se guarda hasta donde llega la parte valida del diario,
+    para que _append la descarte antes de añadir nada detras. Las
+    entradas de otra generacion (de antes de compactar) se saltan
+
+    Args:
+        path (str): Ruta del fichero
+        register_id (any, optional): Pagina que guarda el fichero (para
+            usar su codificador). None para el indice
+
+    Returns:
+        tuple: (valor decodificado, entradas del diario) o None si el
+            fichero no existe
+    """
+    signature = _signature(path)
+    if signature[0] == None:
+        return None
+    cached = _cache.get(path)
+    if cached != None and cached[0] == signature:
+        _stats["hits"] += 1
+        return cached[1], cached[2]
+    _stats["misses"] += 1
+    try:
+        with open(path, "rb") as file:
+            generation, data = _split_generation(file.read())
+            value = _loads(register_id, data)
+    except FileNotFoundError:
+        if _unlocked():
+            raise _Changed()
+        raise
+    entries, valid = 0, 0
+    with suppress(FileNotFoundError):
+        with open(path + JOURNAL_EXT, "rb") as file:
+            while True:
+                try:
+                    entry = pickle.load(file)
+                except Exception:
+                    # Fin del diario o entrada cortada (una cabecera
+                    # corrupta puede dar MemoryError, ValueError...)
+                    break
+                entries += 1
+                valid = file.tell()
+                if (entry[3] if len(entry) > 3 else 0) != generation:
+                    # La foto ya la incluye
+                    continue
+                entry = _decode_entry(register_id, entry)
+                value = _apply(value, entry, register_id)
+    if _unlocked() and _signature(path) != signature:
+        # Otro proceso lo ha modificado mientras se leia
+        raise _Changed()
+    _cache[path] = (signature, value, entries, valid, generation)
+    return value, entries
+
+def _read_manifest() -> dict:
+    """Devuelve el indice del registro {register_id: fichero}. Si
+    existe un registro con el formato antiguo (un unico fichero) lo
+    convierte antes al formato actual
+
+    Returns:
+        dict: Indice del registro o None si no existe
+    """
+    if os.path.isfile(REL_PATH) or os.path.isfile(REL_PATH + LEGACY_EXT):
+        with _file_lock(exclusive=True):
+            if os.path.isfile(REL_PATH) or \
+                                    os.path.isfile(REL_PATH + LEGACY_EXT):
+                _migrate_single_file()
+    read = _read_file(_path(MANIFEST))
+    if read == None:
+        return None
+    return dict(read[0]["pages"])
+
+def _write_manifest(pages:dict):
+    """Escribe el indice del registro"""
+    path = _path(MANIFEST)
+    manifest = {"version": MANIFEST_VERSION, "pages": pages}
+    _write_file(path, manifest)
+    _store(path, manifest)
+
+def _read_shard(shard:str, register_id:any) -> object:
+    """Devuelve el valor guardado en el fichero de una pagina"""
+    read = _read_file(_path(shard), register_id)
+    if read == None and _unlocked():
+        # Otro proceso ha cambiado el indice despues de leerlo
+        raise _Changed()
+    return None if read == None else read[0]
+
+def _migrate_single_file():
+    """Convierte un registro guardado en un unico fichero (con o sin
+    diario) al formato de una carpeta con un fichero por pagina. El
+    fichero antiguo se aparta primero (la carpeta nueva usa su ruta) y
+    solo se elimina despues de escribir el indice, por lo que si se
+    interrumpe se vuelve a convertir la proxima vez"""
+    legacy, legacy_journal = REL_PATH + LEGACY_EXT, REL_PATH + JOURNAL_EXT
+    if os.path.isfile(REL_PATH):
+        # Primero el diario, si no podria quedar detras el de la ruta
+        # vieja al apartar el fichero
+        with suppress(FileNotFoundError):
+            os.replace(legacy_journal, legacy + JOURNAL_EXT)
+        os.replace(REL_PATH, legacy)
+    if not os.path.isfile(_path(MANIFEST)):
+        _convert_single_file(legacy)
+    for path in (legacy + JOURNAL_EXT, legacy):
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+def _convert_single_file(legacy:str):
+    """Escribe las paginas y el indice a partir del registro de un
+    unico fichero que se ha apartado en legacy"""
+    with open(legacy, "rb") as file:
+        register = pickle.load(file)
+    with suppress(FileNotFoundError):
+        with open(legacy + JOURNAL_EXT, "rb") as file:
+            while True:
+                try:
+                    op, register_id, obj, dict_id = pickle.load(file)
+                except Exception:
+                    break
+                if op == "add":
+                    register[register_id] = obj
+                elif op == "remove":
+                    register.pop(register_id, None)
+                elif register_id in register:
+                    register[register_id] = _apply(
+                        register[register_id], (op, obj, dict_id), register_id
+                    )
+    if len(register) == 0:
+        return
+    os.makedirs(REL_PATH, exist_ok=True)
+    pages = {}
+    for register_id, obj in register.items():
+        shard = _new_shard_name(set(pages.values()), register_id)
+        _compact(shard, obj, register_id)
+        pages[register_id] = shard
+    _write_manifest(pages)
+
+# --------------------------------------------------------------------
+def _apply(value:object, entry:tuple, register_id:any) -> object:
+    """Aplica una entrada del diario sobre el valor de una pagina
+
+    Args:
+        value (object): Valor actual de la pagina
+        entry (tuple): Entrada de la forma (operacion, objeto, dict_id).
+            Las operaciones "replace" y "remove" son sobre listas de
+            objetos con nombre (en "remove" el objeto es el nombre)
+        register_id (any): Clave de la pagina (para los errores)
+
+    Raises:
+        RegisterError: Si el cambio no se puede aplicar
+
+    Returns:
+        object: Nuevo valor de la pagina
+    """
+    op, obj, dict_id = entry
+    if op == "override":
+        return obj
+    if op in ("replace", "remove"):
+        if type(value) != list:
+            err_msg = (f" '{op}' needs a list of objects in the " +
+                                    f"register with id '{register_id}'")
+            raise RegisterError(err_msg)
+        name = obj.name if op == "replace" else obj
+        for i, saved in enumerate(value):
+            if getattr(saved, "name", None) == name:
+                if op == "replace":
+                    value[i] = obj
+                else:
+                    del value[i]
+                return value
+        if op == "replace":
+            value.append(obj)
+        return value
+    value_saved = value
+    if type(value_saved) == list:
+        value_saved.append(obj)
+    elif type(value_saved) == set:
+        value_saved.add(obj)
+    elif type(value_saved) == dict:
+        if dict_id != None:
+            value_saved[dict_id] = obj
+        else:
+            err_msg = (
+                " A key is needed ('dict_id' property) for updating " +
+                    "(without overriding) the dictionary saved in the " +
+                        f"register with id '{register_id}'"
+            )
+            raise RegisterError(err_msg)
+    elif type(value_saved) == tuple:
+        err_msg = (
+                " A tuple object needs to be override it " +
+                f"(change 'override' property)"
+            )
+        raise RegisterError(err_msg)
     else:
-        if os.path.exists(REL_PATH): 
-            os.remove(REL_PATH)
+        value_saved = [value_saved, obj]
+    return value_saved
+
+def _replay(value:object, entries:list, register_id:any) -> object:
+    """Repite las operaciones de una transaccion sobre una pagina
+
+    Args:
+        value (object): Valor que tiene la pagina al confirmar la
+            transaccion (_MISSING si no existe)
+        entries (list): Operaciones de la transaccion sobre la pagina.
+            Ademas de las del diario estan "add" (crear la pagina) y
+            "drop" (eliminarla)
+        register_id (any): Clave de la pagina
 
-# -------------------------------------------------------------------- 
+    Returns:
+        object: Nuevo valor de la pagina (_MISSING si no debe existir)
+    """
+    for entry in entries:
+        op = entry[0]
+        if op == "drop":
+            value = _MISSING
+        elif value is _MISSING:
+            if op != "remove":
+                value = _initial(entry)
+        elif op == "add":
+            value = _merge(value, entry[1], register_id)
+        else:
+            value = _apply(value, entry, register_id)
+            if op == "remove" and len(value) == 0:
+                # Igual que remove_item, la pagina vacia se elimina
+                value = _MISSING
+    return value
+
+def _initial(entry:tuple) -> object:
+    """Devuelve el valor de una pagina que no existe despues de
+    aplicarle una entrada (p.ej otro proceso la ha eliminado mientras
+    duraba la transaccion)"""
+    op, obj, dict_id = entry
+    if op in ("add", "override"):
+        return obj
+    if op == "update" and dict_id != None:
+        return {dict_id: obj}
+    return [obj]
+
+def _merge(value:object, obj:object, register_id:any) -> object:
+    """Junta una pagina que ha creado una transaccion con la que ha
+    creado otro proceso mientras tanto. Los diccionarios y las listas
+    de objetos con nombre se juntan objeto a objeto (ganan los de la
+    transaccion), el resto se sustituyen"""
+    if type(value) == dict and type(obj) == dict:
+        value.update(obj)
+        return value
+    if type(value) == list and type(obj) == list and \
+                all(getattr(o, "name", None) != None for o in obj):
+        for o in obj:
+            value = _apply(value, ("replace", o, None), register_id)
+        return value
+    return obj
+
+def _copy(value:object) -> object:
+    """Devuelve una copia superficial de las listas, diccionarios y
+    conjuntos (el resto de valores se devuelven tal cual)"""
+    if type(value) in (list, dict, set):
+        return value.copy()
+    return value
+
+def _dumps(register_id:any, value:object) -> bytes:
+    """Serializa el valor de una pagina. Si es una lista y la pagina
+    tiene codificador se usa este, si no se usa pickle"""
+    codec = _codecs.get(register_id)
+    if codec != None and type(value) == list:
+        with suppress(Exception):
+            return codec[0](value)
+    return pickle.dumps(value)
+
+def _loads(register_id:any, data:bytes) -> object:
+    """Deserializa el valor de una pagina guardado con _dumps
+
+    Raises:
+        RegisterError: Si los datos estan codificados y la pagina no
+            tiene codificador
+    """
+    if data[:1] == b"\x80":
+        return pickle.loads(data)
+    codec = _codecs.get(register_id)
+    if codec == None:
+        err_msg = f" id -> '{register_id}' needs a codec to be loaded"
+        raise RegisterError(err_msg)
+    return codec[1](data)
+
+def _split_generation(data:bytes) -> tuple:
+    """Separa la generacion de una foto de su contenido
+
+    Returns:
+        tuple: (generacion, datos para _loads)
+    """
+    if data[:len(GEN_HEADER)] != GEN_HEADER:
+        return 0, data
+    start = len(GEN_HEADER)
+    return int.from_bytes(data[start:start + 8], "big"), data[start + 8:]
+
+def _encode_entry(register_id:any, entry:tuple, generation:int) -> tuple:
+    """Prepara una entrada para escribirla en el diario. El objeto de
+    la entrada se serializa con _dumps (los objetos que se añaden a
+    una lista van dentro de una lista para poder usar el codificador).
+    En "remove" solo se guarda el nombre, tal cual. Al final se añade
+    la generacion de la foto sobre la que se escribe"""
+    op, obj, dict_id = entry
+    if op != "remove":
+        obj = _dumps(register_id, obj if op == "override" else [obj])
+    return op, obj, dict_id, generation
+
+def _decode_entry(register_id:any, entry:tuple) -> tuple:
+    """Deshace lo que hace _encode_entry (sin la generacion)"""
+    op, data, dict_id = entry[:3]
+    if type(data) != bytes:
+        return op, data, dict_id
+    obj = _loads(register_id, data)
+    return op, obj if op == "override" else obj[0], dict_id
+
+def _find(page:list, name:str) -> object:
+    """Busca un objeto por su nombre en una lista de objetos"""
+    if page == None:
+        return None
+    for obj in page:
+        if getattr(obj, "name", None) == name:
+            return obj
+    return None
+
+def _append(shard:str, entry:tuple, value:object, register_id:any):
+    """Añade una entrada al final del diario de una pagina. Si el
+    diario supera el limite de entradas (o ya ocupa mas que la foto
+    completa) se compacta la pagina. Si el diario termina en una
+    entrada cortada se recorta antes, si no la nueva quedaria detras y
+    ningun otro proceso la llegaria a leer (se debe llamar con el
+    bloqueo exclusivo)
+
+    Args:
+        shard (str): Fichero de la pagina
+        entry (tuple): Entrada a añadir
+        value (object): Valor de la pagina con la entrada ya aplicada
+            (se usa para compactar sin tener que volver a leerla)
+        register_id (any): Clave de la pagina
+    """
+    path = _path(shard)
+    cached = _cache.get(path)
+    if cached == None or cached[0] != _signature(path):
+        # Se vuelve a leer para saber donde acaba la parte valida
+        _read_file(path, register_id)
+        cached = _cache[path]
+    (snapshot, journal), _, entries, valid, generation = cached
+    journal_size = journal[1] if journal != None else 0
+    oversized = snapshot != None and journal_size > snapshot[1]
+    if entries + 1 >= COMPACT_LIMIT or oversized:
+        _compact(shard, value, register_id)
+        return
+    with open(path + JOURNAL_EXT, "ab") as file:
+        if journal_size > valid:
+            file.truncate(valid)
+        pickle.dump(_encode_entry(register_id, entry, generation), file)
+        file.flush()
+        os.fsync(file.fileno())
+    _store(path, value, entries + 1, generation)
+
+def _compact(shard:str, value:object, register_id:any):
+    """Guarda una foto completa de una pagina y vacia su diario. La
+    foto nueva es de la generacion siguiente, por lo que el diario
+    viejo ya no se aplica aunque alguien lo lea antes de que se borre
+
+    Args:
+        shard (str): Fichero de la pagina
+        value (object): Valor completo de la pagina
+        register_id (any): Clave de la pagina
+    """
+    path = _path(shard)
+    generation = 0
+    with suppress(FileNotFoundError):
+        with open(path, "rb") as file:
+            generation, _ = _split_generation(file.read(len(GEN_HEADER) + 8))
+    generation += 1
+    _write_file(path, value, register_id, generation)
+    with suppress(FileNotFoundError):
+        os.remove(path + JOURNAL_EXT)
+    _store(path, value, generation=generation)
+
+def _write_file(path:str, value:object, register_id:any=None,
+                                                generation:int=None):
+    """Escribe un fichero completo del registro. Se escribe primero
+    en un fichero temporal y luego se renombra para que nunca quede
+    a medio escribir. Si se indica la generacion se escribe delante
+    (solo en las fotos de las paginas)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        if generation != None:
+            file.write(GEN_HEADER + generation.to_bytes(8, "big"))
+        file.write(_dumps(register_id, value))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+def _delete_shard(shard:str):
+    """Elimina el fichero de una pagina y su diario"""
+    for path in (_path(shard), _path(shard) + JOURNAL_EXT):
+        with suppress(FileNotFoundError):
+            os.remove(path)
+        _cache.pop(path, None)
+
+def _delete_files():
+    """Elimina la carpeta del registro con todas sus paginas"""
+    if os.path.isdir(REL_PATH):
+        shutil.rmtree(REL_PATH)
+    _cache.clear()
+
+# --------------------------------------------------------------------
+class _Transaction:
+    """Acumula en memoria los cambios de una transaccion del registro.
+    Ofrece los mismos metodos que las funciones publicas del registro
+    y guarda las operaciones que se hacen sobre cada pagina para
+    repetirlas al confirmarla
+
+        Args:
+            backend (module): Backend sqlite o None si se usa pickle
+        """
+    def __init__(self, backend):
+        self.backend = backend
+        # Valor de las paginas que se han leido o modificado dentro de
+        # la transaccion (_MISSING si no existen)
+        self.values = {}
+        # Operaciones sobre cada pagina {register_id: [entrada, ...]}
+        self.entries = {}
+        # Si se ha sustituido el registro entero (override o remove)
+        self.reset = False
+
+    def load(self, register_id:any=None) -> object:
+        if register_id != None:
+            value = self._value(register_id)
+            return None if value is _MISSING else _copy(value)
+        committed = {} if self.reset else self._committed()
+        committed = committed if committed != None else {}
+        loaded = {}
+        for page_id in list(committed) + list(self.values):
+            value = self.values.get(page_id, committed.get(page_id))
+            if value is not _MISSING:
+                loaded[page_id] = _copy(value)
+        return loaded if len(loaded) > 0 else None
+
+    def load_item(self, register_id:any, name:str) -> object:
+        value = self._value(register_id)
+        return None if value is _MISSING else _find(value, name)
+
+    def find_items(self, register_id:any, tag:str) -> list:
+        value = self._value(register_id)
+        if value is _MISSING:
+            return []
+        return [obj for obj in value if getattr(obj, "tag", None) == tag]
+
+    def add(self, register_id:any, obj:object):
+        if self._value(register_id) is not _MISSING:
+            err_msg = f" id -> '{register_id}' is already used in the register"
+            raise RegisterError(err_msg)
+        self._record(register_id, ("add", obj, None), obj)
+
+    def update(self, register_id:any, obj:object, override:bool=True,
+                                                    dict_id:any=None):
+        value = self._value(register_id)
+        if value is _MISSING:
+            err_msg = f" id -> '{register_id}' was not found in the register"
+            raise RegisterError(err_msg)
+        entry = ("override" if override == True else "update", obj, dict_id)
+        self._record(register_id, entry, _apply(value, entry, register_id))
+
+    def override(self, register:dict):
+        self.reset = True
+        self.values, self.entries = {}, {}
+        for register_id, obj in register.items():
+            self._record(register_id, ("add", obj, None), obj)
+
+    def remove(self, register_id:any=None):
+        if register_id == None:
+            self.override({})
+            return
+        if self._value(register_id) is _MISSING:
+            raise RegisterError(f" id '{register_id}' was not found")
+        self._record(register_id, ("drop", None, None), _MISSING)
+
+    def save_item(self, register_id:any, obj:object):
+        value = self._value(register_id)
+        value = [] if value is _MISSING else value
+        entry = ("replace", obj, None)
+        self._record(register_id, entry, _apply(value, entry, register_id))
+
+    def remove_item(self, register_id:any, name:str):
+        value = self._value(register_id)
+        if value is _MISSING or _find(value, name) == None:
+            return
+        entry = ("remove", name, None)
+        value = _apply(value, entry, register_id)
+        self._record(register_id, entry, value if len(value) > 0 else _MISSING)
+
+    def commit(self):
+        """Escribe los cambios con el bloqueo exclusivo. Cada pagina
+        modificada se vuelve a leer y se le aplican encima las
+        operaciones de la transaccion (_replay), de forma que solo se
+        sustituyen los objetos que ha tocado la transaccion. Las
+        paginas se guardan en ficheros nuevos y el indice se reemplaza
+        al final, por lo que hasta ese momento el registro en disco no
+        cambia (si algo falla antes se borran los ficheros nuevos)"""
+        if len(self.entries) == 0 and not self.reset:
+            return
+        if self.backend != None:
+            self.backend.commit(self.reset, self.entries)
+            return
+        written = []
+        try:
+            with _file_lock(exclusive=True):
+                current = _read_manifest()
+                current = current if current != None else {}
+                pages = {} if self.reset else dict(current)
+                used = set(current.values())
+                for register_id, entries in self.entries.items():
+                    value = _MISSING
+                    if register_id in pages:
+                        shard = pages[register_id]
+                        value = _copy(_read_shard(shard, register_id))
+                    value = _replay(value, entries, register_id)
+                    if value is _MISSING:
+                        pages.pop(register_id, None)
+                        continue
+                    shard = _new_shard_name(used, register_id)
+                    used.add(shard)
+                    os.makedirs(REL_PATH, exist_ok=True)
+                    _compact(shard, value, register_id)
+                    written.append(shard)
+                    pages[register_id] = shard
+                if len(pages) == 0:
+                    _delete_files()
+                    return
+                _write_manifest(pages)
+                written.clear()
+                for shard in set(current.values()) - set(pages.values()):
+                    _delete_shard(shard)
+        except BaseException:
+            for shard in written:
+                _delete_shard(shard)
+            raise
+
+    def _record(self, register_id:any, entry:tuple, value:object):
+        """Guarda una operacion sobre una pagina y el valor con el que
+        queda la pagina dentro de la transaccion"""
+        self.values[register_id] = value
+        self.entries.setdefault(register_id, []).append(entry)
+
+    def _value(self, register_id:any) -> object:
+        if register_id not in self.values:
+            value = _MISSING if self.reset else self._committed(register_id)
+            self.values[register_id] = _MISSING if value == None else value
+        return self.values[register_id]
+
+    def _committed(self, register_id:any=None) -> object:
+        """Lee lo que hay guardado en el registro (sin los cambios de
+        la transaccion)"""
+        if self.backend != None:
+            return self.backend.load(register_id)
+        return _read_committed(lambda: _load(register_id))
+
+# --------------------------------------------------------------------
 class RegisterError(Exception):
     """Error personalizado para los fallos del registro"""
     def __init__(self, msg):
         super().__init__(msg)
 
-# -------------------------------------------------------------------- 
+class _Changed(Exception):
+    """Otro proceso ha modificado el registro mientras se leia sin
+    bloquearlo (ver _read_committed)"""
+
+# --------------------------------------------------------------------
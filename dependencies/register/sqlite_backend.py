@@ -0,0 +1,403 @@
+
+import os
+import pickle
+import sqlite3
+from contextlib import suppress, contextmanager
+
+import dependencies.register.register as register
+
+# ----------------------- REGISTER (SQLITE) --------------------------
+# --------------------------------------------------------------------
+# Implementacion del registro sobre una base de datos SQLite. Ofrece
+# las mismas funciones que register.py (que es quien las llama cuando
+# esta configurado este backend). Las paginas que son listas de
+# objetos con nombre (contenedores, bridges...) se guardan fila a
+# fila en una tabla indexada por nombre y por tag, de forma que
+# buscar, añadir o actualizar un objeto no obliga a reescribir la
+# lista entera. El resto de paginas se guardan enteras en una fila
+# --------------------------------------------------------------------
+
+# Tiempo maximo (ms) que se espera si otro proceso esta escribiendo
+BUSY_TIMEOUT = 60000
+# Protocolo con el que se serializan las claves de las paginas (debe
+# ser fijo para que la misma clave genere siempre los mismos bytes)
+KEY_PROTOCOL = 4
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id BLOB PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data BLOB
+);
+CREATE TABLE IF NOT EXISTS items (
+    page BLOB NOT NULL,
+    name TEXT NOT NULL,
+    tag TEXT,
+    pos INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (page, name)
+);
+CREATE INDEX IF NOT EXISTS items_by_tag ON items (page, tag);
+"""
+# Tipos de pagina
+VALUE = "value"; ITEMS = "items"
+# Conexion abierta por este proceso {"path", "pid", "conn", "depth"}
+_db = {"path": None, "pid": None, "conn": None, "depth": 0}
+# --------------------------------------------------------------------
+def db_path() -> str:
+    """Devuelve la ruta de la base de datos del registro"""
+    return register.REL_PATH + register.SQLITE_EXT
+
+def exists() -> bool:
+    """Indica si existe la base de datos del registro"""
+    return os.path.isfile(db_path())
+
+# --------------------------------------------------------------------
+def add(register_id:any, obj:object):
+    with _writing() as conn:
+        if _page(conn, register_id) != None:
+            err_msg = f" id -> '{register_id}' is already used in the register"
+            raise register.RegisterError(err_msg)
+        pos = conn.execute("SELECT COALESCE(MAX(pos), 0) + 1 FROM pages")
+        _write_page(conn, register_id, obj, pos.fetchone()[0])
+
+def update(register_id:any, obj:object, override:bool=True, dict_id:any=None):
+    with _writing() as conn:
+        page = _page(conn, register_id)
+        if page == None:
+            err_msg = f" id -> '{register_id}' was not found in the register"
+            raise register.RegisterError(err_msg)
+        pos, kind, data = page
+        if override == True:
+            _write_page(conn, register_id, obj, pos)
+        elif kind == ITEMS and _name(obj) != None and \
+                                not _has_item(conn, register_id, obj):
+            # Igual que en el backend pickle se añade al final. Si ya
+            # hay un objeto con ese nombre la lista pasa a tener dos y
+            # deja de poder guardarse fila a fila
+            _upsert_item(conn, register_id, obj)
+        else:
+            value = _read_page(conn, register_id, kind, data)
+            entry = ("update", obj, dict_id)
+            value = register._apply(value, entry, register_id)
+            _write_page(conn, register_id, value, pos)
+
+def load(register_id:any=None) -> object:
+    with _reading() as conn:
+        if conn == None:
+            return None
+        if register_id == None:
+            rows = conn.execute(
+                "SELECT id, kind, data FROM pages ORDER BY pos"
+            )
+            loaded = {}
+            for key, kind, data in rows.fetchall():
+                page_id = pickle.loads(key)
+                loaded[page_id] = _read_page(conn, page_id, kind, data)
+            return loaded if len(loaded) > 0 else None
+        page = _page(conn, register_id)
+        if page == None:
+            return None
+        return _read_page(conn, register_id, page[1], page[2])
+
+def override(new_register:dict):
+    with _writing() as conn:
+        conn.execute("DELETE FROM items")
+        conn.execute("DELETE FROM pages")
+        for pos, (register_id, obj) in enumerate(new_register.items()):
+            _write_page(conn, register_id, obj, pos + 1)
+
+def remove(register_id:any=None):
+    if register_id == None:
+        _delete_db()
+        return
+    with _writing() as conn:
+        if _page(conn, register_id) == None:
+            raise register.RegisterError(f" id '{register_id}' was not found")
+        key = _key(register_id)
+        conn.execute("DELETE FROM items WHERE page = ?", (key,))
+        conn.execute("DELETE FROM pages WHERE id = ?", (key,))
+
+# --------------------------------------------------------------------
+def load_item(register_id:any, name:str) -> object:
+    with _reading() as conn:
+        if conn == None:
+            return None
+        page = _page(conn, register_id)
+        if page == None:
+            return None
+        if page[1] == ITEMS:
+            row = conn.execute(
+                "SELECT data FROM items WHERE page = ? AND name = ?",
+                (_key(register_id), str(name))
+            ).fetchone()
+            return None if row == None else _load_item(register_id, row[0])
+        value = _read_page(conn, register_id, page[1], page[2])
+        return register._find(value, name)
+
+def find_items(register_id:any, tag:str) -> list:
+    with _reading() as conn:
+        if conn == None:
+            return []
+        page = _page(conn, register_id)
+        if page == None:
+            return []
+        if page[1] == ITEMS:
+            rows = conn.execute(
+                "SELECT data FROM items WHERE page = ? AND tag = ? ORDER BY pos",
+                (_key(register_id), str(tag))
+            )
+            return [_load_item(register_id, data)
+                                        for (data,) in rows.fetchall()]
+        value = _read_page(conn, register_id, page[1], page[2])
+        return [obj for obj in value if getattr(obj, "tag", None) == tag]
+
+def save_item(register_id:any, obj:object):
+    with _writing() as conn:
+        page = _page(conn, register_id)
+        if page == None:
+            pos = conn.execute("SELECT COALESCE(MAX(pos), 0) + 1 FROM pages")
+            _write_page(conn, register_id, [obj], pos.fetchone()[0])
+        elif page[1] == ITEMS and _name(obj) != None:
+            _upsert_item(conn, register_id, obj)
+        else:
+            value = _read_page(conn, register_id, page[1], page[2])
+            value = register._apply(value, ("replace", obj, None), register_id)
+            _write_page(conn, register_id, value, page[0])
+
+def remove_item(register_id:any, name:str):
+    with _writing() as conn:
+        page = _page(conn, register_id)
+        if page == None:
+            return
+        key = _key(register_id)
+        if page[1] == ITEMS:
+            conn.execute(
+                "DELETE FROM items WHERE page = ? AND name = ?", (key, str(name))
+            )
+            left = conn.execute(
+                "SELECT COUNT(*) FROM items WHERE page = ?", (key,)
+            ).fetchone()[0]
+        else:
+            value = _read_page(conn, register_id, page[1], page[2])
+            value = [obj for obj in value if _name(obj) != str(name)]
+            _write_page(conn, register_id, value, page[0])
+            left = len(value)
+        if left == 0:
+            conn.execute("DELETE FROM items WHERE page = ?", (key,))
+            conn.execute("DELETE FROM pages WHERE id = ?", (key,))
+
+# --------------------------------------------------------------------
+def commit(reset:bool, entries:dict):
+    """Aplica en una unica transaccion de SQLite las operaciones que
+    ha acumulado una transaccion del registro (ver
+    register._Transaction) sobre lo que haya guardado en ese momento
+
+    Args:
+        reset (bool): Si la transaccion ha sustituido todo el registro
+        entries (dict): Operaciones sobre cada pagina
+            {register_id: [(operacion, objeto, dict_id), ...]}
+    """
+    with _writing() as conn:
+        if reset:
+            conn.execute("DELETE FROM items")
+            conn.execute("DELETE FROM pages")
+        for register_id, page_entries in entries.items():
+            for entry in page_entries:
+                _commit_entry(conn, register_id, entry)
+
+# --------------------------------------------------------------------
+def _connect(create:bool=True) -> sqlite3.Connection:
+    """Devuelve la conexion con la base de datos del registro. Se
+    reutiliza mientras no cambie la ruta ni el proceso
+
+    Args:
+        create (bool, optional): Si es falso y la base de datos no
+            existe se devuelve None en vez de crearla
+    """
+    path = db_path()
+    if _db["conn"] != None:
+        if _db["path"] == path and _db["pid"] == os.getpid():
+            return _db["conn"]
+        _close()
+    if not create and not os.path.isfile(path):
+        return None
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(_SCHEMA)
+    _db.update(path=path, pid=os.getpid(), conn=conn, depth=0)
+    return conn
+
+def _close():
+    with suppress(Exception):
+        _db["conn"].close()
+    _db.update(path=None, pid=None, conn=None, depth=0)
+
+def _delete_db():
+    """Elimina la base de datos del registro"""
+    if _db["conn"] != None:
+        _close()
+    for ext in ("", "-wal", "-shm"):
+        with suppress(FileNotFoundError):
+            os.remove(db_path() + ext)
+
+@contextmanager
+def _reading():
+    """Ejecuta el bloque dentro de una transaccion de lectura, para que
+    todas sus consultas vean la misma version de la base de datos
+    (con WAL no espera a los que escriben). Devuelve None si no existe
+    la base de datos. Si ya hay una transaccion abierta se reutiliza"""
+    with register._thread_lock:
+        conn = _connect(create=False)
+        if conn == None or _db["depth"] > 0:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+@contextmanager
+def _writing():
+    """Ejecuta el bloque dentro de una transaccion de escritura. Si ya
+    hay una abierta se reutiliza (tambien si la ha abierto otro hilo,
+    los hilos comparten la conexion)"""
+    with register._thread_lock:
+        conn = _connect()
+        nested = _db["depth"] > 0
+        if not nested:
+            conn.execute("BEGIN IMMEDIATE")
+        _db["depth"] += 1
+    if nested:
+        try:
+            yield conn
+        finally:
+            with register._thread_lock:
+                _db["depth"] -= 1
+        return
+    try:
+        yield conn
+    except BaseException:
+        with register._thread_lock:
+            _db["depth"] = 0
+            conn.execute("ROLLBACK")
+        raise
+    with register._thread_lock:
+        _db["depth"] = 0
+        conn.execute("COMMIT")
+        if conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0] == 0:
+            _delete_db()
+
+# --------------------------------------------------------------------
+def _key(register_id:any) -> bytes:
+    return pickle.dumps(register_id, protocol=KEY_PROTOCOL)
+
+def _name(obj:object) -> str:
+    name = getattr(obj, "name", None)
+    return None if name == None else str(name)
+
+def _indexable(obj:object) -> bool:
+    """Una pagina se guarda fila a fila si es una lista de objetos
+    con nombres distintos"""
+    if type(obj) != list:
+        return False
+    names = [_name(o) for o in obj]
+    return None not in names and len(set(names)) == len(names)
+
+def _dump_item(register_id:any, item:object) -> bytes:
+    """Serializa una fila de una pagina indexada (con el codificador
+    de la pagina si lo tiene, ver register._dumps)"""
+    return register._dumps(register_id, [item])
+
+def _load_item(register_id:any, data:bytes) -> object:
+    """Deserializa una fila de una pagina indexada"""
+    loaded = register._loads(register_id, data)
+    return loaded[0] if type(loaded) == list else loaded
+
+def _page(conn:sqlite3.Connection, register_id:any) -> tuple:
+    return conn.execute(
+        "SELECT pos, kind, data FROM pages WHERE id = ?", (_key(register_id),)
+    ).fetchone()
+
+def _read_page(conn:sqlite3.Connection, register_id:any,
+               kind:str, data:bytes) -> object:
+    if kind == VALUE:
+        return register._loads(register_id, data)
+    rows = conn.execute(
+        "SELECT data FROM items WHERE page = ? ORDER BY pos",
+        (_key(register_id),)
+    )
+    return [_load_item(register_id, item) for (item,) in rows.fetchall()]
+
+def _write_page(conn:sqlite3.Connection, register_id:any,
+                obj:object, pos:int):
+    key = _key(register_id)
+    conn.execute("DELETE FROM items WHERE page = ?", (key,))
+    if _indexable(obj):
+        conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, NULL)",
+            (key, pos, ITEMS)
+        )
+        for i, item in enumerate(obj):
+            conn.execute(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?)",
+                (key, _name(item), getattr(item, "tag", None), i,
+                                            _dump_item(register_id, item))
+            )
+    else:
+        conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+            (key, pos, VALUE, register._dumps(register_id, obj))
+        )
+
+def _commit_entry(conn:sqlite3.Connection, register_id:any, entry:tuple):
+    """Aplica una operacion de una transaccion sobre una pagina (igual
+    que register._replay)"""
+    op, obj, dict_id = entry
+    page = _page(conn, register_id)
+    if op == "drop":
+        if page != None:
+            remove(register_id)
+    elif op == "replace":
+        save_item(register_id, obj)
+    elif op == "remove":
+        remove_item(register_id, obj)
+    elif page == None:
+        pos = conn.execute("SELECT COALESCE(MAX(pos), 0) + 1 FROM pages")
+        _write_page(conn, register_id, register._initial(entry),
+                                                    pos.fetchone()[0])
+    elif op == "add":
+        value = _read_page(conn, register_id, page[1], page[2])
+        value = register._merge(value, obj, register_id)
+        _write_page(conn, register_id, value, page[0])
+    else:
+        update(register_id, obj, override=op == "override", dict_id=dict_id)
+
+def _has_item(conn:sqlite3.Connection, register_id:any, obj:object) -> bool:
+    """Indica si una pagina indexada tiene un objeto con el nombre de
+    obj"""
+    return conn.execute(
+        "SELECT 1 FROM items WHERE page = ? AND name = ?",
+        (_key(register_id), _name(obj))
+    ).fetchone() != None
+
+def _upsert_item(conn:sqlite3.Connection, register_id:any, obj:object):
+    """Añade o reemplaza una fila de una pagina indexada. Si el objeto
+    ya existia conserva su posicion en la lista"""
+    key = _key(register_id)
+    row = conn.execute(
+        "SELECT pos FROM items WHERE page = ? AND name = ?", (key, _name(obj))
+    ).fetchone()
+    if row == None:
+        row = conn.execute(
+            "SELECT COALESCE(MAX(pos), -1) + 1 FROM items WHERE page = ?", (key,)
+        ).fetchone()
+    conn.execute(
+        "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+        (key, _name(obj), getattr(obj, "tag", None), row[0],
+                                            _dump_item(register_id, obj))
+    )
+
+# --------------------------------------------------------------------
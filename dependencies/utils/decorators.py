@@ -2,13 +2,36 @@
 import logging
 from logging import Logger
 from time import time
+from contextlib import nullcontext
 
 # -------------------------- DECORADORES -----------------------------
 # --------------------------------------------------------------------
 # Modulo en el que se definen decoradores genericos y no relacionados
-# para que sean utilizados por otros modulos
+# para que sean utilizados por otros modulos. asyncio y los hilos se
+# importan al usarlos por primera vez, para que importar este modulo
+# no retrase el arranque del programa
 # -------------------------------------------------------------------- 
 
+# Numero maximo de hilos con los que se ejecutan las iteraciones de
+# las funciones decoradas con catch_foreach(parallel=True) (con 1 se
+# ejecutan una detras de otra)
+_workers = 1
+# --------------------------------------------------------------------
+def config_workers(workers:int):
+    """Configura el numero maximo de hilos que puede usar catch_foreach
+    para ejecutar en paralelo las iteraciones de una funcion
+
+    Args:
+        workers (int): Numero de hilos (1 para no paralelizar)
+
+    Raises:
+        ValueError: Si el numero de hilos no es un entero positivo
+    """
+    global _workers
+    if type(workers) != int or workers < 1:
+        raise ValueError(f" '{workers}' no es un numero de hilos valido")
+    _workers = workers
+
 # --------------------------------------------------------------------
 def timer(func):
     """Mide el tiempo que tarda en ejecutarse una funcion
@@ -26,7 +49,7 @@ def timer(func):
     return f
 
 # -------------------------------------------------------------------- 
-def catch_foreach(logger:Logger=None):
+def catch_foreach(logger:Logger=None, context=None, parallel=False):
     """Ejecuta una funcion tantas veces como argumentos no opcionales
     se hayan pasado a la funcion y maneja las excepciones que puedan 
     surgir durante la ejecucion
@@ -34,23 +57,79 @@ def catch_foreach(logger:Logger=None):
     Args:
         logger (Logger, optional): logger con el que notificar los 
             errores que puedan surgir
+        context (function, optional): funcion que devuelve un context
+            manager dentro del cual se ejecutan todas las iteraciones
+            (p.ej una transaccion del registro)
+        parallel (bool, optional): Si es verdadero las iteraciones se
+            reparten entre varios hilos (tantos como se hayan
+            configurado con config_workers). Los argumentos con los
+            que no ha habido errores se devuelven igualmente en el
+            orden en el que se pasaron
     """
     def _catch_foreach(func):
+        def call(a, **optionals) -> bool:
+            try:
+                func(a, **optionals)
+                return True
+            except Exception as err:
+                if str(err) == "":
+                    pass
+                elif logger == None:
+                    print(f"ERROR:{err}")  
+                else:
+                    logger.error(err)
+                return False
         def catch (*args, **optionals):
-            successful = []
-            for a in args:
+            workers = min(_workers, len(args)) if parallel else 1
+            with context() if context != None else nullcontext():
+                if workers > 1:
+                    from concurrent.futures import ThreadPoolExecutor
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        done = list(pool.map(
+                            lambda a: call(a, **optionals), args
+                        ))
+                else:
+                    done = [call(a, **optionals) for a in args]
+            return [a for a, ok in zip(args, done) if ok]
+        return catch
+    return _catch_foreach
+
+def catch_foreach_async(logger:Logger=None, context=None):
+    """Igual que catch_foreach pero para funciones asincronas (async
+    def). Todas las iteraciones se ejecutan a la vez en el bucle de
+    eventos, como maximo tantas como se hayan configurado con
+    config_workers. La funcion decorada devuelve una corutina que hay
+    que esperar (await o asyncio.run)
+
+    Args:
+        logger (Logger, optional): logger con el que notificar los 
+            errores que puedan surgir
+        context (function, optional): funcion que devuelve un context
+            manager dentro del cual se ejecutan todas las iteraciones
+    """
+    def _catch_foreach_async(func):
+        async def call(semaphore, a, **optionals) -> bool:
+            async with semaphore:
                 try:
-                    func(a, **optionals)
-                    successful.append(a)
+                    await func(a, **optionals)
+                    return True
                 except Exception as err:
                     if str(err) == "":
                         pass
                     elif logger == None:
                         print(f"ERROR:{err}")  
                     else:
-                        logger.error(err)    
-            return successful
+                        logger.error(err)
+                    return False
+        async def catch(*args, **optionals):
+            import asyncio
+            semaphore = asyncio.Semaphore(_workers)
+            with context() if context != None else nullcontext():
+                done = await asyncio.gather(
+                    *[call(semaphore, a, **optionals) for a in args]
+                )
+            return [a for a, ok in zip(args, done) if ok]
         return catch
-    return _catch_foreach
+    return _catch_foreach_async
 
 # -------------------------------------------------------------------- 
\ No newline at end of file
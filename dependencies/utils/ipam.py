@@ -0,0 +1,170 @@
+
+import copy
+import ipaddress
+
+# --------------------------- GESTOR DE IPS --------------------------
+# --------------------------------------------------------------------
+# Reparte las direcciones de una subred (de cualquier longitud de
+# prefijo, ipv4 o ipv6) con un mapa de bits: el bit i indica si la
+# direccion i de la subred esta ocupada. Se guarda una posicion
+# (cursor) desde la que se busca la siguiente libre, asi que repartir
+# direcciones seguidas no tiene que volver a recorrer las ocupadas y
+# cuesta O(1) amortizado (los bytes llenos se saltan de 8 en 8). El
+# mapa solo crece hasta la ultima direccion que se ha usado, por lo
+# que una subred grande no ocupa mas memoria que una pequeña
+# --------------------------------------------------------------------
+
+class SubnetAllocator:
+    """Reparte las direcciones libres de una subred
+
+        Args:
+            network (str): Subred (p.ej 10.0.0.1/24, se admite que
+                tenga bits de host)
+            first_host (int, optional): Las direcciones anteriores a
+                esta posicion de la subred quedan reservadas (la 0,
+                la de la subred, siempre lo esta)
+        """
+    def __init__(self, network:str, first_host:int=1):
+        net = ipaddress.ip_network(network, strict=False)
+        self.network = str(net)
+        self.version = net.version
+        self._base = int(net.network_address)
+        # En ipv4 la ultima direccion es la de broadcast (salvo en
+        # /31 y /32) y no se reparte
+        self._limit = net.num_addresses
+        if net.version == 4 and net.prefixlen < 31:
+            self._limit -= 1
+        self._bitmap = bytearray()
+        self._free = self._limit
+        self._cursor = 0
+        for index in range(min(max(first_host, 1), self._limit)):
+            self._mark(index)
+
+    def allocate(self) -> str:
+        """Reserva la siguiente direccion libre
+
+        Raises:
+            IpamError: Si no quedan direcciones libres
+
+        Returns:
+            str: Direccion reservada
+        """
+        if self._free == 0:
+            raise IpamError(f" No quedan ips libres en '{self.network}'")
+        index = self._find_free(self._cursor)
+        if index == None:
+            index = self._find_free(0)
+        self._mark(index)
+        self._cursor = index + 1
+        return self._address(index)
+
+    def reserve(self, ip:str) -> bool:
+        """Marca una direccion como ocupada (p.ej la del bridge o una
+        que se ha asignado fuera del gestor)
+
+        Raises:
+            IpamError: Si la direccion no pertenece a la subred
+
+        Returns:
+            bool: Si estaba libre
+        """
+        index = self._index(ip)
+        if self._is_used(index):
+            return False
+        self._mark(index)
+        return True
+
+    def release(self, ip:str) -> bool:
+        """Libera una direccion para que se pueda volver a repartir
+
+        Raises:
+            IpamError: Si la direccion no pertenece a la subred
+
+        Returns:
+            bool: Si estaba ocupada
+        """
+        index = self._index(ip)
+        if not self._is_used(index):
+            return False
+        self._bitmap[index >> 3] &= ~(1 << (index & 7))
+        self._free += 1
+        self._cursor = min(self._cursor, index)
+        return True
+
+    def free(self) -> int:
+        """Devuelve el numero de direcciones libres"""
+        return self._free
+
+    def copy(self) -> "SubnetAllocator":
+        """Devuelve una copia que se puede modificar sin cambiar esta
+        (el mapa de bits no se comparte)"""
+        pool = copy.copy(self)
+        pool._bitmap = bytearray(self._bitmap)
+        return pool
+
+    def __contains__(self, ip:str) -> bool:
+        try:
+            self._index(ip)
+        except IpamError:
+            return False
+        return True
+
+    def __str__(self):
+        return self.network
+
+    # ----------------------------------------------------------------
+    def _find_free(self, start:int) -> int:
+        """Devuelve la primera posicion libre a partir de start (o
+        None si no hay ninguna hasta el final de la subred)"""
+        bitmap = self._bitmap
+        byte = start >> 3
+        # Primero los bits que quedan del byte en el que se empieza
+        if byte < len(bitmap):
+            for index in range(start, min((byte + 1) << 3, self._limit)):
+                if not bitmap[byte] >> (index & 7) & 1:
+                    return index
+            byte += 1
+        # Despues se saltan los bytes llenos
+        while byte < len(bitmap) and bitmap[byte] == 0xFF:
+            byte += 1
+        if byte < len(bitmap):
+            index = byte << 3
+            while bitmap[byte] >> (index & 7) & 1:
+                index += 1
+        else:
+            # Lo que queda fuera del mapa esta libre
+            index = max(start, len(bitmap) << 3)
+        return index if index < self._limit else None
+
+    def _mark(self, index:int):
+        byte = index >> 3
+        if byte >= len(self._bitmap):
+            self._bitmap.extend(bytes(byte + 1 - len(self._bitmap)))
+        self._bitmap[byte] |= 1 << (index & 7)
+        self._free -= 1
+
+    def _is_used(self, index:int) -> bool:
+        byte = index >> 3
+        return (byte < len(self._bitmap) and
+                    bool(self._bitmap[byte] >> (index & 7) & 1))
+
+    def _index(self, ip:str) -> int:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError as err:
+            raise IpamError(f" '{ip}' no es una ip valida: {err}")
+        index = int(address) - self._base
+        if address.version != self.version or not 0 <= index < self._limit:
+            raise IpamError(f" La ip '{ip}' no pertenece a '{self.network}'")
+        return index
+
+    def _address(self, index:int) -> str:
+        if self.version == 4:
+            return str(ipaddress.IPv4Address(self._base + index))
+        return str(ipaddress.IPv6Address(self._base + index))
+
+# --------------------------------------------------------------------
+class IpamError(Exception):
+    """Excepcion personalizada para los errores al repartir ips"""
+    pass
+# --------------------------------------------------------------------
@@ -109,6 +109,25 @@ def concat_array(array:list, separator:str=",") -> str:
             c += str(obj) + separator + " "
     return c
    
+# --------------------------------------------------------------------
+def ask(question:str) -> str:
+    """Hace una pregunta al usuario por la entrada estandar. Si ya no
+    se puede leer nada de ella (p.ej las ordenes se han leido de la
+    entrada estandar con --batch) se responde con un string vacio, que
+    equivale a contestar que no
+
+    Args:
+        question (str): Pregunta que se muestra
+
+    Returns:
+        str: respuesta del usuario
+    """
+    try:
+        return input(question)
+    except EOFError:
+        print()
+        return ""
+
 # --------------------------------------------------------------------
 def remove_many(remove_in:list, *remove):
     """Intenta eliminar de una lista todos los elementos que se
@@ -8,14 +8,18 @@ import logging
 import subprocess
 
 import bash.bash_handler as bash
-from bash.bash_handler import CmdLineError
-import program.functions as program
-from program.functions import ProgramError
+import bash.daemon as daemon
+from bash.bash_handler import Cli, CmdLineError
+from bash.bash_handler import PROFILE_FLAG, DAEMON_FLAG, BATCH_FLAG
  
 # ------------------- MAIN (INICIO DE EJECUCION) ---------------------
 # --------------------------------------------------------------------
 # Este es un fichero fachada en el cual se ve de forma global el 
 # flujo de ejecucion que sigue el programa sin entrar en detalles
+# Para que el programa arranque rapido aqui solo se importa lo que
+# hace falta para procesar la linea de comandos. El resto de modulos
+# se importan una vez se sabe que orden hay que ejecutar. Si hay un
+# demonio arrancado (ver bash/daemon.py) la orden se le pasa a el
 # --------------------------------------------------------------------
 # Los criterios de nivel de logger que va a seguir el programa son:
 # --> Se usara:
@@ -31,23 +35,65 @@ logging.basicConfig(level=logging.NOTSET)
 main_logger = logging.getLogger(__name__)
 # --------------------------------------------------------------------
 def main():
-    cli = bash.config_cli()
+    if PROFILE_FLAG in sys.argv:
+        _startup_profile(sys.argv)
+        return
+    if DAEMON_FLAG in sys.argv:
+        _serve(sys.argv)
+        return
+    if daemon.forward(sys.argv):
+        return
+    run(sys.argv)
+
+def run(argv:list, cli:Cli=None):
+    """Procesa la linea de comandos y ejecuta la orden (o las ordenes
+    del fichero si se pasa BATCH_FLAG)
+
+    Args:
+        argv (list): Linea de comandos (nombre del programa incluido)
+        cli (Cli, optional): Cli ya configurada (si no se crea)
+    """
+    if cli == None:
+        cli = bash.config_cli()
     try:
         # Procesamos la linea de comandos (CmdLineError)
-        args_processed = cli.process_cmdline(sys.argv)
-        if args_processed == None: return
-        # Configuramos la cantidad de info que se va a mostrar
-        _config_verbosity(args_processed["flags"])
-        # Realizamos unas comprobaciones previas (ProgramError)
-        program.check_enviroment()
-        program.check_updates()
-        # Informamos del inicio del programa y ejecutamos la orden
-        main_logger.info(" Programa iniciado")
-        main_logger.debug(f" Ejecutando la orden {args_processed}")
-        bash.execute(args_processed)
-    # Manejamos los errores que puedan surgir 
-    except CmdLineError as clErr:
+        if BATCH_FLAG in argv:
+            batch = _read_batch(argv, cli)
+        else:
+            args_processed = cli.process_cmdline(list(argv))
+            if args_processed == None: return
+            batch = [args_processed]
+    except (CmdLineError, OSError) as clErr:
         main_logger.error(f" {clErr}")
+        return
+    if len(batch) == 0:
+        main_logger.warning(" No hay ninguna orden que ejecutar")
+        return
+    import program.functions as program
+    from program.functions import ProgramError
+    import dependencies.register.register as register
+    from dependencies.utils.tools import ask
+    try:
+        for i, args_processed in enumerate(batch):
+            # Configuramos la cantidad de info que se va a mostrar
+            _config_verbosity(args_processed["flags"])
+            # Configuramos cuantos contenedores se procesan a la vez
+            _config_workers(args_processed["options"])
+            # Elegimos si se usa el comando lxc o la API de LXD (si no
+            # se ha cargado todavia no esta activada)
+            _config_api(args_processed["flags"])
+            if i == 0:
+                # Realizamos unas comprobaciones previas (ProgramError),
+                # una sola vez para todas las ordenes
+                refresh = any("-e" in args["flags"] for args in batch)
+                program.check_enviroment(refresh=refresh)
+                program.check_updates()
+                # Informamos del inicio del programa
+                main_logger.info(" Programa iniciado")
+            # Ejecutamos la orden
+            main_logger.debug(f" Ejecutando la orden {args_processed}")
+            bash.execute(args_processed)
+    # Manejamos los errores que puedan surgir 
     except KeyboardInterrupt:
         main_logger.warning(" Programa interrumpido")
     except ProgramError as err:
@@ -55,13 +101,27 @@ def main():
     except Exception as err:
         err_msg = " Error inesperado en el programa (no controlado)"
         main_logger.critical(err_msg)
-        answer = input("¿Obtener traza completa?(y/n): ")
+        answer = ask("¿Obtener traza completa?(y/n): ")
         if answer.lower() == "y":
             main_logger.exception(err)
     else:
         main_logger.info(" Programa finalizado")
+    main_logger.debug(f" Cache del registro -> {register.cache_stats()}")
         
 # --------------------------------------------------------------------
+def _config_api(flags:list):
+    """Activa la API de LXD si se pide con el flag -r (ver
+    dependencies/lxc_classes/lxd_api.py). Solo se importa si hace
+    falta, para que las ordenes que no la usan no la carguen
+
+    Args:
+        flags (list): Flags que se han pasado en la linea de comandos
+    """
+    module = "dependencies.lxc_classes.lxd_api"
+    if "-r" in flags or module in sys.modules:
+        import dependencies.lxc_classes.lxd_api as lxd_api
+        lxd_api.config_api("-r" in flags)
+
 def _config_verbosity(flags:list):
     """Configura el nivel de verbosidad del programa (nivel de los
     logger de los diferentes ficheros que conforman el programa) en
@@ -82,6 +142,110 @@ def _config_verbosity(flags:list):
     root_logger = logging.getLogger()
     root_logger.setLevel(logLvl) 
 
+def _config_workers(options:dict):
+    """Configura el numero de hilos con los que se opera sobre los
+    contenedores en funcion de la opcion -j (si se ha pasado)
+
+    Args:
+        options (dict): Opciones que se han pasado en la linea de 
+            comandos
+    """
+    from dependencies.utils.decorators import config_workers
+    # Con el demonio hay que volver al valor por defecto si no se pasa
+    config_workers(options["-j"][0] if "-j" in options else 1)
+
+def _read_batch(argv:list, cli:Cli) -> list:
+    """Lee y valida las ordenes del fichero que se indica detras de
+    BATCH_FLAG (o de la entrada estandar si no se indica ninguno). El
+    resto de flags de la linea de comandos se aplican a todas. Si se
+    leen de la entrada estandar las preguntas que hagan las ordenes
+    (ver tools.ask) se responden con 'no'
+
+    Args:
+        argv (list): Linea de comandos (nombre del programa incluido)
+        cli (Cli): Cli con la que se validan las ordenes
+
+    Raises:
+        CmdLineError: Si la linea de comandos o alguna orden no es
+            correcta
+        OSError: Si no se puede leer el fichero
+
+    Returns:
+        list: Ordenes ya validadas
+    """
+    args = argv[1:]
+    index = args.index(BATCH_FLAG)
+    path = None
+    if index + 1 < len(args) and args[index + 1] not in cli.flags:
+        path = args.pop(index + 1)
+    args.remove(BATCH_FLAG)
+    flags = [arg for arg in args if arg in cli.flags and arg != "-h"]
+    if len(flags) != len(args):
+        err_msg = (f"Con '{BATCH_FLAG}' solo se puede indicar el " +
+                                "fichero de ordenes y flags (no '-h')")
+        raise CmdLineError(err_msg)
+    if path == None:
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as script:
+            lines = script.readlines()
+    return bash.parse_batch(cli, lines, flags)
+
+def _serve(argv:list):
+    """Arranca el demonio con la cli configurada y los modulos del
+    programa ya importados y atiende ordenes hasta que se interrumpa
+
+    Args:
+        argv (list): Linea de comandos con la que se ha arrancado
+    """
+    _config_verbosity(argv)
+    if daemon.running():
+        main_logger.critical(" Ya hay un demonio atendiendo ordenes en " +
+                                            f"'{daemon.SOCKET_PATH}'")
+        return
+    cli = bash.config_cli()
+    # Se importa ya todo lo que necesitan las ordenes
+    from bash.repository import commands
+    import program.functions as program
+    try:
+        program.check_enviroment()
+        daemon.serve(lambda cmdline: run(cmdline, cli))
+    except (program.ProgramError, daemon.DaemonError) as err:
+        main_logger.critical(err)
+
+def _startup_profile(argv:list, top:int=20):
+    """Vuelve a ejecutar el programa con la misma orden (sin el flag
+    PROFILE_FLAG) con 'python -X importtime' y muestra al terminar los
+    modulos que mas han tardado en importarse
+
+    Args:
+        argv (list): Linea de comandos introducida por el usuario
+        top (int, optional): Numero de modulos que se muestran
+    """
+    cmd = [sys.executable, "-X", "importtime"]
+    cmd += [arg for arg in argv if arg != PROFILE_FLAG]
+    process = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in process.stderr:
+        if not line.startswith("import time:"):
+            # Lo demas (logs, errores...) se sigue mostrando
+            sys.stderr.write(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            imports.append((int(fields[0]), int(fields[1]), fields[2]))
+        except ValueError:
+            continue # Cabecera
+    process.wait()
+    total = sum(self_us for self_us, _, _ in imports)
+    print(f"\nImportados {len(imports)} modulos en {total/1000:.1f} ms " +
+          f"(top {top} por tiempo acumulado):")
+    print(f"{'self (ms)':>10} {'acumulado (ms)':>15}  modulo")
+    imports.sort(key=lambda imp: imp[1], reverse=True)
+    for self_us, cumulative_us, name in imports[:top]:
+        print(f"{self_us/1000:>10.1f} {cumulative_us/1000:>15.1f} " +
+              f" {name.rstrip()}")
+
 # --------------------------------------------------------------------
 if __name__ == "__main__":
     main()
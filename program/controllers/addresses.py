@@ -0,0 +1,107 @@
+
+import logging
+
+import dependencies.register.register as register
+from dependencies.lxc_classes.bridge import Bridge
+from dependencies.lxc_classes.container import Container
+
+# ---------------------- CONTROLADOR DE IPS --------------------------
+# --------------------------------------------------------------------
+# Reparte las ips de los contenedores en la subred de cada bridge
+# (ver dependencies/utils/ipam.py). Las ips ocupadas de cada bridge se
+# guardan en el registro ({nombre del bridge: SubnetAllocator}) y se
+# liberan al eliminar los contenedores, para poder volver a usarlas.
+# El gestor solo se carga cuando se usa (al repartir ips o al leer las
+# subredes del registro)
+# --------------------------------------------------------------------
+
+# Id con el que se van a guardar las subredes en el registro
+ID = "addresses"
+# Las ips de los contenedores empiezan en esta posicion de la subred
+# (p.ej 10.0.0.10), las anteriores quedan reservadas
+FIRST_HOST = 10
+ips_logger = logging.getLogger(__name__)
+# --------------------------------------------------------------------
+def allocate(b:Bridge, in_use:list=[]) -> str:
+    """Reserva una ip libre en la subred de un bridge
+
+    Args:
+        b (Bridge): Bridge en cuya subred se reserva la ip
+        in_use (list, optional): Ips que ya se estan usando. Solo se
+            tienen en cuenta la primera vez, al crear la subred (p.ej
+            contenedores conectados antes de que existiera el gestor)
+
+    Raises:
+        IpamError: Si el bridge no tiene subred o esta llena
+
+    Returns:
+        str: Ip reservada
+    """
+    from dependencies.utils.ipam import SubnetAllocator, IpamError
+    pools = register.load(ID)
+    pool = None if pools == None else pools.get(b.name)
+    if pool != None:
+        # El del registro es el de la cache, no se modifica
+        pool = pool.copy()
+    else:
+        if b.ipv4_addr in (None, "none", "auto"):
+            raise IpamError(f" El bridge '{b.name}' no tiene una subred fija")
+        pool = SubnetAllocator(b.ipv4_addr, first_host=FIRST_HOST)
+        # La ip del propio bridge (puerta de enlace)
+        pool.reserve(b.ipv4_addr.split("/")[0])
+        for ip in in_use:
+            if ip in pool:
+                pool.reserve(ip)
+    ip = pool.allocate()
+    ips_logger.debug(f" Ip '{ip}' reservada en '{b.name}' ({pool})")
+    _save(b.name, pool)
+    return ip
+
+def release(*cs:Container):
+    """Libera las ips de los contenedores en las subredes de los
+    bridges"""
+    pools = register.load(ID)
+    if pools == None:
+        return
+    with register.transaction():
+        for name, pool in pools.items():
+            pool = pool.copy()
+            released = False
+            for c in cs:
+                for ip in c.networks.values():
+                    if ip in pool and pool.release(ip):
+                        ips_logger.debug(f" Ip '{ip}' de '{c.name}' liberada")
+                        released = True
+            if released:
+                _save(name, pool)
+
+def reassign(old_ip:str, new_ip:str):
+    """Cambia una ip que se ha modificado fuera del programa"""
+    pools = register.load(ID)
+    if pools == None:
+        return
+    with register.transaction():
+        for name, pool in pools.items():
+            pool = pool.copy()
+            changed = False
+            if old_ip in pool:
+                changed = pool.release(old_ip)
+            if new_ip in pool:
+                changed = pool.reserve(new_ip) or changed
+            if changed:
+                _save(name, pool)
+
+def delete():
+    """Elimina del registro las subredes de todos los bridges"""
+    if register.load(ID) != None:
+        register.remove(ID)
+
+# --------------------------------------------------------------------
+def _save(name:str, pool:"SubnetAllocator"):
+    """Guarda en el registro la subred de un bridge"""
+    if register.load(ID) == None:
+        register.add(ID, {name: pool})
+    else:
+        register.update(ID, pool, override=False, dict_id=name)
+
+# --------------------------------------------------------------------
@@ -4,6 +4,7 @@ import logging
 import dependencies.register.register as register
 from dependencies.utils.decorators import catch_foreach
 from dependencies.lxc_classes.bridge import Bridge, LxcNetworkError
+from dependencies.lxc_classes import records
 
 # --------------- CONTROLADOR DE BRIDGES (PUENTES) -------------------
 # --------------------------------------------------------------------
@@ -16,8 +17,10 @@ from dependencies.lxc_classes.bridge import Bridge, LxcNetworkError
 # Id con el que se van a guardar los bridges en el registro
 ID = "bridges"
 bgs_logger = logging.getLogger(__name__)
+# Se guardan en el registro con el formato compacto de records
+register.config_codec(ID, records.encode, records.decode)
 # -------------------------------------------------------------------
-@catch_foreach(bgs_logger)
+@catch_foreach(bgs_logger, context=register.transaction)
 def init(b:Bridge=None):
     bgs_logger.info(f" Creando bridge '{b.name}'...")
     try:
@@ -37,7 +40,7 @@ def init(b:Bridge=None):
     _add_bridge(b)
 
 # -------------------------------------------------------------------
-@catch_foreach(bgs_logger)
+@catch_foreach(bgs_logger, context=register.transaction)
 def delete(b:Bridge):
     bgs_logger.info(f" Eliminando bridge '{b.name}'...")
     try:
@@ -85,21 +88,10 @@ def _update_bridge(b_to_update:Bridge, remove=False):
         remove (bool, optional): Si es verdadero, se elimina el
             contenedor del registro. Por defecto es False
     """
-    bgs = register.load(register_id=ID)
-    index = None
-    for i, b in enumerate(bgs):
-        if b.name == b_to_update.name:
-            index = i
-            break
-    if index != None:
-        bgs.pop(index)
-        if remove:
-            if len(bgs) == 0:
-                register.remove(ID)
-                return
-        else:
-            bgs.append(b_to_update)
-        register.update(ID, bgs)
+    if remove:
+        register.remove_item(ID, b_to_update.name)
+    else:
+        register.save_item(ID, b_to_update)
 
 def _add_bridge(b_to_add:Bridge):
     """Añade un bridge al registro
@@ -107,11 +99,7 @@ def _add_bridge(b_to_add:Bridge):
     Args:
         b_to_add (Bridge): Bridge a añadir
     """
-    cs = register.load(register_id=ID)
-    if cs == None:
-        register.add(ID, [b_to_add])
-    else:
-        register.update(ID, b_to_add, override=False)
+    register.save_item(ID, b_to_add)
         
 # -------------------------------------------------------------------      
 
@@ -1,35 +1,62 @@
 
 import logging
-import subprocess
-from time import sleep
-from os import remove
 from contextlib import suppress
 
 import dependencies.register.register as register
-from dependencies.utils.decorators import catch_foreach
+from dependencies.utils.decorators import catch_foreach, catch_foreach_async
 from dependencies.lxc_classes.container import Container, LxcError
+from dependencies.lxc_classes.container import RUNNING, FROZEN
+from dependencies.lxc_classes import records
 
 # ------------------ CONTROLADOR DE CONTENEDORES ---------------------
 # --------------------------------------------------------------------
 # Proporciona funciones para manipular los contenedores de forma
 # sencilla y maneja las excepciones y errores que se puedan dar a la 
 # hora de manipularlos (catch_foreach, se encarga de atrapar las 
-# excepciones cada vez que se llama a la funcion)
+# excepciones cada vez que se llama a la funcion). Las operaciones
+# sobre varios contenedores se pueden hacer en paralelo (ver
+# config_workers en dependencies/utils/decorators.py), con hilos o
+# con asyncio (las funciones terminadas en _async)
 # --------------------------------------------------------------------
 
 # Id con el que se van a guardar los contenedores en el registro
 ID = "containers"
+# Fichero de netplan que genera cloud-init en los contenedores
+NETPLAN_PATH = "/etc/netplan/50-cloud-init.yaml"
 cs_logger = logging.getLogger(__name__)
+# Se guardan en el registro con el formato compacto de records
+register.config_codec(ID, records.encode, records.decode)
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
-def init(c:Container=None):            
+def init(*cs:Container, source:str=None) -> list:
+    """Inicializa los contenedores y los guarda en el registro en el
+    mismo orden en el que se pasan (aunque se inicialicen en paralelo
+    el orden no cambia, de el dependen las ips que se les asignan)
+
+    Args:
+        source (str, optional): Contenedor o snapshot a partir del 
+            cual se copian los contenedores (ver templates). Si no se
+            indica se crean a partir de su imagen
+
+    Returns:
+        list: Contenedores inicializados con exito
+    """
+    with register.transaction():
+        successful = _init(*cs, source=source)
+        for c in successful:
+            _add_container(c)
+    return successful
+
+@catch_foreach(cs_logger, parallel=True)
+def _init(c:Container, source:str=None):
     cs_logger.info(f" Inicializando {c.tag} '{c.name}'...")
-    c.init()
+    if source == None:
+        c.init()
+    else:
+        c.copy(source)
     cs_logger.info(f" {c.tag} '{c.name}' inicializado con exito")
-    _add_container(c)
     
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
+@catch_foreach(cs_logger, context=register.transaction, parallel=True)
 def start(c:Container):
     cs_logger.info(f" Arrancando {c.tag} '{c.name}'...")
     c.start()
@@ -37,7 +64,7 @@ def start(c:Container):
     _update_container(c)
         
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
+@catch_foreach(cs_logger, context=register.transaction, parallel=True)
 def pause(c:Container):
     cs_logger.info(f" Pausando {c.tag} '{c.name}'...")
     c.pause()
@@ -45,7 +72,7 @@ def pause(c:Container):
     _update_container(c)
         
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
+@catch_foreach(cs_logger, context=register.transaction, parallel=True)
 def stop(c:Container):
     cs_logger.info(f" Deteniendo {c.tag} '{c.name}'...")
     c.stop()
@@ -53,7 +80,7 @@ def stop(c:Container):
     _update_container(c)
 
 # --------------------------------------------------------------------
-@catch_foreach(cs_logger)
+@catch_foreach(cs_logger, context=register.transaction, parallel=True)
 def delete(c:Container):
     with suppress(Exception):
         c.stop()
@@ -66,6 +93,54 @@ def delete(c:Container):
 @catch_foreach(cs_logger)
 def open_terminal(c:Container):
     c.open_terminal()
+
+# --------------------------------------------------------------------
+async def init_async(*cs:Container, source:str=None) -> list:
+    """Igual que init pero con asyncio"""
+    with register.transaction():
+        successful = await _init_async(*cs, source=source)
+        for c in successful:
+            _add_container(c)
+    return successful
+
+@catch_foreach_async(cs_logger)
+async def _init_async(c:Container, source:str=None):
+    cs_logger.info(f" Inicializando {c.tag} '{c.name}'...")
+    if source == None:
+        await c.init_async()
+    else:
+        await c.copy_async(source)
+    cs_logger.info(f" {c.tag} '{c.name}' inicializado con exito")
+
+@catch_foreach_async(cs_logger, context=register.transaction)
+async def start_async(c:Container):
+    cs_logger.info(f" Arrancando {c.tag} '{c.name}'...")
+    await c.start_async()
+    cs_logger.info(f" {c.tag} '{c.name}' arrancado con exito")
+    _update_container(c)
+
+@catch_foreach_async(cs_logger, context=register.transaction)
+async def pause_async(c:Container):
+    cs_logger.info(f" Pausando {c.tag} '{c.name}'...")
+    await c.pause_async()
+    cs_logger.info(f" {c.tag} '{c.name}' pausado con exito")
+    _update_container(c)
+
+@catch_foreach_async(cs_logger, context=register.transaction)
+async def stop_async(c:Container):
+    cs_logger.info(f" Deteniendo {c.tag} '{c.name}'...")
+    await c.stop_async()
+    cs_logger.info(f" {c.tag} '{c.name}' detenido con exito")
+    _update_container(c)
+
+@catch_foreach_async(cs_logger, context=register.transaction)
+async def delete_async(c:Container):
+    with suppress(Exception):
+        await c.stop_async()
+    cs_logger.info(f" Eliminando {c.tag} '{c.name}'...")
+    await c.delete_async()
+    cs_logger.info(f" {c.tag} '{c.name}' eliminado con exito")
+    _update_container(c, remove=True)
         
 # --------------------------------------------------------------------
 def connect(c:Container, with_ip:str, to_network:str):
@@ -87,67 +162,68 @@ def connect(c:Container, with_ip:str, to_network:str):
     _update_container(c)
 
 def configure_netfile(c:Container):
-    """Genera el fichero de configuracion .yaml del contenedor y lo
-    introduce en la carpeta correspondiente. Se arranca el contenedor
-    y se espera a que se cree el sistema de ficheros entero para poder
-    añadir el fichero a la ruta etc/netplan del contenedor
+    """Genera la configuracion de red (netplan) del contenedor y se la
+    pasa a cloud-init (user.network-config), que la escribe en
+    etc/netplan al arrancar por primera vez. Se hace con el contenedor
+    parado y sin ficheros temporales
 
     Args:
         c (Container): Contenedor a configurar
     """
     networks = c.networks
     if len(networks) == 1 and list(networks.keys())[0] == "eth0": return
-    config_file =("network:\n" +
-                  "    version: 2\n" + 
-                  "    ethernets:\n")
-    for eth in networks:
-        new_eth_config = (f"        {eth}:\n" + 
-                            "            dhcp4: true\n")
-        config_file += new_eth_config
-    msg = (f" Configurando el net_file del {c.tag} '{c.name}'... " +
-           "(Esta operacion puede tardar un rato dependiendo del PC " + 
-           "o incluso saltar el timeout si es muy lento)")
-    cs_logger.info(msg)
+    config_file = _netplan(c)
+    cs_logger.info(f" Configurando el net_file del {c.tag} '{c.name}'...")
     cs_logger.debug("\n" + config_file)
-    file_location = "50-cloud-init.yaml"
-    with open(file_location, "w") as file:
-        file.write(config_file)
-    # El problema esta en que lo crea, pero al hacer start o debido a
-    # que no se ha inicializado todavia, se crea el primer fichero 
-    # sobrescribiendo al nuestro
-    subprocess.run(["lxc","start",c.name])
-    error = "Error: not found"
-    time = 0
-    t0 = 2
-    timeout = 60
-    path = f"{c.name}/etc/netplan/50-cloud-init.yaml"
-    while "Error: not found" in error:
-        if not time >= timeout:
-            process = subprocess.run(
-                ["lxc","file","delete", path],
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE
-            )
-            error = process.stderr.decode().strip()
-            msg = (f"Intentando acceder al fichero de configuracion " + 
-                  f"de '{c.name}' (stderr = '{error}') -> " +
-                  ("SUCCESS" if error == "" else "ERROR"))
-            cs_logger.debug(msg)
-            sleep(t0)
-            time += t0
-        else:
-            subprocess.call(["lxc","stop",c.name])
-            cs_logger.error(f" Error al añadir fichero de " + 
-                            f"configuracion a '{c.name}' (timeout)")
-            remove(file_location)
-            return        
-    subprocess.call(["lxc","file","push", file_location, path])
-    subprocess.call(["lxc","stop",c.name])
+    try:
+        c.configure_network(config_file)
+    except LxcError as err:
+        cs_logger.error(err)
+        return
     cs_logger.info(f" Net del {c.tag} '{c.name}' configurada con exito")
-    remove(file_location)
     _update_container(c)
+
+def update_netfile(c:Container):
+    """Actualiza la configuracion de red de un contenedor que ya se
+    habia configurado (p.ej el balanceador al conectarlo a un bridge
+    nuevo). cloud-init solo aplica user.network-config en el primer
+    arranque, por lo que ademas se escribe el fichero de netplan en el
+    contenedor: si esta arrancado se aplica en el momento y si no al
+    arrancarlo
+
+    Args:
+        c (Container): Contenedor a configurar
+    """
+    # Por si todavia no se ha arrancado nunca
+    configure_netfile(c)
+    config_file = "network:\n" + _netplan(c, indent="    ")
+    cs_logger.info(f" Actualizando la red del {c.tag} '{c.name}'...")
+    try:
+        if c.state == RUNNING:
+            c.write_file(NETPLAN_PATH, config_file)
+            c.run_command("netplan", "apply")
+        else:
+            c.push_file(NETPLAN_PATH, config_file)
+    except LxcError as err:
+        cs_logger.error(err)
+        return
+    if c.state == FROZEN:
+        cs_logger.warning(f" El {c.tag} '{c.name}' esta pausado, su " +
+                        "nueva configuracion de red se aplicara cuando " +
+                                                        "se reinicie")
+    cs_logger.info(f" Red del {c.tag} '{c.name}' actualizada con exito")
     
 # --------------------------------------------------------------------    
+def _netplan(c:Container, indent:str="") -> str:
+    """Devuelve la configuracion de netplan (version 2) del contenedor,
+    con dhcp en cada una de sus ethernets"""
+    config_file = (f"{indent}version: 2\n" + 
+                   f"{indent}ethernets:\n")
+    for eth in c.networks:
+        config_file += (f"{indent}    {eth}:\n" + 
+                        f"{indent}        dhcp4: true\n")
+    return config_file
+
 def _update_container(c_to_update:Container, remove:bool=False):
     """Actualiza el objeto de un contenedor en el registro
 
@@ -156,21 +232,10 @@ def _update_container(c_to_update:Container, remove:bool=False):
         remove (bool, optional): Si es verdadero, se elimina el
             contenedor del registro. Por defecto es False
     """
-    cs = register.load(ID)
-    index = None
-    for i, c in enumerate(cs):
-        if c.name == c_to_update.name:
-            index = i
-            break
-    if index != None:
-        cs.pop(index)
-        if remove:
-            if len(cs) == 0:
-                register.remove(ID)
-                return
-        else:
-            cs.append(c_to_update)
-        register.update(ID, cs)
+    if remove:
+        register.remove_item(ID, c_to_update.name)
+    else:
+        register.save_item(ID, c_to_update)
 
 def _add_container(c_to_add:Container):
     """Añade un contenedor al registro
@@ -178,10 +243,6 @@ def _add_container(c_to_add:Container):
     Args:
         c_to_add (Container): Contenedor a añadir
     """
-    cs = register.load(register_id=ID)
-    if cs == None:
-        register.add(ID, [c_to_add])
-    else:
-        register.update(ID, c_to_add, override=False)
+    register.save_item(ID, c_to_add)
     
 # --------------------------------------------------------------------
@@ -0,0 +1,91 @@
+
+import logging
+from time import time
+
+import dependencies.register.register as register
+from dependencies.utils.decorators import catch_foreach
+from dependencies.lxc_classes.image import Image
+
+# -------------------- CONTROLADOR DE IMAGENES -----------------------
+# --------------------------------------------------------------------
+# Proporciona funciones para preparar las imagenes con las que se
+# crean los contenedores antes de empezar a desplegar la plataforma.
+# Los alias (p.ej ubuntu:18.04) se resuelven a su fingerprint y las
+# imagenes que no esten en el almacen local se copian en paralelo, de
+# forma que todos los contenedores se crean a partir de imagenes
+# locales y una imagen que no existe se detecta antes de crear nada.
+# La relacion alias -> fingerprint se guarda en el registro durante
+# TTL segundos para no tener que consultar el remoto cada vez
+# --------------------------------------------------------------------
+
+# Id con el que se va a guardar la cache de alias en el registro
+ID = "images"
+# Tiempo (s) durante el que se reutiliza el fingerprint de un alias
+TTL = 24*3600
+imgs_logger = logging.getLogger(__name__)
+# --------------------------------------------------------------------
+def prepare(*aliases:str) -> dict:
+    """Resuelve los alias de las imagenes a su fingerprint y copia al
+    almacen local las que falten
+
+    Returns:
+        dict: {alias: fingerprint} de todas las imagenes o None si
+            alguna no existe o no se ha podido copiar
+    """
+    imgs = [Image(alias) for alias in dict.fromkeys(aliases)]
+    cache = register.load(ID)
+    cache = {} if cache == None else cache
+    pending = []
+    for img in imgs:
+        entry = cache.get(img.alias)
+        if entry != None and time() - entry[1] < TTL:
+            img.fingerprint = entry[0]
+        else:
+            pending.append(img)
+    resolved = _resolve(*pending)
+    with register.transaction():
+        for img in resolved:
+            if img.alias != img.fingerprint:
+                _cache(img)
+    pulled = _pull(*[img for img in imgs if img.fingerprint != None])
+    for img in imgs:
+        if img not in pulled and img.fingerprint != None:
+            # Puede que el fingerprint guardado ya no sea valido
+            _forget(img)
+    if len(pulled) != len(imgs):
+        return None
+    return {img.alias: img.fingerprint for img in imgs}
+
+# --------------------------------------------------------------------
+@catch_foreach(imgs_logger, parallel=True)
+def _resolve(img:Image):
+    imgs_logger.info(f" Resolviendo imagen '{img.alias}'...")
+    img.resolve()
+    imgs_logger.debug(f" '{img.alias}' -> '{img.fingerprint}'")
+
+@catch_foreach(imgs_logger, parallel=True)
+def _pull(img:Image):
+    if img.is_local():
+        return
+    imgs_logger.info(f" Copiando imagen '{img.alias}' al almacen local...")
+    img.copy_to_local()
+    imgs_logger.info(f" imagen '{img.alias}' copiada con exito")
+
+# --------------------------------------------------------------------
+def _cache(img:Image):
+    """Guarda en el registro el fingerprint de un alias"""
+    entry = (img.fingerprint, time())
+    if register.load(ID) == None:
+        register.add(ID, {img.alias: entry})
+    else:
+        register.update(ID, entry, override=False, dict_id=img.alias)
+
+def _forget(img:Image):
+    """Elimina del registro el fingerprint de un alias"""
+    cache = register.load(ID)
+    if cache != None and img.alias in cache:
+        cache = {key: entry for key, entry in cache.items()
+                                            if key != img.alias}
+        register.update(ID, cache)
+
+# --------------------------------------------------------------------
@@ -0,0 +1,102 @@
+
+import logging
+
+import dependencies.register.register as register
+import dependencies.lxc_classes.state as lxc_state
+from dependencies.utils.decorators import catch_foreach
+from dependencies.lxc_classes.profile import Profile, LxcProfileError
+from dependencies.lxc_classes.state import LxcStateError
+
+# ------------------- CONTROLADOR DE PERFILES ------------------------
+# --------------------------------------------------------------------
+# Proporciona funciones para manipular los perfiles de lxc de forma
+# sencilla y maneja las excepciones y errores que se puedan dar a la
+# hora de manipularlos (catch_foreach, se encarga de atrapar las 
+# excepciones cada vez que se llama a la funcion)
+# --------------------------------------------------------------------
+
+# Id con el que se van a guardar los perfiles en el registro
+ID = "profiles"
+pfs_logger = logging.getLogger(__name__)
+# -------------------------------------------------------------------
+def ensure(*pfs:Profile) -> list:
+    """Crea los perfiles que no existan en lxc (aunque esten en el
+    registro, p.ej si se han eliminado fuera del programa) y actualiza
+    los que existen si su configuracion no coincide con la de pfs (p.ej
+    si se han cambiado los limites de machines.py)
+
+    Returns:
+        list: Perfiles que no se han podido crear
+    """
+    saved = register.load(ID)
+    saved = {} if saved == None else {p.name: p.config for p in saved}
+    try:
+        current = lxc_state.profiles()
+    except LxcStateError as err:
+        pfs_logger.warning(f" No se han podido consultar los perfiles " +
+                                        f"de lxc, se usa el registro: {err}")
+        current = saved
+    missing = [p for p in pfs if p.name not in current]
+    successful = init(*missing)
+    for p in pfs:
+        if p in missing:
+            continue
+        config = current[p.name]
+        changed = {
+            key: value for key, value in p.config.items()
+            if config.get(key) != value
+        }
+        # Solo se quitan las claves que habia puesto el programa
+        removed = [
+            key for key in saved.get(p.name, {})
+            if key not in p.config and key in config
+        ]
+        if len(changed) > 0 or len(removed) > 0:
+            update(p, changed, unset=removed)
+        elif p.name not in saved:
+            register.save_item(ID, p)
+    return [p for p in missing if p not in successful]
+
+# -------------------------------------------------------------------
+@catch_foreach(pfs_logger, context=register.transaction)
+def init(p:Profile):
+    pfs_logger.info(f" Creando perfil '{p.name}'...")
+    p.create()
+    pfs_logger.info(f" perfil '{p.name}' creado con exito")
+    register.save_item(ID, p)
+
+# -------------------------------------------------------------------
+@catch_foreach(pfs_logger, context=register.transaction)
+def delete(p:Profile):
+    pfs_logger.info(f" Eliminando perfil '{p.name}'...")
+    try:
+        p.delete()
+    except LxcProfileError as err:
+        if "not found" not in str(err):
+            raise
+        pfs_logger.warning(f" El perfil '{p.name}' ya no existe en lxc")
+    else:
+        pfs_logger.info(f" perfil '{p.name}' eliminado con exito")
+    register.remove_item(ID, p.name)
+
+# -------------------------------------------------------------------
+def update(p:Profile, config:dict, unset:list=[]):
+    """Modifica la configuracion de un perfil (p.ej sus limites). El
+    cambio se aplica a todos los contenedores que lo usan
+
+    Args:
+        p (Profile): Perfil a modificar
+        config (dict): Claves a modificar {clave: valor}
+        unset (list, optional): Claves a eliminar
+    """
+    pfs_logger.info(f" Modificando perfil '{p.name}' -> {config}" + 
+                            (f", se eliminan {unset}" if len(unset) > 0 else ""))
+    try:
+        p.set(config)
+        p.unset(unset)
+    except LxcProfileError as err:
+        pfs_logger.error(err)
+        return
+    register.save_item(ID, p)
+
+# -------------------------------------------------------------------
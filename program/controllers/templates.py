@@ -0,0 +1,111 @@
+
+import logging
+from contextlib import suppress
+
+import dependencies.register.register as register
+from dependencies.utils.decorators import catch_foreach
+from dependencies.lxc_classes.container import Container, LxcError
+from dependencies.lxc_classes.container import NOT_INIT, RUNNING
+from dependencies.lxc_classes import records
+
+# ------------------- CONTROLADOR DE PLANTILLAS ----------------------
+# --------------------------------------------------------------------
+# Proporciona funciones para manipular las plantillas (golden images)
+# a partir de las cuales se pueden crear los servidores. Una plantilla
+# es un contenedor que se crea una sola vez a partir de la imagen, se
+# arranca para que haga su primer arranque (cloud-init) y se deja
+# configurado como un servidor: con su perfil de limites y una
+# configuracion de red que pide ip por dhcp en cualquier ethernet (la
+# ip de cada servidor la fija despues su bridge). Luego se para y se
+# guarda una snapshot. Los servidores se crean copiando esa snapshot
+# (lxc copy), sin tener que volver a desempaquetar la imagen ni
+# configurar su red. Las plantillas no forman parte de la plataforma
+# (no se conectan a los bridges), se guardan en su propia pagina del
+# registro
+# --------------------------------------------------------------------
+
+# Id con el que se van a guardar las plantillas en el registro
+ID = "templates"
+# Nombre de la snapshot de la plantilla que se copia
+SNAPSHOT = "golden"
+# Configuracion de red de la plantilla (y de sus copias)
+NETPLAN_PATH = "/etc/netplan/60-arso.yaml"
+NETPLAN = ("network:\n" +
+           "    version: 2\n" +
+           "    ethernets:\n" +
+           "        arso:\n" +
+           "            match:\n" +
+           "                name: \"eth*\"\n" +
+           "            dhcp4: true\n")
+# Con esto cloud-init no vuelve a generar la red en el primer arranque
+# de las copias (se quedan con la de la plantilla)
+CLOUD_CFG_PATH = "/etc/cloud/cloud.cfg.d/99-arso-network.cfg"
+CLOUD_CFG = "network: {config: disabled}\n"
+tps_logger = logging.getLogger(__name__)
+# Se guardan en el registro con el formato compacto de records
+register.config_codec(ID, records.encode, records.decode)
+# --------------------------------------------------------------------
+def ensure(t:Container) -> str:
+    """Crea la plantilla si todavia no esta en el registro
+
+    Args:
+        t (Container): Plantilla a crear
+
+    Returns:
+        str: Origen a partir del cual se copian los contenedores
+            ('plantilla/snapshot') o None si no se ha podido crear
+    """
+    if register.load_item(ID, t.name) != None:
+        return source(t)
+    tps_logger.info(f" Creando plantilla '{t.name}' ({t.container_image})...")
+    try:
+        t.init()
+        _provision(t)
+        t.snapshot(SNAPSHOT)
+    except LxcError as err:
+        tps_logger.error(err)
+        with suppress(LxcError):
+            if t.state == RUNNING:
+                t.stop()
+            if t.state != NOT_INIT:
+                t.delete()
+        return None
+    register.save_item(ID, t)
+    tps_logger.info(f" plantilla '{t.name}' creada con exito")
+    return source(t)
+
+def source(t:Container) -> str:
+    """Devuelve la snapshot de la plantilla que se copia"""
+    return f"{t.name}/{SNAPSHOT}"
+
+# --------------------------------------------------------------------
+@catch_foreach(tps_logger, context=register.transaction)
+def delete(t:Container):
+    tps_logger.info(f" Eliminando plantilla '{t.name}'...")
+    try:
+        t.delete()
+    except LxcError as err:
+        if "not found" not in str(err):
+            raise
+        tps_logger.warning(f" La plantilla '{t.name}' ya no existe en lxc")
+    else:
+        tps_logger.info(f" plantilla '{t.name}' eliminada con exito")
+    register.remove_item(ID, t.name)
+
+# --------------------------------------------------------------------
+def _provision(t:Container):
+    """Arranca la plantilla, espera a que termine su primer arranque,
+    le deja la configuracion de red de los servidores y la para
+
+    Raises:
+        LxcError: Si falla alguno de los pasos
+    """
+    tps_logger.info(f" Configurando plantilla '{t.name}'...")
+    t.start()
+    # Si la imagen no tiene cloud-init no hay nada que esperar
+    t.run_command("sh", "-c", "cloud-init status --wait || true")
+    t.write_file(NETPLAN_PATH, NETPLAN)
+    t.write_file(CLOUD_CFG_PATH, CLOUD_CFG)
+    t.stop()
+
+# --------------------------------------------------------------------
@@ -1,17 +1,22 @@
 
 import os
-import re
 import logging
 import platform
+import shutil
+import hashlib
 import subprocess
-from time import sleep
-from functools import reduce
+from time import time
 from math import floor
 
 import program.controllers.bridges as bridges
 import program.controllers.containers as containers
+import program.controllers.addresses as addresses
+import program.machines as machines
 import dependencies.register.register as register
-from dependencies.utils.tools import pretty, objectlist_as_dict
+from dependencies.utils.tools import pretty, objectlist_as_dict, ask
+from dependencies.lxc_classes.monitor import Monitor
+import dependencies.lxc_classes.state as lxc_state
+from dependencies.lxc_classes.state import LxcStateError
 
 # --------------------- FUNCIONES DE PROGRAMA ------------------------
 # --------------------------------------------------------------------
@@ -25,13 +30,33 @@ class ProgramError(Exception):
     pass
 # --------------------------------------------------------------------
 program_logger = logging.getLogger(__name__)
+# Pagina del registro donde se guarda el ultimo estado de lxc que ha
+# revisado check_updates
+STATE_ID = "lxc_state"
+# Tiempo (s) durante el que no se vuelve a consultar el estado de lxc
+STATE_TTL = 5
+# Pagina del registro donde se guarda la comprobacion del entorno
+ENV_ID = "enviroment"
+# Dependencias opcionales y el aviso que se muestra si faltan
+_OPTIONAL_DEPENDENCIES = {
+    "xterm": (" 'xterm' no esta instalado en este ordenador y " +
+              "algunas funcionalidades pueden requerir este modulo. " + 
+              "Introduce 'sudo apt install xterm' en la linea de " + 
+              "comandos para instalarlo"),
+    "convert": (" 'imagemagick' no esta instalado en este ordenador y " +
+              "algunas funcionalidades pueden requerir este modulo. " + 
+              "Introduce 'sudo apt install imagemagick' en la linea de " + 
+              "comandos para instalarlo")
+}
 # --------------------------------------------------------------------
 def connect_machines():
     """ Se encarga de conectar los contenedores con los bridge. Mira 
     todos los contenedores creados (que estan en el registro) y si
     no se le ha asociado a ninguna network todavia lo conecta a una de
-    las existentes dependiendo del tag que tenga (Los servidores a
-    bridge 0, los clientes al bridge 1 y load balancer a los 2)"""
+    las existentes dependiendo del tag que tenga (Los servidores al
+    primer bridge de servidores que no este lleno, ver 
+    machines.capacity, los clientes al bridge 1 y el load balancer a
+    todos)"""
     
     # Si no hay puentes a los que conectar salimos
     bgs = objectlist_as_dict(
@@ -43,34 +68,80 @@ def connect_machines():
     cs = register.load(containers.ID)
     if cs == None: return
     
-    j = 0
-    existing_ips = []
-    for c in cs:
-        existing_ips += c.networks.values()
-    for c in cs:
-        # Si ya se ha conectado continuamos con la siguiente
-        if len(c.networks) > 0: continue
-        bridges_to_connect = []
-        if c.tag == "server" or c.tag == "load balancer":
-            if "lxdbr0" in bgs:
-                bridges_to_connect.append(bgs['lxdbr0'])
-        if c.tag == "client" or c.tag == "load balancer":
-            if "lxdbr1" in bgs:
-                bridges_to_connect.append(bgs['lxdbr1'])
-        for b in bridges_to_connect:
-            # Asiganamos una ip que no exista todavia
-            ip = f"{b.ipv4_addr[:-4]}{j+10}"
-            while ip in existing_ips:
-                j += 1    
-                ip = f"{b.ipv4_addr[:-4]}{j+10}"  
-            existing_ips.append(ip)
-            bridges.attach(c.name, to_bridge=b)
-            containers.connect(
-                c,
-                with_ip=ip,
-                to_network=b.ethernet
-            )
-        containers.configure_netfile(c)
+    server_names = set(c.name for c in cs if c.tag == machines.SERVER)
+    # Servidores conectados a cada bridge
+    load = {name: len(server_names.intersection(b.used_by))
+                                        for name, b in bgs.items()}
+    from dependencies.utils.ipam import IpamError
+    # Todas las conexiones se guardan en el registro de una sola vez
+    with register.transaction():
+        existing_ips = [ip for c in cs for ip in c.networks.values()]
+        for c in cs:
+            bridges_to_connect = select_bridges(c, bgs, load)
+            if len(bridges_to_connect) == 0:
+                if c.tag == machines.SERVER and len(c.networks) == 0:
+                    program_logger.error(f" No queda sitio para '{c.name}'" +
+                                        " en los bridges de los servidores")
+                continue
+            # El balanceador ya arrancado no vuelve a leer la
+            # configuracion de red de cloud-init
+            reconfigure = c.tag == machines.LB and len(c.networks) > 0
+            for b in bridges_to_connect:
+                # Asiganamos una ip que no exista todavia
+                try:
+                    ip = addresses.allocate(b, in_use=existing_ips)
+                except IpamError as err:
+                    program_logger.error(err)
+                    continue
+                bridges.attach(c.name, to_bridge=b)
+                containers.connect(
+                    c,
+                    with_ip=ip,
+                    to_network=b.ethernet
+                )
+            if reconfigure:
+                containers.update_netfile(c)
+            else:
+                containers.configure_netfile(c)
+
+def select_bridges(c, bgs:dict, load:dict) -> list:
+    """Devuelve los bridges a los que hay que conectar un contenedor.
+    Los servidores van al primer bridge de servidores que no este
+    lleno (ver machines.capacity), los clientes al bridge de los
+    clientes y el balanceador a todos a los que no este conectado
+    todavia. Los contenedores que ya estan conectados (salvo el
+    balanceador) no se conectan a ningun otro
+
+    Args:
+        c (Container): Contenedor a conectar
+        bgs (dict): Bridges existentes por nombre
+        load (dict): Numero de servidores conectados a cada bridge. Se
+            actualiza con el servidor que se asigna
+
+    Returns:
+        list: Bridges a los que conectar el contenedor (vacia si no
+            hay que conectarlo o si no queda sitio)
+    """
+    client_bg = bgs.get(f"lxdbr{machines.CLIENT_BRIDGE}")
+    # Bridges de los servidores en orden (lxdbr0, lxdbr2, lxdbr3...)
+    server_bgs = [b for name, b in sorted(bgs.items(),
+                        key=lambda item: _bridge_index(item[0]))
+                                        if b is not client_bg]
+    if c.tag == machines.LB:
+        # El balanceador tiene que estar en todas las subredes
+        # (tambien en las de los bridges que se crean despues)
+        return [b for b in server_bgs + [client_bg]
+                    if b != None and b.ethernet not in c.networks]
+    # Si ya se ha conectado no hay que hacer nada
+    if len(c.networks) > 0: return []
+    if c.tag == machines.SERVER:
+        for b in server_bgs:
+            if load.get(b.name, 0) < machines.capacity["servers_per_bridge"]:
+                load[b.name] = load.get(b.name, 0) + 1
+                return [b]
+    elif c.tag == machines.CLIENT and client_bg != None:
+        return [client_bg]
+    return []
 
 def update_conexions():
     """Revisa si algun contenedor ha sido eliminado para 
@@ -147,22 +218,59 @@ def show_files_structure():
             program_logger.error(err)
     
 # --------------------------------------------------------------------   
-def check_enviroment():
+def check_enviroment(refresh:bool=False):
     """Revisa que todas las dependencias externas que necesita el 
     programa se encuentran disponibles en el PC y en caso contrario 
     lanza un error si la dependencia es obligatoria o un warning si
-    es opcional. 
+    es opcional. El resultado se guarda en el registro (ENV_ID) junto
+    con la ruta y la fecha de modificacion de cada ejecutable, y solo
+    se vuelve a comprobar si alguno de ellos cambia en el PATH
+
+    Args:
+        refresh (bool, optional): Si se quiere volver a comprobar
+            aunque no haya cambiado nada
 
     Raises:
         ProgramError: Si el SO que se esta usando no es Linux
         ProgramError: Si lxd no esta instalado
+        ProgramError: Si la capacidad configurada de la plataforma no
+            es valida (ver machines.config_capacity)
     """
+    try:
+        machines.config_capacity()
+    except machines.CapacityError as err:
+        raise ProgramError(err)
     system = platform.system()
     program_logger.debug(f" {system} OS detected")
     if system != "Linux":
         err = (" Este programa solo funciona sobre " + 
                         f"Linux -> {system} detectado")
         raise ProgramError(err)
+    signature = _env_signature()
+    cached = register.load(ENV_ID)
+    if not refresh and cached != None and cached["signature"] == signature:
+        program_logger.debug(" Usando la comprobacion del entorno guardada")
+        missing = cached["missing"]
+    else:
+        missing = _probe_enviroment()
+        env = {"signature": signature, "missing": missing}
+        if cached == None:
+            register.add(ENV_ID, env)
+        else:
+            register.update(ENV_ID, env)
+    for dependency in missing:
+        program_logger.warning(_OPTIONAL_DEPENDENCIES[dependency])
+
+def _probe_enviroment() -> list:
+    """Ejecuta las dependencias externas para comprobar que estan
+    instaladas (e inicializa lxd)
+
+    Raises:
+        ProgramError: Si lxd no esta instalado
+
+    Returns:
+        list: Nombres de las dependencias opcionales que faltan
+    """
     try:
         subprocess.run(
             ["lxd", "--version"],
@@ -176,41 +284,56 @@ def check_enviroment():
                "'sudo apt install lxd' en la linea de comandos para "
                "instalarlo")
         raise ProgramError(err)
-    try:
-        subprocess.run(
-            ["xterm", "--version"],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE
-        )
-    except:
-        warn = (" 'xterm' no esta instalado en este ordenador y " +
-              "algunas funcionalidades pueden requerir este modulo. " + 
-              "Introduce 'sudo apt install xterm' en la linea de " + 
-              "comandos para instalarlo")
-        program_logger.warning(warn)
-    try:
-        subprocess.run(
-            ["convert", "--version"],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE
-        )
-    except:
-        warn = (" 'imagemagick' no esta instalado en este ordenador y " +
-              "algunas funcionalidades pueden requerir este modulo. " + 
-              "Introduce 'sudo apt install imagemagick' en la linea de " + 
-              "comandos para instalarlo")
-        program_logger.warning(warn)
+    missing = []
+    for dependency in _OPTIONAL_DEPENDENCIES:
+        try:
+            subprocess.run(
+                [dependency, "--version"],
+                stderr=subprocess.PIPE,
+                stdout=subprocess.PIPE
+            )
+        except:
+            missing.append(dependency)
+    return missing
 
+def _env_signature() -> list:
+    """Devuelve la ruta real y la fecha de modificacion de cada
+    dependencia externa tal y como se encuentran en el PATH"""
+    signature = []
+    for dependency in ("lxd", *_OPTIONAL_DEPENDENCIES):
+        path = shutil.which(dependency)
+        if path != None:
+            path = os.path.realpath(path)
+            mtime = os.stat(path).st_mtime_ns
+        else:
+            mtime = None
+        signature.append((dependency, path, mtime))
+    return signature
 
 def check_updates():
     """Implementacion para detectar cambios que se hayan podido
     producir en los contenedores y bridges desde fuera del programa
     y actualizar las instancia guardadas en el registro. A partir 
     de las listas que proporciona lxc, se analiza si se han
-    producido cambios que se deban actualizar en el programa"""    
+    producido cambios que se deban actualizar en el programa.
+    El estado observado se guarda en el registro (STATE_ID) con su
+    huella, la hora y como estaban los contenedores en el registro:
+    si tiene menos de STATE_TTL segundos y el programa no ha
+    modificado ningun contenedor desde entonces no se vuelve a
+    consultar lxc y, si no, solo se revisan los contenedores cuyo
+    estado o ips han cambiado (en lxc o en el registro) desde la
+    ultima vez. En el registro solo se guardan (objeto a objeto) los
+    contenedores y bridges revisados, asi no se pierde lo que otro
+    proceso haya cambiado mientras tanto en el resto"""    
     cs_object = register.load(containers.ID)
     bgs = register.load(bridges.ID)
     if cs_object is None: return
+    expected = _expected(cs_object)
+    last = register.load(STATE_ID)
+    if last != None and last.get("expected") == expected and \
+                                0 <= time() - last["time"] < STATE_TTL:
+        program_logger.debug(" Estado de lxc reciente, no se consulta")
+        return
     # Cambiamos el nvl del logger para que siempre se muestren los
     # warning
     root_logger = logging.getLogger()
@@ -218,29 +341,52 @@ def check_updates():
     program_logger.debug(f" Nivel de logger establecido -> {lvl}")
     root_logger.level = logging.WARNING
     warned = False
+    # Leemos el estado actual de lxc
+    try:
+        cs_info = lxc_state.instances()
+        bgs_info = lxc_state.networks()
+    except LxcStateError as err:
+        program_logger.warning(err)
+        root_logger.level = lvl
+        return
+    observed = _observe(cs_info, bgs_info)
+    if last == None:
+        last = {"fingerprint": None, "instances": {}, "networks": None}
+    last_expected = last.get("expected") or {}
+    if bgs == None:
+        bgs = []
     # Detecamos los cambios que se hayan producido fuera del programa
-    # de los contenedores
-    process = subprocess.run(
-        ["lxc", "list"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    cs_info = lxclist_as_dict(process.stdout.decode())
-    headers = list(cs_info.keys())
+    # de los contenedores (solo de los que han cambiado en lxc)
     cs_updated = []
+    cs_checked = []
+    cs_removed = []
+    bgs_changed = set()
     for c in cs_object:
-        if c.name not in cs_info[headers[0]]:
+        # Si el programa ha cambiado el contenedor desde la ultima vez
+        # hay que compararlo con lxc aunque lxc no haya cambiado (p.ej
+        # se ha arrancado y despues se ha parado desde fuera)
+        unchanged = expected[c.name] == last_expected.get(c.name) and (
+            observed["fingerprint"] == last["fingerprint"] or
+                observed["instances"].get(c.name, False) ==
+                    last["instances"].get(c.name))
+        if unchanged:
+            cs_updated.append(c)
+            continue
+        if c.name not in cs_info:
             warn = (f" El contenedor '{c.name}' se ha eliminado fuera " +
                     "del programa (informacion actualizada)")
             for bg in bgs:
                 if c.name in bg.used_by:
                     bg.used_by.remove(c.name)
+                    bgs_changed.add(bg.name)
+            cs_removed.append(c.name)
+            addresses.release(c)
             program_logger.warning(warn)
             warned = True
             continue
-        index = cs_info[headers[0]].index(c.name)
-        if c.state != cs_info[headers[1]][index]:
-            new_state = cs_info[headers[1]][index]
+        info = cs_info[c.name]
+        if c.state != info.status:
+            new_state = info.status
             warn = (f" El contenedor '{c.name}' se ha modificado fuera " +
                    f"del programa, ha pasado de '{c.state}' a " + 
                    f"'{new_state}' (informacion actualizada)")
@@ -248,17 +394,7 @@ def check_updates():
             program_logger.warning(warn)
             warned = True
         if c.state == "RUNNING":
-            info = cs_info[headers[2]][index]
-            current_nets = {}
-            if info != "":
-                if type(info) != list:
-                    info = [info]
-                for line in info:
-                    splitted = re.split(r"\(| |\)", line)
-                    while "" in splitted:
-                            splitted.remove("")
-                    ipv4, current_eth = splitted
-                    current_nets[current_eth] = ipv4
+            current_nets = {eth: ips[-1] for eth, ips in info.ipv4.items()}
             for eth, ip in c.networks.items():
                 if eth not in current_nets:
                     warn = (f" La ethernet '{eth}' de '{c.name}' se ha " + 
@@ -277,6 +413,7 @@ def check_updates():
                                 f"de {ip}:{eth} a {new_ip}:{eth} " +
                                 "(informacion actualizada)")
                         c.networks[eth] = new_ip
+                        addresses.reassign(ip, new_ip)
                         program_logger.warning(warn)
                         warned = True
                     current_nets.pop(eth)
@@ -291,6 +428,7 @@ def check_updates():
                            f"'{bg.name}' (informacion actualizada)")
                         if c.name not in bg.used_by:
                             bg.used_by.append(c.name)
+                            bgs_changed.add(bg.name)
                         c.networks[eth] = current_nets[eth]
                         program_logger.warning(warn)
                         warned = True
@@ -299,44 +437,89 @@ def check_updates():
                     program_logger.warning(warn)
                     warned = True
         cs_updated.append(c)
-    if len(cs_updated) == 0:
-        register.remove(containers.ID)
-    else:
-        register.update(containers.ID, cs_updated)
-    # Detecamos los cambios que se hayan producido fuera del programa
-    # de los bridge   
-    process = subprocess.run(
-        ["lxc", "network", "list"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    bgs_info = lxclist_as_dict(process.stdout.decode())
-    headers = list(bgs_info.keys())
-    bgs_updated = []
-    for bg in bgs:
-        if bg.name not in bgs_info[headers[0]]:
-            warn = (f" El bridge '{bg.name}' se ha eliminado fuera " +
-                    "del programa (informacion actualizada)")
-            program_logger.warning(warn)
-            continue
-        bgs_updated.append(bg)
-    register.update(bridges.ID, bgs_updated)
+        cs_checked.append(c)
+    # Solo se escribe en el registro lo que se ha revisado
+    with register.transaction():
+        for name in cs_removed:
+            register.remove_item(containers.ID, name)
+        for c in cs_checked:
+            register.save_item(containers.ID, c)
+        # Detecamos los cambios que se hayan producido fuera del
+        # programa de los bridge (si ha cambiado alguna network)
+        if observed["networks"] != last["networks"]:
+            for bg in bgs:
+                if bg.name not in bgs_info:
+                    warn = (f" El bridge '{bg.name}' se ha eliminado " +
+                            "fuera del programa (informacion actualizada)")
+                    program_logger.warning(warn)
+                    register.remove_item(bridges.ID, bg.name)
+                    bgs_changed.discard(bg.name)
+        for bg in bgs:
+            if bg.name in bgs_changed:
+                register.save_item(bridges.ID, bg)
+        # Guardamos lo que se ha observado para la siguiente vez
+        observed["time"] = time()
+        observed["expected"] = _expected(cs_updated)
+        if register.load(STATE_ID) == None:
+            register.add(STATE_ID, observed)
+        else:
+            register.update(STATE_ID, observed)
     # Volvemos a poner el nvl de logger de antes y nos aseguramos que 
     # el usuario lea los warnings
     root_logger.level = lvl
     if warned:
         print("Se acaban de mostrar warnings importantes que pueden " + 
               "modificar el comportamiento del programa")
-        input("Pulsa enter para proseguir con la ejecucion una vez se " + 
+        ask("Pulsa enter para proseguir con la ejecucion una vez se " + 
               "hayan leido ")
 
+def _observe(cs_info:dict, bgs_info:dict) -> dict:
+    """Resume el estado de lxc que revisa check_updates
+
+    Args:
+        cs_info (dict): Estado de los contenedores (lxc_state)
+        bgs_info (dict): Estado de las networks (lxc_state)
+
+    Returns:
+        dict: {"instances": {nombre: (estado, ips)}, "networks":
+            [nombres], "fingerprint": huella de todo lo anterior}
+    """
+    instances = {
+        name: (info.status, sorted(
+            (eth, sorted(ips)) for eth, ips in info.ipv4.items()
+        ))
+        for name, info in cs_info.items()
+    }
+    networks = sorted(bgs_info)
+    summary = repr((sorted(instances.items()), networks)).encode()
+    return {
+        "instances": instances, "networks": networks,
+        "fingerprint": hashlib.sha1(summary).hexdigest()
+    }
+
+def _expected(cs:list) -> dict:
+    """Resume el estado de los contenedores segun el registro
+
+    Returns:
+        dict: {nombre: (estado, redes)}
+    """
+    return {c.name: (c.state, sorted(c.networks.items())) for c in cs}
+
+def _bridge_index(name:str) -> int:
+    """Devuelve el numero de un bridge (lxdbr10 -> 10) para ordenarlos
+    (los que no siguen ese formato van al final)"""
+    suffix = name[len("lxdbr"):]
+    return int(suffix) if name.startswith("lxdbr") and suffix.isdigit() \
+                                                    else float("inf")
+
 # --------------------------------------------------------------------  
 def lxc_list():
     """Se encarga de mostrar la lista de contenedores de lxc, pero 
     en caso de estar arrancados, como la ip tarda un rato en
     aparecer, la funcion espera a que se haya cargado toda la
-    informacion para mostrar la lista. Comprueba que todas las ips
-    hayan aparecido"""
+    informacion para mostrar la lista. Espera a que aparezcan las ips
+    de todos los contenedores arrancados (con Monitor, que se despierta
+    con los eventos de LXD en vez de consultar lxc cada poco tiempo)"""
     cs = register.load(containers.ID)
     program_logger.info(" Cargando resultados...")
     if cs == None:
@@ -348,98 +531,16 @@ def lxc_list():
     if len(total) == 0:
         subprocess.call(["lxc", "list"]) 
         return
-    ips = reduce(lambda acum, c: acum+len(c.networks), total, 0)
-    salida, t, twait, time_out= "", 0, 0.1, 10
-    while not salida.count(".") == 3*ips:
-        sleep(twait); t += twait
-        if t >= time_out:
+    networks = {c.name: list(c.networks) for c in total}
+    time_out = 10
+    with Monitor() as monitor:
+        if not monitor.wait_ipv4(networks, timeout=time_out):
             program_logger.error(" timeout del comando 'lxc list'")
             return
-        out = subprocess.Popen(["lxc", "list"], stdout=subprocess.PIPE) 
-        salida = out.stdout.read().decode()
-        salida = salida[:-1] # Eliminamos el ultimo salto de linea
-    print(salida)
+    subprocess.call(["lxc", "list"])
 
 def lxc_network_list():
     """Muestra la network list de lxc (bridges creados)"""
     subprocess.call(["lxc", "network", "list"])
     
-def lxclist_as_dict(string:str) -> dict:
-    """Analiza una lista de lxc y proporciona toda su informacion 
-    en forma de diccionario para que sea facilmente accesible.
-    CUIDADO: Los headers de la lista dependen del idioma en el que
-    este el ordenador anfitrion o del idioma usado de lxc (No 
-    siempre son los mismos)
-
-    Args:
-        string (str): string que contiene la lista de lxc
-
-    Returns:
-        dict: diccionario con la informacion de la lista (los 
-        headers son las claves del diccionario)
-    """
-    info = {}
-    chars = list(string)
-    colums = -1
-    line_length = 0
-    cells_length = []
-    cell_start = 1
-    # Calculamos la longitud de cada linea, la longitud de cada celda
-    # y el numero de filas y columnas
-    for i, c in enumerate(chars):
-        if c == "|":
-            break
-        line_length = i + 1
-        if c == "+":
-            colums += 1 
-            if colums > 0:
-                cells_length.append(line_length-1-cell_start)
-            cell_start = 1 + i
-            continue
-    rows = -1
-    lines = int(len(chars)/line_length)
-    for i in range(lines):
-        if chars[i*line_length] == "+":
-            rows += 1
-    # Vamos mirando cada linea de cada columna y vemos si es 
-    # una fila de guiones o es una fila con espacio en 
-    # blanco => informacion
-    _start = line_length + 1
-    for i in range(colums):
-        if i != 0:
-            _start += cells_length[i-1] + 1
-        _end = _start + cells_length[i] - 1
-        key = string[_start:_end].strip()
-        info[key] = []
-        k = 0
-        for j in range(rows):
-            start = _start + line_length*(k+j+1) 
-            while start < len(chars) and chars[start] == "-":
-                start += line_length
-            end = start + cells_length[i] - 1   
-            values = []
-            if start >= len(chars): continue
-            # Miramos si hay mas de una linea seguida con 
-            # informacion y con k recalibramos los siguientes
-            # start de las siguientes lineas
-            while chars[start] == " ":
-                value = string[start:end].strip()
-                values.append(value)
-                if len(values) >= 1:
-                    k += 1
-                start += line_length
-                end += line_length
-            # Establecemos un criterio de devolucion de la
-            # informacion para que luego sea mas facil de acceder
-            # a esta en otras funciones
-            if len(values) > 1:
-                while "" in values:
-                    values.remove("")
-            if len(values) == 1:
-                values = values[0]
-            if len(values) == 0:
-                values = ""
-            info[key].append(values)
-    return info
-
 # --------------------------------------------------------------------
\ No newline at end of file
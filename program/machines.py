@@ -1,9 +1,16 @@
 
+import json
+import hashlib
+from math import ceil
+from itertools import islice
+
 import program.controllers.bridges as bridges
 import program.controllers.containers as containers
+import program.controllers.addresses as addresses
 import dependencies.register.register as register
 from dependencies.lxc_classes.container import Container
 from dependencies.lxc_classes.bridge import Bridge
+from dependencies.lxc_classes.profile import Profile
 from dependencies.utils.tools import objectlist_as_dict
 
 # --------------------- MAQUINAS DEL PROGRAMA ------------------------
@@ -17,7 +24,93 @@ from dependencies.utils.tools import objectlist_as_dict
 SERVER = "server"; LB = "load balancer"; CLIENT  = "client"
 # Imagen por defecto con la que se van a crear los contenedores
 default_image = "ubuntu:18.04"
+# Limites de recursos de los contenedores de cada tag. Se aplican con
+# un perfil de lxc por tag (modificar el perfil cambia los limites de
+# todos los contenedores que lo usan)
+limits = {
+    SERVER: {"limits.cpu.allowance": "40ms/200ms",
+             "limits.memory": "1024MB", "limits.cpu": "2"},
+    LB: {"limits.cpu.allowance": "40ms/200ms",
+         "limits.memory": "1024MB", "limits.cpu": "2"},
+    CLIENT: {"limits.cpu.allowance": "40ms/200ms",
+             "limits.memory": "1024MB", "limits.cpu": "2"}
+}
+# Nombre del perfil de cada tag
+profile_names = {SERVER: "arso-server", LB: "arso-lb", CLIENT: "arso-client"}
+# Capacidad de la plataforma. Los servidores se reparten entre varios
+# bridges (lxdbr0, lxdbr2, lxdbr3...) con como mucho
+# servers_per_bridge servidores cada uno y el balanceador se conecta
+# a todos ellos. lxdbr1 es siempre el bridge de los clientes. Cada
+# bridge tiene una subred /SUBNET_PREFIX de network. Se puede cambiar
+# en el fichero CAPACITY_PATH (ver config_capacity)
+capacity = {"max_servers": 500, "servers_per_bridge": 100,
+                                            "network": "10.0.0.0/16"}
+# Fichero con la capacidad de la plataforma
+CAPACITY_PATH = "program/resources/capacity.json"
+# Longitud del prefijo de la subred de cada bridge
+SUBNET_PREFIX = 24
+# Indice del bridge de los clientes
+CLIENT_BRIDGE = 1
+
+class CapacityError(Exception):
+    pass
 # --------------------------------------------------------------------
+def config_capacity(path:str=CAPACITY_PATH):
+    """Carga la capacidad de la plataforma de un fichero json con
+    alguna de las claves de capacity (las que no esten mantienen su
+    valor). Si el fichero no existe no cambia nada
+
+    Args:
+        path (str, optional): Ruta del fichero
+
+    Raises:
+        CapacityError: Si el fichero no es valido o la capacidad no
+            cabe en la red (ver check_capacity)
+    """
+    try:
+        with open(path) as file:
+            config = json.load(file)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as err:
+        raise CapacityError(f" No se ha podido leer '{path}': {err}")
+    if type(config) != dict or not set(config).issubset(capacity):
+        raise CapacityError(f" '{path}' solo puede tener las claves " +
+                                            f"{list(capacity)}")
+    new_capacity = dict(capacity, **config)
+    check_capacity(new_capacity)
+    capacity.update(new_capacity)
+
+def check_capacity(new_capacity:dict):
+    """Comprueba que en la red hay una subred para cada bridge que
+    puede necesitar la plataforma y que en cada subred caben sus
+    servidores (y el balanceador)
+
+    Args:
+        new_capacity (dict): Capacidad con las claves de capacity
+
+    Raises:
+        CapacityError: Si la capacidad no es valida
+    """
+    max_servers = new_capacity["max_servers"]
+    per_bridge = new_capacity["servers_per_bridge"]
+    for key, value in (("max_servers", max_servers),
+                                        ("servers_per_bridge", per_bridge)):
+        if type(value) != int or value < 1:
+            raise CapacityError(f" '{key}' debe ser un entero positivo")
+    network = _network(new_capacity["network"])
+    # Sin la direccion de broadcast ni las reservadas (FIRST_HOST)
+    hosts = 2**(network.max_prefixlen - SUBNET_PREFIX) - 1 - \
+                                                    addresses.FIRST_HOST
+    if per_bridge + 1 > hosts:
+        raise CapacityError(f" En una subred /{SUBNET_PREFIX} solo caben " +
+                            f"{hosts - 1} servidores por bridge")
+    subnets = 2**(SUBNET_PREFIX - network.prefixlen)
+    needed = max(1, ceil(max_servers/per_bridge)) + 1
+    if needed > subnets:
+        raise CapacityError(f" Con {per_bridge} servidores por bridge " +
+                f"hacen falta {needed} subredes /{SUBNET_PREFIX} y en " +
+                            f"'{network}' solo hay {subnets}")
 def get_loadbalancer(image:str=default_image) -> Container:
     """Devuelve el objeto del LB configurado
 
@@ -28,7 +121,7 @@ def get_loadbalancer(image:str=default_image) -> Container:
     Returns:
         Container: objeto del balanceador de carga configurado
     """
-    return Container("lb", image, tag=LB)
+    return Container("lb", image, tag=LB, profiles=[profile_names[LB]])
 
 def get_clients(image:str()=default_image) -> Container:
     """Devuelve el objeto del cliente configurado
@@ -40,7 +133,8 @@ def get_clients(image:str()=default_image) -> Container:
     Returns:
         Container: objeto del cliente configurado
     """
-    return Container("cl", image, tag=CLIENT)
+    return Container("cl", image, tag=CLIENT,
+                                profiles=[profile_names[CLIENT]])
 
 def get_servers(num:int(), *names, image:str()=default_image) -> list:
     """Devuelve los objetos de los servidores que se vayan a crear 
@@ -58,30 +152,99 @@ def get_servers(num:int(), *names, image:str()=default_image) -> list:
     servs = []
     server_names = _process_names(num, *names)
     for name in server_names:
-        servs.append(Container(name, image, tag=SERVER))
+        servs.append(Container(name, image, tag=SERVER,
+                                    profiles=[profile_names[SERVER]]))
     return servs
 
+def get_template(image:str=default_image) -> Container:
+    """Devuelve el objeto de la plantilla a partir de la cual se
+    pueden copiar los servidores (hay una por imagen)
+
+    Args:
+        image (str, optional): imagen de la plantilla.
+            Por defecto se utiliza la especificada en default_image.
+
+    Returns:
+        Container: objeto de la plantilla
+    """
+    digest = hashlib.sha1(image.encode()).hexdigest()[:8]
+    return Container(f"arso-template-{digest}", image, tag=SERVER,
+                                    profiles=[profile_names[SERVER]])
+
 def get_bridges(numBridges:int) -> list:
     """Devuelve los objetos de los bridges que se vayan a crear 
-    configurados
+    configurados (el bridge i en la subred i de la red de capacity,
+    p.ej 10.0.i.0/24)
 
     Args:
         numBridges (int): Numero de bridges a crear
 
+    Raises:
+        CapacityError: Si no hay tantas subredes en la red
+
     Returns:
         list: lista de objetos de tipo Bridge
     """
+    network = _network(capacity["network"])
+    subnets = list(islice(network.subnets(new_prefix=SUBNET_PREFIX),
+                                                            numBridges))
+    if len(subnets) < numBridges:
+        raise CapacityError(f" En '{network}' no caben {numBridges} " +
+                                    f"subredes /{SUBNET_PREFIX}")
     bgs = []
-    for i in range(numBridges):
+    for i, subnet in enumerate(subnets):
         b_name = f"lxdbr{i}"
         b = Bridge(
             b_name, 
             ethernet=f"eth{i}",
-            ipv4_nat=True, ipv4_addr=f"10.0.{i}.1/24"
+            ipv4_nat=True,
+            ipv4_addr=f"{subnet.network_address + 1}/{SUBNET_PREFIX}"
         )
         bgs.append(b)
     return bgs
 
+def count_bridges(numServs:int) -> int:
+    """Devuelve el numero de bridges que necesita la plataforma para
+    un numero de servidores (los de los servidores mas el de los
+    clientes), ver capacity
+
+    Args:
+        numServs (int): Numero total de servidores
+
+    Returns:
+        int: Numero de bridges (se crean con get_bridges)
+    """
+    per_bridge = capacity["servers_per_bridge"]
+    return max(1, ceil(numServs/per_bridge)) + 1
+
+def get_profiles() -> list:
+    """Devuelve los perfiles con los limites de recursos de cada tipo
+    de contenedor
+
+    Returns:
+        list: lista de objetos de tipo Profile
+    """
+    return [Profile(profile_names[tag], limits[tag]) for tag in limits]
+
+def _network(network:str) -> "ipaddress.IPv4Network":
+    """Devuelve la red en la que se crean las subredes de los bridges
+    (ipaddress se importa aqui, solo hace falta al crear bridges o si
+    se cambia la capacidad)
+
+    Raises:
+        CapacityError: Si no es una red ipv4 valida o es mas pequeña
+            que una subred
+    """
+    import ipaddress
+    try:
+        net = ipaddress.IPv4Network(network)
+    except ValueError as err:
+        raise CapacityError(f" '{network}' no es una red valida: {err}")
+    if net.prefixlen > SUBNET_PREFIX:
+        raise CapacityError(f" La red '{network}' es mas pequeña que " +
+                                        f"una subred /{SUBNET_PREFIX}")
+    return net
+
 def _process_names(num:int, *names) -> list:
     """Se encarga de proporcionar una lista con nombres validos 
     para los contenedores que se vayan a crear. Mira en el registro
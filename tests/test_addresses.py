@@ -0,0 +1,44 @@
+import unittest
+
+import program.controllers.addresses as addresses
+import dependencies.register.register as register
+from dependencies.lxc_classes.bridge import Bridge
+from dependencies.lxc_classes.container import Container
+from tests.test_register import RegisterTestCase
+
+# ---------------------- PRUEBAS DEL REPARTO DE IPS ------------------
+# --------------------------------------------------------------------
+# Comprueba que las subredes guardadas en el registro solo cambian
+# cuando se confirman los cambios (las de la cache no se modifican
+# al repartir o liberar ips dentro de una transaccion que se deshace)
+# --------------------------------------------------------------------
+class RollbackTest(RegisterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.b = Bridge("lxdbr0", ethernet="eth0", ipv4_addr="10.0.0.1/24")
+        self.ip = addresses.allocate(self.b)
+
+    def rollback(self, action):
+        with self.assertRaises(KeyError):
+            with register.transaction():
+                action()
+                raise KeyError()
+
+    def test_allocate(self):
+        self.rollback(lambda: addresses.allocate(self.b))
+        self.assertEqual(register.load(addresses.ID)["lxdbr0"].free(), 244)
+        self.assertEqual(addresses.allocate(self.b), "10.0.0.11")
+
+    def test_release(self):
+        c = Container("s1", "img")
+        c.networks = {"eth0": self.ip}
+        self.rollback(lambda: addresses.release(c))
+        self.assertIn(self.ip, register.load(addresses.ID)["lxdbr0"])
+        self.assertEqual(register.load(addresses.ID)["lxdbr0"].free(), 244)
+        self.rollback(lambda: addresses.reassign(self.ip, "10.0.0.20"))
+        self.assertEqual(register.load(addresses.ID)["lxdbr0"].free(), 244)
+        self.assertEqual(addresses.allocate(self.b), "10.0.0.11")
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
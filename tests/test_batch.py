@@ -0,0 +1,47 @@
+import io
+import unittest
+from unittest import mock
+
+import bash.bash_handler as bash
+from bash.bash_handler import CmdLineError
+from dependencies.utils.tools import ask
+
+# ------------------- PRUEBAS DEL MODO POR LOTES ---------------------
+# --------------------------------------------------------------------
+# Comprueba que las ordenes de un fichero (--batch) se validan todas,
+# parametros incluidos, antes de ejecutar ninguna y que las preguntas
+# al usuario se responden con 'no' cuando ya no se puede leer nada de
+# la entrada estandar
+# --------------------------------------------------------------------
+class ParseBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.cli = bash.config_cli()
+
+    def test_merges_fleet_commands(self):
+        batch = bash.parse_batch(self.cli, [
+            "crear 3 # comentario\n", "\n", "arrancar s1\n", "arrancar s2\n",
+            "show state\n"
+        ], flags=["-q"])
+        self.assertEqual([b["cmd"] for b in batch], [
+            {"crear": [3]}, {"arrancar": ["s1", "s2"]}, {"show": ["state"]}
+        ])
+        self.assertTrue(all(b["flags"] == ["-q"] for b in batch))
+
+    def test_checks_parameters(self):
+        for line in ("crear abc", "añadir 0", "añadir -2", "show nada",
+                                                    "parar -j 100"):
+            with self.assertRaises(CmdLineError, msg=line):
+                bash.parse_batch(self.cli, ["show state\n", line + "\n"])
+
+class AskTest(unittest.TestCase):
+    def test_end_of_input_is_no(self):
+        with mock.patch("sys.stdin", io.StringIO("")), \
+                                mock.patch("sys.stdout", io.StringIO()):
+            self.assertEqual(ask("¿Estas seguro?(y/n): "), "")
+        with mock.patch("sys.stdin", io.StringIO("y\n")), \
+                                mock.patch("sys.stdout", io.StringIO()):
+            self.assertEqual(ask("¿Estas seguro?(y/n): "), "y")
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
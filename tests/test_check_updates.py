@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+import program.functions as functions
+import program.controllers.bridges as bridges
+import program.controllers.containers as containers
+import dependencies.register.register as register
+from dependencies.lxc_classes.state import InstanceState, NetworkState
+from dependencies.lxc_classes.container import Container
+from dependencies.lxc_classes.bridge import Bridge
+from tests.test_register import RegisterTestCase
+
+# --------------- PRUEBAS DE LA REVISION DEL ESTADO DE LXC -----------
+# --------------------------------------------------------------------
+# Comprueba que check_updates solo guarda los contenedores y bridges
+# que revisa, sin pisar lo que otro proceso guarde en el registro
+# mientras se consulta lxc (el estado de lxc es falso)
+# --------------------------------------------------------------------
+class CheckUpdatesTest(RegisterTestCase):
+    def setUp(self):
+        super().setUp()
+        s1, s2 = Container("s1", "img"), Container("s2", "img")
+        s1.state, s2.state = "RUNNING", "STOPPED"
+        b = Bridge("lxdbr0", ethernet="eth0")
+        b.used_by = ["s1", "s2"]
+        register.add(containers.ID, [s1, s2])
+        register.add(bridges.ID, [b])
+
+    def check_updates(self, cs_info:dict, bgs_info:dict, meanwhile:str):
+        def instances():
+            # Otro proceso guarda algo mientras se consulta lxc
+            self.run_process("import program.controllers.containers\n" +
+                                                                meanwhile)
+            return cs_info
+        with mock.patch.object(functions.lxc_state, "instances", instances), \
+                mock.patch.object(functions.lxc_state, "networks",
+                                                    lambda: bgs_info), \
+                mock.patch("builtins.input"):
+            functions.check_updates()
+        register.clear_cache()
+
+    def test_keeps_concurrent_changes(self):
+        cs_info = {
+            "s1": InstanceState("s1", "STOPPED", {}),
+            "s2": InstanceState("s2", "STOPPED", {})
+        }
+        bgs_info = {"lxdbr0": NetworkState("lxdbr0", "bridge", True, [])}
+        self.check_updates(cs_info, bgs_info,
+            "c = Container('s3', 'img')\n"
+            "c.state = 'RUNNING'\n"
+            "register.save_item('containers', c)"
+        )
+        cs = {c.name: c.state for c in register.load(containers.ID)}
+        self.assertEqual(cs, {"s1": "STOPPED", "s2": "STOPPED",
+                                                    "s3": "RUNNING"})
+
+    def test_removed_outside(self):
+        cs_info = {"s2": InstanceState("s2", "STOPPED", {})}
+        self.check_updates(cs_info, {},
+            "import program.controllers.bridges\n"
+            "register.save_item('bridges', "
+                            "register.load_item('bridges', 'lxdbr0'))\n"
+            "register.save_item('containers', Container('s3', 'img'))"
+        )
+        self.assertEqual(self.names(containers.ID), ["s2", "s3"])
+        # El bridge ya no existe en lxc
+        self.assertEqual(register.load(bridges.ID), None)
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import socketserver
+from http.server import BaseHTTPRequestHandler
+
+import dependencies.lxc_classes.lxd_api as lxd_api
+from dependencies.lxc_classes.lxd_api import LxdApiError
+
+# ---------------------- PRUEBAS DE LA API DE LXD --------------------
+# --------------------------------------------------------------------
+# Comprueba la traduccion de los comandos de lxc a peticiones de la
+# API REST (lxd_api.execute) contra un LXD falso que atiende en un
+# socket unix local. El servidor falso guarda todas las peticiones que
+# recibe y contesta como LXD: las operaciones que en LXD son
+# asincronas devuelven una operacion que se espera con /wait
+# --------------------------------------------------------------------
+
+# Operacion que devuelve el servidor falso en las respuestas asincronas
+OPERATION = "/1.0/operations/op1"
+# --------------------------------------------------------------------
+class FakeLxd(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """LXD falso. requests guarda (metodo, ruta, cuerpo, cabeceras) de
+    cada peticion y fail_operation hace que falle la siguiente
+    operacion asincrona"""
+    daemon_threads = True
+
+    def __init__(self, path:str):
+        super().__init__(path, _FakeLxdHandler)
+        self.requests = []
+        self.fail_operation = None
+        self.instance = {
+            "architecture": "x86_64", "config": {}, "ephemeral": False,
+            "profiles": ["default"], "description": "", "status": "Stopped",
+            "devices": {},
+            "expanded_devices": {"eth0": {"type": "nic", "parent": "lxdbr0"}}
+        }
+
+    def calls(self) -> list:
+        """Peticiones recibidas sin las de /1.0 y las esperas de las
+        operaciones"""
+        return [r[:3] for r in self.requests
+                if r[1] != "/1.0" and not r[1].startswith(OPERATION)]
+
+class _FakeLxdHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return "unix"
+
+    def _reply(self, body:dict, status:int=200, headers:dict={}):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length > 0 else None
+        server = self.server
+        server.requests.append(
+            (self.command, self.path, body, dict(self.headers))
+        )
+        path = self.path.split("?")[0]
+        if path == "/1.0":
+            self._reply({"type": "sync", "metadata":
+                            {"api_extensions": ["instances"]}})
+        elif path == OPERATION + "/wait":
+            error, server.fail_operation = server.fail_operation, None
+            metadata = {"status_code": 200, "status": "Success", "err": ""}
+            if error != None:
+                metadata = {"status_code": 400, "status": "Failure",
+                                                        "err": error}
+            self._reply({"type": "sync", "metadata": metadata})
+        elif path.endswith("/missing"):
+            self._reply({"type": "error", "error": "not found",
+                                            "error_code": 404}, 404)
+        elif path.startswith("/1.0/instances") and \
+                (self.command in ("POST", "DELETE") or path.endswith("/state")):
+            self._reply({"type": "async", "operation": OPERATION,
+                                                    "metadata": {}}, 202)
+        elif path.startswith("/1.0/instances/") and self.command == "GET":
+            self._reply({"type": "sync", "metadata": server.instance},
+                                                    headers={"ETag": "e1"})
+        elif path.startswith("/1.0/networks/") and self.command == "GET":
+            self._reply({"type": "sync", "metadata": {
+                "name": path.rsplit("/", 1)[1],
+                "config": {"ipv4.nat": "true", "ipv4.address": "10.0.0.1/24"}
+            }})
+        else:
+            self._reply({"type": "sync", "metadata": {}})
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+# --------------------------------------------------------------------
+class LxdApiTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="lxd_api_")
+        path = os.path.join(self.tmp_dir, "unix.socket")
+        self.server = FakeLxd(path)
+        threading.Thread(target=self.server.serve_forever, args=(0.05,),
+                                                    daemon=True).start()
+        lxd_api.config_api(True, path)
+
+    def tearDown(self):
+        lxd_api.config_api(False)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def execute(self, *args) -> list:
+        """Ejecuta un comando de lxc y devuelve las peticiones que ha
+        generado"""
+        self.server.requests.clear()
+        self.assertEqual(lxd_api.execute(["lxc", *args]), "")
+        return self.server.calls()
+
+    # ----------------------------------------------------------------
+    def test_init(self):
+        calls = self.execute("init", "ubuntu:18.04", "s1", "-p", "arso-server")
+        self.assertEqual(calls, [("POST", "/1.0/instances", {
+            "name": "s1", "profiles": ["arso-server"],
+            "source": {
+                "type": "image", "alias": "18.04", "mode": "pull",
+                "server": lxd_api.REMOTES["ubuntu"], "protocol": "simplestreams"
+            }
+        })])
+        fingerprint = "f601e6d88db23ca1"
+        calls = self.execute("init", fingerprint, "s2")
+        self.assertEqual(calls, [("POST", "/1.0/instances", {
+            "name": "s2", "source": {"type": "image", "fingerprint": fingerprint}
+        })])
+
+    def test_copy_and_snapshot(self):
+        calls = self.execute("copy", "template/golden", "s1")
+        self.assertEqual(calls, [("POST", "/1.0/instances", {
+            "name": "s1", "source": {"type": "copy", "source": "template/golden"}
+        })])
+        calls = self.execute("snapshot", "template", "golden")
+        self.assertEqual(calls, [
+            ("POST", "/1.0/instances/template/snapshots", {"name": "golden"})
+        ])
+
+    def test_state(self):
+        for cmd, action in (("start", "start"), ("stop", "stop"),
+                                                ("pause", "freeze")):
+            calls = self.execute(cmd, "s1")
+            self.assertEqual(calls, [("PUT", "/1.0/instances/s1/state", {
+                "action": action, "timeout": 30, "force": False
+            })])
+        calls = self.execute("stop", "s1", "--force")
+        self.assertTrue(calls[0][2]["force"])
+
+    def test_delete(self):
+        calls = self.execute("delete", "s1")
+        self.assertEqual(calls, [("DELETE", "/1.0/instances/s1", None)])
+
+    def test_config(self):
+        calls = self.execute("config", "set", "s1", "limits.cpu", "2")
+        self.assertEqual(calls, [
+            ("PATCH", "/1.0/instances/s1", {"config": {"limits.cpu": "2"}})
+        ])
+        # Los dispositivos heredados del perfil se copian a la instancia
+        calls = self.execute("config", "device", "set", "s1", "eth0",
+                                            "ipv4.address", "10.0.0.11")
+        self.assertEqual([c[:2] for c in calls], [
+            ("GET", "/1.0/instances/s1"), ("PUT", "/1.0/instances/s1")
+        ])
+        devices = calls[1][2]["devices"]
+        self.assertEqual(devices["eth0"], {
+            "type": "nic", "parent": "lxdbr0", "ipv4.address": "10.0.0.11"
+        })
+        self.assertNotIn("status", calls[1][2])
+        self.assertEqual(self.server.requests[-1][3].get("If-Match"), "e1")
+        with self.assertRaises(LxdApiError):
+            self.execute("config", "device", "set", "s1", "eth9", "k", "v")
+
+    def test_network(self):
+        calls = self.execute("network", "create", "lxdbr0",
+                                    "ipv4.nat=true", "ipv4.address=10.0.0.1/24")
+        self.assertEqual(calls, [("POST", "/1.0/networks", {
+            "name": "lxdbr0",
+            "config": {"ipv4.nat": "true", "ipv4.address": "10.0.0.1/24"}
+        })])
+        calls = self.execute("network", "set", "lxdbr0", "ipv4.nat", "false")
+        self.assertEqual(calls, [
+            ("PATCH", "/1.0/networks/lxdbr0", {"config": {"ipv4.nat": "false"}})
+        ])
+        calls = self.execute("network", "attach", "lxdbr0", "s1", "eth0")
+        self.assertEqual(calls[1][2]["devices"]["eth0"], {
+            "type": "nic", "nictype": "bridged", "parent": "lxdbr0",
+            "name": "eth0"
+        })
+        calls = self.execute("network", "delete", "lxdbr0")
+        self.assertEqual(calls, [("DELETE", "/1.0/networks/lxdbr0", None)])
+        output = lxd_api.execute(["lxc", "network", "show", "lxdbr0"])
+        self.assertEqual(output, "config:\n  ipv4.address: 10.0.0.1/24\n" +
+                                    "  ipv4.nat: true\nname: lxdbr0\n")
+
+    def test_profile(self):
+        calls = self.execute("profile", "create", "arso-server",
+                                                "limits.memory=1GB")
+        self.assertEqual(calls, [("POST", "/1.0/profiles", {
+            "name": "arso-server", "config": {"limits.memory": "1GB"}
+        })])
+        calls = self.execute("profile", "set", "arso-server", "limits.cpu=2")
+        self.assertEqual(calls, [
+            ("PATCH", "/1.0/profiles/arso-server", {"config": {"limits.cpu": "2"}})
+        ])
+        calls = self.execute("profile", "delete", "arso-server")
+        self.assertEqual(calls, [("DELETE", "/1.0/profiles/arso-server", None)])
+
+    # ----------------------------------------------------------------
+    def test_fallback(self):
+        """Los comandos que no se pueden traducir devuelven None sin
+        hacer ninguna peticion (se ejecutan con lxc)"""
+        self.server.requests.clear()
+        for cmd in (["lxc", "exec", "s1", "--", "bash"],
+                    ["lxc", "file", "push", "f", "s1/etc/f"],
+                    ["lxc", "network", "list"],
+                    ["lxc", "init", "other-remote:18.04", "s1"],
+                    ["lxc", "copy", "remote:s1", "s2"],
+                    ["lxc", "config", "show", "s1"],
+                    ["lxc"], ["xterm", "-e", "lxc"]):
+            self.assertIsNone(lxd_api.execute(cmd), cmd)
+        self.assertEqual(self.server.calls(), [])
+
+    def test_errors(self):
+        self.server.fail_operation = "Instance is running"
+        with self.assertRaises(LxdApiError) as ctx:
+            lxd_api.execute(["lxc", "delete", "s1"])
+        self.assertIn("Instance is running", str(ctx.exception))
+        with self.assertRaises(LxdApiError):
+            lxd_api.execute(["lxc", "delete", "missing"])
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            lxd_api.execute(["lxc", "start", "s1"])
+        self.assertEqual(len(lxd_api._pool), 1)
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,269 @@
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+import dependencies.register.register as register
+import dependencies.register.sqlite_backend as sqlite_backend
+from dependencies.lxc_classes.container import Container
+
+# ---------------------- PRUEBAS DEL REGISTRO ------------------------
+# --------------------------------------------------------------------
+# Comprueba el registro (backend pickle) en una carpeta temporal. Lo
+# que otro proceso veria se comprueba leyendo el registro desde un
+# proceso nuevo (fresh_load), sin la cache de este
+# --------------------------------------------------------------------
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+X = "x"*4096
+# --------------------------------------------------------------------
+class RegisterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.old_path, self.old_backend = register.REL_PATH, register.BACKEND
+        register.config_location(self.dir + os.sep)
+        register.config_backend("pickle")
+
+    def tearDown(self):
+        register.REL_PATH = self.old_path
+        register.config_backend(self.old_backend)
+        shutil.rmtree(self.dir)
+
+    def journal(self, register_id:any) -> str:
+        shard = register._read_manifest()[register_id]
+        return register._path(shard) + register.JOURNAL_EXT
+
+    def fresh_load(self, register_id:any) -> object:
+        return self.run_process(f"print(repr(register.load({register_id!r})))")
+
+    def run_process(self, code:str, timeout:float=10) -> object:
+        """Ejecuta codigo en un proceso nuevo con el mismo registro y
+        devuelve lo que imprima (evaluado)"""
+        setup = (
+            "import sys, dependencies.register.register as register\n"
+            "from dependencies.lxc_classes.container import Container\n"
+            "register.config_location(sys.argv[1])\n"
+            "register.config_backend(sys.argv[2])\n"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", setup + code, self.dir + os.sep,
+                                                    register.BACKEND],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+            timeout=timeout
+        )
+        return eval(out.stdout) if out.stdout.strip() != "" else None
+
+    def names(self, register_id:any) -> list:
+        return [c.name for c in register.load(register_id)]
+
+# --------------------------------------------------------------------
+class TornJournalTest(RegisterTestCase):
+    def tear(self, garbage:bytes):
+        # La foto es grande para que el diario no se compacte
+        register.add("p", [X])
+        register.update("p", "a", override=False)
+        with open(self.journal("p"), "ab") as file:
+            file.write(garbage)
+        register.clear_cache()
+        self.assertEqual(register.load("p"), [X, "a"])
+
+    def test_append_after_torn_entry(self):
+        entry = pickle.dumps(("update", pickle.dumps(["c"]), None))
+        self.tear(entry[:len(entry)//2])
+        register.update("p", "b", override=False)
+        self.assertEqual(register.load("p"), [X, "a", "b"])
+        self.assertEqual(self.fresh_load("p"), [X, "a", "b"])
+
+    def test_corrupt_frame_header(self):
+        # La cabecera hace que pickle intente reservar memoria de mas
+        self.tear(b"\x80\x04\x8e\xff\xff\xff\xff\xff\xff\xff\x0f")
+        register.update("p", "b", override=False)
+        self.assertEqual(self.fresh_load("p"), [X, "a", "b"])
+
+# --------------------------------------------------------------------
+class CompactTest(RegisterTestCase):
+    def test_reader_between_snapshot_and_journal(self):
+        register.add("p", [X])
+        register.update("p", "a", override=False)
+        register.update("p", "b", override=False)
+        journal = self.journal("p")
+        # Se compacta hasta renombrar la foto, sin borrar el diario
+        with open(journal, "rb") as file:
+            old_journal = file.read()
+        register._compact(register._read_manifest()["p"], [X, "a", "b"], "p")
+        with open(journal, "wb") as file:
+            file.write(old_journal)
+        register.clear_cache()
+        self.assertEqual(register.load("p"), [X, "a", "b"])
+        self.assertEqual(self.fresh_load("p"), [X, "a", "b"])
+        # Las entradas nuevas se aplican aunque vayan detras
+        register.update("p", "c", override=False)
+        self.assertEqual(self.fresh_load("p"), [X, "a", "b", "c"])
+
+# --------------------------------------------------------------------
+class SingleFileTest(RegisterTestCase):
+    def setUp(self):
+        super().setUp()
+        # Registro con el formato antiguo: un fichero y su diario
+        with open(register.REL_PATH, "wb") as file:
+            pickle.dump({"p": ["a"], "q": 1}, file)
+        with open(register.REL_PATH + register.JOURNAL_EXT, "wb") as file:
+            pickle.dump(("update", "p", "b", None), file)
+
+    def test_migration(self):
+        self.assertEqual(register.load(), {"p": ["a", "b"], "q": 1})
+        self.assertTrue(os.path.isdir(register.REL_PATH))
+        legacy = register.REL_PATH + register.LEGACY_EXT
+        for path in (legacy, legacy + register.JOURNAL_EXT,
+                                register.REL_PATH + register.JOURNAL_EXT):
+            self.assertFalse(os.path.exists(path))
+
+    def test_interrupted_migration(self):
+        def crash(*args):
+            raise KeyboardInterrupt()
+        with mock.patch.object(register, "_write_manifest", crash):
+            with self.assertRaises(KeyboardInterrupt):
+                register.load()
+        register.clear_cache()
+        self.assertEqual(self.fresh_load(None), {"p": ["a", "b"], "q": 1})
+
+# --------------------------------------------------------------------
+class CacheTest(RegisterTestCase):
+    def test_load_returns_copies(self):
+        saved = ["a"]
+        register.add("p", saved)
+        register.add("d", {"k": 1})
+        saved.append("b")
+        register.load("p").append("c")
+        register.load("d")["k"] = 2
+        register.load()["p"].append("d")
+        self.assertEqual(register.load("p"), ["a"])
+        self.assertEqual(register.load("d"), {"k": 1})
+        self.assertGreater(register.cache_stats()["hits"], 0)
+
+    def test_transaction_returns_copies(self):
+        register.add("p", ["a"])
+        with register.transaction():
+            register.load("p").append("b")
+            self.assertEqual(register.load("p"), ["a"])
+            register.update("p", "c", override=False)
+        self.assertEqual(register.load("p"), ["a", "c"])
+
+# --------------------------------------------------------------------
+class TransactionTest(RegisterTestCase):
+    def test_readers_do_not_wait(self):
+        register.add("p", [Container("s1", "img")])
+        code = "print(repr([c.name for c in register.load('p')]))"
+        with register.transaction():
+            register.save_item("p", Container("s2", "img"))
+            # Otro proceso lee lo que ya estaba guardado
+            self.assertEqual(self.run_process(code, timeout=5), ["s1"])
+        with register._file_lock(exclusive=True):
+            # Mientras se escribe tambien (los ficheros se renombran)
+            self.assertEqual(self.run_process(code, timeout=5),
+                                                        ["s1", "s2"])
+
+    def test_commit_merges_items(self):
+        register.add("p", [Container("s1", "img"), Container("s2", "img")])
+        register.add("d", {"a": 1})
+        with register.transaction():
+            register.save_item("p", Container("s3", "img"))
+            register.remove_item("p", "s1")
+            register.update("d", 2, override=False, dict_id="b")
+            self.run_process(
+                "register.save_item('p', Container('s4', 'img'))\n"
+                "register.remove_item('p', 's2')\n"
+                "register.update('d', 3, override=False, dict_id='c')"
+            )
+        register.clear_cache()
+        # s4 se ha guardado antes de confirmar la transaccion
+        self.assertEqual(self.names("p"), ["s4", "s3"])
+        self.assertEqual(register.load("d"), {"a": 1, "b": 2, "c": 3})
+        self.assertEqual(self.fresh_load("d"), {"a": 1, "b": 2, "c": 3})
+
+    def test_rollback(self):
+        register.add("p", [Container("s1", "img")])
+        with self.assertRaises(KeyError):
+            with register.transaction():
+                register.remove_item("p", "s1")
+                register.add("q", 1)
+                self.assertEqual(register.load("p"), None)
+                raise KeyError()
+        self.assertEqual(list(register.load()), ["p"])
+        self.assertEqual(self.names("p"), ["s1"])
+
+    def test_empty_page_is_removed(self):
+        register.add("p", [Container("s1", "img")])
+        register.add("q", 1)
+        with register.transaction():
+            register.remove_item("p", "s1")
+        self.assertEqual(register.load("p"), None)
+        self.assertEqual(self.fresh_load("q"), 1)
+
+class SqliteTransactionTest(TransactionTest):
+    def setUp(self):
+        super().setUp()
+        register.config_backend("sqlite")
+
+    def test_readers_do_not_wait(self):
+        register.add("p", [Container("s1", "img")])
+        code = "print(repr([c.name for c in register.load('p')]))"
+        with register.transaction():
+            register.save_item("p", Container("s2", "img"))
+            self.assertEqual(self.run_process(code, timeout=5), ["s1"])
+
+class SqliteReadTest(RegisterTestCase):
+    def test_load_sees_one_version(self):
+        register.config_backend("sqlite")
+        register.add("p", [Container("s1", "img")])
+        register.add("q", [Container("s1", "img")])
+        read_page = sqlite_backend._read_page
+        calls = []
+        def write_between(*args):
+            if len(calls) == 0:
+                # Otro proceso cambia las dos paginas a la vez
+                self.run_process(
+                    "with register.transaction():\n"
+                    "    register.save_item('p', Container('s2', 'img'))\n"
+                    "    register.save_item('q', Container('s2', 'img'))"
+                )
+            calls.append(args)
+            return read_page(*args)
+        with mock.patch.object(sqlite_backend, "_read_page", write_between):
+            loaded = register.load()
+        self.assertEqual([len(loaded["p"]), len(loaded["q"])], [1, 1])
+        self.assertEqual(self.names("q"), ["s1", "s2"])
+
+# --------------------------------------------------------------------
+class BackendTest(RegisterTestCase):
+    def test_migration_is_kept_when_empty(self):
+        register.config_backend(None)
+        register.add("p", ["a"])
+        register.migrate("sqlite")
+        self.assertEqual(register.current_backend(), "sqlite")
+        self.assertEqual(register.load("p"), ["a"])
+        register.remove("p")
+        self.assertEqual(register.current_backend(), "sqlite")
+        register.add("q", 1)
+        register.remove()
+        self.assertEqual(register.current_backend(), "sqlite")
+        register.add("q", 2)
+        register.migrate("pickle")
+        self.assertEqual(register.current_backend(), "pickle")
+        self.assertEqual(register.load(), {"q": 2})
+
+    def test_previous_sqlite_register(self):
+        # Migrado a sqlite antes de que se guardase el backend
+        register.config_backend("sqlite")
+        register.add("p", ["a"])
+        register.config_backend(None)
+        self.assertEqual(register.current_backend(), "sqlite")
+        register.remove()
+        self.assertEqual(register.current_backend(), "sqlite")
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import program.machines as machines
+from program.functions import select_bridges
+from dependencies.lxc_classes.container import Container
+
+# ------------------- PRUEBAS DEL REPARTO EN BRIDGES -----------------
+# --------------------------------------------------------------------
+# Comprueba cuantos bridges necesita la plataforma segun el numero de
+# servidores (machines.count_bridges), como se configuran
+# (machines.get_bridges), que la capacidad configurada quepa en la red
+# (machines.config_capacity) y a cuales se conecta cada contenedor
+# (functions.select_bridges)
+# --------------------------------------------------------------------
+def _container(name:str, tag:str, networks:dict={}) -> Container:
+    c = Container(name, "ubuntu:18.04", tag=tag)
+    c.networks = dict(networks)
+    return c
+
+# --------------------------------------------------------------------
+class CountBridgesTest(unittest.TestCase):
+    def test_default_capacity(self):
+        # Los de los servidores mas el de los clientes
+        self.assertEqual(machines.count_bridges(0), 2)
+        self.assertEqual(machines.count_bridges(1), 2)
+        self.assertEqual(machines.count_bridges(100), 2)
+        self.assertEqual(machines.count_bridges(101), 3)
+        self.assertEqual(machines.count_bridges(500), 6)
+
+    def test_custom_capacity(self):
+        capacity = {"max_servers": 20, "servers_per_bridge": 4}
+        with mock.patch.dict(machines.capacity, capacity):
+            self.assertEqual(machines.count_bridges(4), 2)
+            self.assertEqual(machines.count_bridges(5), 3)
+            self.assertEqual(machines.count_bridges(20), 6)
+
+class GetBridgesTest(unittest.TestCase):
+    def test_subnets(self):
+        bgs = machines.get_bridges(4)
+        self.assertEqual([b.name for b in bgs],
+                            ["lxdbr0", "lxdbr1", "lxdbr2", "lxdbr3"])
+        for i, b in enumerate(bgs):
+            self.assertEqual(b.ethernet, f"eth{i}")
+            self.assertEqual(b.ipv4_addr, f"10.0.{i}.1/24")
+            self.assertEqual(b.ipv4_nat, "true")
+
+    def test_network(self):
+        with mock.patch.dict(machines.capacity, {"network": "172.16.0.0/23"}):
+            bgs = machines.get_bridges(2)
+            self.assertEqual([b.ipv4_addr for b in bgs],
+                                    ["172.16.0.1/24", "172.16.1.1/24"])
+            with self.assertRaises(machines.CapacityError):
+                machines.get_bridges(3)
+
+class ConfigCapacityTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(machines.capacity)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def config(self, config:dict):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "capacity.json")
+            with open(path, "w") as file:
+                json.dump(config, file)
+            machines.config_capacity(path)
+
+    def test_missing_file(self):
+        machines.config_capacity("/nonexistent/capacity.json")
+        self.assertEqual(machines.capacity["servers_per_bridge"], 100)
+
+    def test_custom(self):
+        self.config({"max_servers": 40, "servers_per_bridge": 10})
+        self.assertEqual(machines.count_bridges(40), 5)
+        self.assertEqual(machines.capacity["network"], "10.0.0.0/16")
+
+    def test_does_not_fit(self):
+        for config in ({"servers_per_bridge": 1},
+                       {"servers_per_bridge": 245},
+                       {"network": "10.0.0.0/22"},
+                       {"max_servers": 0}, {"bridges": 2}):
+            with self.assertRaises(machines.CapacityError, msg=config):
+                self.config(config)
+        self.assertEqual(machines.capacity["servers_per_bridge"], 100)
+
+# --------------------------------------------------------------------
+class SelectBridgesTest(unittest.TestCase):
+    def setUp(self):
+        self.bgs = {b.name: b for b in machines.get_bridges(3)}
+        self.load = {name: 0 for name in self.bgs}
+        patcher = mock.patch.dict(machines.capacity, {"servers_per_bridge": 2})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def select(self, c:Container) -> list:
+        return [b.name for b in select_bridges(c, self.bgs, self.load)]
+
+    def test_servers_fill_bridges_in_order(self):
+        selected = [self.select(_container(f"s{i}", machines.SERVER))
+                                                    for i in range(5)]
+        # El bridge de los clientes (lxdbr1) se salta
+        self.assertEqual(selected, [["lxdbr0"], ["lxdbr0"], ["lxdbr2"],
+                                                ["lxdbr2"], []])
+        self.assertEqual(self.load, {"lxdbr0": 2, "lxdbr1": 0, "lxdbr2": 2})
+
+    def test_server_already_connected(self):
+        s = _container("s1", machines.SERVER, {"eth0": "10.0.0.11"})
+        self.assertEqual(self.select(s), [])
+        self.assertEqual(self.load["lxdbr0"], 0)
+
+    def test_client(self):
+        cl = _container("cl", machines.CLIENT)
+        self.assertEqual(self.select(cl), ["lxdbr1"])
+        cl.networks = {"eth1": "10.0.1.2"}
+        self.assertEqual(self.select(cl), [])
+        del self.bgs["lxdbr1"]
+        self.assertEqual(self.select(_container("cl2", machines.CLIENT)), [])
+
+    def test_load_balancer(self):
+        lb = _container("lb", machines.LB)
+        self.assertEqual(self.select(lb), ["lxdbr0", "lxdbr2", "lxdbr1"])
+        # Solo los bridges a los que todavia no esta conectado
+        lb.networks = {"eth0": "10.0.0.10", "eth1": "10.0.1.10"}
+        self.assertEqual(self.select(lb), ["lxdbr2"])
+        lb.networks["eth2"] = "10.0.2.10"
+        self.assertEqual(self.select(lb), [])
+
+# --------------------------------------------------------------------
+if __name__ == "__main__":
+    unittest.main()